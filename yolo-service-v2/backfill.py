@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+🗂️ Backfill: reprocessa imagens armazenadas com o detector do serviço
+Lista as imagens de um bucket S3-compatível (MinIO) ou de uma pasta local,
+baixa em paralelo, decodifica num pool de processos, roda a inferência em
+lotes (mesmo código do /detect: detect_objects_batch) e grava os resultados
+em JSONL ou Parquet, com checkpoint para retomar de onde parou.
+
+A ordem de listagem é estável (S3 lista por chave) e o pipeline entrega os
+resultados nessa ordem: o checkpoint guarda a última chave gravada de cada
+prefixo. Numa retomada, linhas gravadas depois do último checkpoint podem
+reaparecer - deduplique por `key` ao consumir.
+
+Uso:
+    python backfill.py --source s3://images --output food.jsonl
+    python backfill.py --source /dados/minio/images --prefixes food-analysis --output food.parquet
+    python backfill.py --source s3://images --output food.jsonl --restart   # depois de trocar os pesos
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, List, Dict, Iterator, Tuple
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+# Pastas com fotos para a detecção (ver MINIO_FOLDERS em scripts/analyze-minio-storage.py)
+DEFAULT_PREFIXES = ('food-analysis', 'medical-exams')
+
+
+class BackfillError(Exception):
+    """Falha que interrompe a execução sem avançar o checkpoint (ex.: inferência do lote)"""
+    pass
+
+
+# ==================== ORIGENS ====================
+
+class DirectorySource:
+    """Pasta local com a mesma estrutura do bucket (<raiz>/<prefixo>/...)"""
+    def __init__(self, root: str):
+        self.root = root
+        self.name = os.path.abspath(root)
+
+    def list(self, prefix: str, start_after: Optional[str] = None) -> Iterator[str]:
+        keys = []
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, prefix)):
+            for filename in filenames:
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    keys.append(os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, '/'))
+        for key in sorted(keys):
+            if start_after is None or key > start_after:
+                yield key
+
+    def read(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), 'rb') as f:
+            return f.read()
+
+
+class S3Source:
+    """Bucket S3-compatível (MinIO) - mesmas variáveis MINIO_* do backend"""
+    def __init__(self, bucket: str, endpoint: str, access_key: str, secret_key: str, secure: bool):
+        try:
+            from minio import Minio
+        except ImportError:
+            raise SystemExit("❌ Origem S3 requer o pacote minio: pip install minio")
+        self.bucket = bucket
+        self.name = f"s3://{bucket}@{endpoint}"
+        self.client = Minio(endpoint, access_key=access_key, secret_key=secret_key, secure=secure)
+
+    def list(self, prefix: str, start_after: Optional[str] = None) -> Iterator[str]:
+        objects = self.client.list_objects(
+            self.bucket, prefix=prefix.rstrip('/') + '/', recursive=True, start_after=start_after
+        )
+        for obj in objects:
+            if not obj.is_dir and obj.object_name.lower().endswith(IMAGE_EXTENSIONS):
+                yield obj.object_name
+
+    def read(self, key: str) -> bytes:
+        response = self.client.get_object(self.bucket, key)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+
+def open_source(source: str):
+    if source.startswith('s3://'):
+        endpoint = os.getenv('MINIO_ENDPOINT', 'localhost')
+        port = os.getenv('MINIO_PORT')
+        if port and ':' not in endpoint:
+            endpoint = f"{endpoint}:{port}"
+        return S3Source(
+            source[len('s3://'):].strip('/') or os.getenv('MINIO_BUCKET', 'images'),
+            endpoint,
+            os.getenv('MINIO_ACCESS_KEY', ''),
+            os.getenv('MINIO_SECRET_KEY', ''),
+            os.getenv('MINIO_USE_SSL', 'false').lower() == 'true'
+        )
+    if not os.path.isdir(source):
+        raise SystemExit(f"❌ Origem não encontrada: {source}")
+    return DirectorySource(source)
+
+
+# ==================== SAÍDA ====================
+
+class JsonlWriter:
+    """Uma linha JSON por imagem (append: retomadas continuam o mesmo arquivo; restart=True recomeça do zero)"""
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self._file = open(path, 'wb' if restart else 'ab')
+
+    def write(self, rows: List[dict]):
+        self._file.write(b''.join(orjson.dumps(row, option=orjson.OPT_SERIALIZE_NUMPY) + b'\n' for row in rows))
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+
+class ParquetWriter:
+    """
+    Parquet não aceita append: cada flush vira um arquivo <saída>/part-<execução>-<n>.parquet.
+    Os objetos detectados vão como JSON na coluna `objects`.
+    """
+    def __init__(self, path: str, restart: bool = False):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("❌ Saída Parquet requer o pacote pyarrow: pip install pyarrow")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.run_id = time.strftime('%Y%m%d%H%M%S')
+        self.parts = 0
+        self._rows: List[dict] = []
+        os.makedirs(path, exist_ok=True)
+        if restart:
+            # Partes de execuções anteriores duplicariam as chaves reprocessadas
+            for name in os.listdir(path):
+                if name.startswith('part-') and name.endswith('.parquet'):
+                    os.remove(os.path.join(path, name))
+
+    def write(self, rows: List[dict]):
+        self._rows.extend(rows)
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows = [{**row, 'objects': orjson.dumps(row['objects']).decode()} for row in self._rows]
+        table = self.pa.Table.from_pylist(rows)
+        self.pq.write_table(table, os.path.join(self.path, f"part-{self.run_id}-{self.parts:05d}.parquet"))
+        self.parts += 1
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+
+def open_writer(output: str, output_format: Optional[str], restart: bool = False):
+    output_format = output_format or ('parquet' if output.endswith('.parquet') else 'jsonl')
+    return ParquetWriter(output, restart) if output_format == 'parquet' else JsonlWriter(output, restart)
+
+
+def output_has_rows(output: str) -> bool:
+    if os.path.isdir(output):
+        return any(name.endswith('.parquet') for name in os.listdir(output))
+    return os.path.exists(output) and os.path.getsize(output) > 0
+
+
+# ==================== CHECKPOINT ====================
+
+class Checkpoint:
+    """
+    Última chave gravada por prefixo + parâmetros da execução (<saída>.checkpoint.json).
+    Só retoma com os mesmos parâmetros (inclusive a versão dos pesos): depois
+    de trocar o modelo, retomar pularia as imagens já processadas pelo antigo.
+    """
+    def __init__(self, path: str, params: dict):
+        self.path = path
+        self.params = params
+        self.last_keys: Dict[str, str] = {}
+        self.processed = 0
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get('params') != params:
+                changed = sorted(
+                    key for key in set(params) | set(saved.get('params', {}))
+                    if params.get(key) != saved.get('params', {}).get(key)
+                )
+                raise BackfillError(
+                    f"checkpoint {path} é de outra execução (mudou: {', '.join(changed)}; "
+                    f"antes {[saved.get('params', {}).get(k) for k in changed]}, agora {[params.get(k) for k in changed]}). "
+                    f"Use --restart para reprocessar tudo nesta saída ou escolha outra --output"
+                )
+            self.last_keys = saved.get('last_keys', {})
+            self.processed = saved.get('processed', 0)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'params': self.params, 'last_keys': self.last_keys, 'processed': self.processed}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# ==================== PIPELINE ====================
+
+def decode_worker(data: bytes, target_size: int):
+    """Roda no pool de processos: (DecodedImage | None, erro)"""
+    from main import decode_image_bytes
+    try:
+        image = decode_image_bytes(data, target_size)
+    except Exception as e:
+        return None, str(e)
+    return image, None if image is not None else 'imagem inválida'
+
+
+def fetch_and_decode(source, key: str, decode_pool: ProcessPoolExecutor, target_size: int) -> tuple:
+    """Roda nas threads de prefetch: download + decode no pool de processos"""
+    try:
+        data = source.read(key)
+    except Exception as e:
+        return None, f'download: {e}', 0
+    image, error = decode_pool.submit(decode_worker, data, target_size).result()
+    return image, error, len(data)
+
+
+class Throughput:
+    """Imagens/s acumulado e da janela recente, logado a cada `interval_s`"""
+    def __init__(self, interval_s: float = 10.0):
+        self.interval_s = interval_s
+        self.start = time.perf_counter()
+        self.images = 0
+        self._window_start = self.start
+        self._window_images = 0
+
+    def add(self, count: int):
+        self.images += count
+        self._window_images += count
+        now = time.perf_counter()
+        if now - self._window_start >= self.interval_s:
+            recent = self._window_images / (now - self._window_start)
+            logger.info(f"⚡ {self.images} imagens | {self.rate():.1f} img/s (últimos {now - self._window_start:.0f}s: {recent:.1f} img/s)")
+            self._window_start = now
+            self._window_images = 0
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return self.images / elapsed if elapsed > 0 else 0.0
+
+
+def run_backfill(source, prefixes: List[str], writer, checkpoint: Checkpoint, task: str = 'detect',
+                 confidence: float = 0.35, max_detections: int = 100, imgsz: int = 640,
+                 batch_size: int = 8, prefetch: int = 32, decode_workers: int = 2,
+                 limit: Optional[int] = None) -> dict:
+    """
+    Pipeline em ordem: listagem → prefetch (threads) → decode (processos) →
+    inferência em lotes → saída + checkpoint a cada lote.
+    """
+    # forkserver: os decoders não herdam o processo com o modelo (pools de threads do torch não sobrevivem ao fork)
+    decode_pool = ProcessPoolExecutor(max_workers=max(1, decode_workers), mp_context=multiprocessing.get_context('forkserver'))
+    fetch_pool = ThreadPoolExecutor(max_workers=max(1, prefetch), thread_name_prefix='prefetch')
+
+    import main
+    # Só o modelo da task (o registro carrega sob demanda; os residentes do serviço não sobem aqui)
+    main.models.require('segment' if task == 'segment' else 'detect')
+    model_name = main.detection_model_name(task)
+    logger.info(f"🗂️ Backfill de {source.name} {prefixes} com {model_name} ({task}, imgsz {imgsz})")
+
+    throughput = Throughput()
+    stats = {'processed': 0, 'errors': 0, 'bytes': 0, 'objects': 0}
+
+    def items() -> Iterator[Tuple[str, str]]:
+        count = 0
+        for prefix in prefixes:
+            for key in source.list(prefix, start_after=checkpoint.last_keys.get(prefix)):
+                if limit is not None and count >= limit:
+                    return
+                count += 1
+                yield prefix, key
+
+    def flush_batch(batch: list):
+        ok = [(index, entry) for index, entry in enumerate(batch) if entry[2] is not None]
+        # Falha do modelo não vira "0 objetos": interrompe antes de gravar o lote e de avançar o checkpoint
+        try:
+            results = main.detect_objects_batch(
+                [entry[2] for _, entry in ok], [confidence] * len(ok), [max_detections] * len(ok), task, imgsz,
+                raise_errors=True
+            ) if ok else []
+        except Exception as e:
+            raise BackfillError(f"inferência falhou no lote {batch[0][1]} … {batch[-1][1]}: {e}") from e
+        detections = {index: result for (index, _), result in zip(ok, results)}
+
+        rows = []
+        for index, (prefix, key, image, error, size) in enumerate(batch):
+            row = {'key': key, 'prefix': prefix, 'model': model_name, 'task': task, 'imgsz': imgsz}
+            if index in detections:
+                objects, inference_time, _ = detections[index]
+                row.update({
+                    'width': image.orig_width, 'height': image.orig_height, 'objects': objects,
+                    'total_objects': len(objects), 'inference_time_ms': round(inference_time, 2), 'error': None
+                })
+                stats['objects'] += len(objects)
+            else:
+                row.update({'width': None, 'height': None, 'objects': [], 'total_objects': 0,
+                            'inference_time_ms': None, 'error': error})
+                stats['errors'] += 1
+            stats['bytes'] += size
+            rows.append(row)
+
+        writer.write(rows)
+        writer.flush()
+        for prefix, key, _, _, _ in batch:
+            checkpoint.last_keys[prefix] = key
+        checkpoint.processed += len(batch)
+        checkpoint.save()
+        stats['processed'] += len(batch)
+        throughput.add(len(batch))
+
+    pending: deque = deque()
+    source_items = items()
+    batch = []
+    try:
+        while True:
+            # Mantém `prefetch` downloads/decodes em andamento, à frente da inferência
+            while len(pending) < prefetch:
+                item = next(source_items, None)
+                if item is None:
+                    break
+                prefix, key = item
+                pending.append((prefix, key, fetch_pool.submit(fetch_and_decode, source, key, decode_pool, imgsz)))
+            if not pending:
+                break
+
+            prefix, key, future = pending.popleft()
+            image, error, size = future.result()
+            if error:
+                logger.warning(f"⚠️ {key}: {error}")
+            batch.append((prefix, key, image, error, size))
+            if len(batch) >= batch_size:
+                flush_batch(batch)
+                batch = []
+        if batch:
+            flush_batch(batch)
+    finally:
+        writer.close()
+        fetch_pool.shutdown(wait=False, cancel_futures=True)
+        decode_pool.shutdown(wait=False, cancel_futures=True)
+
+    elapsed = time.perf_counter() - throughput.start
+    stats.update({
+        'elapsed_s': round(elapsed, 2),
+        'images_per_s': round(throughput.rate(), 2),
+        'total_processed': checkpoint.processed
+    })
+    return stats
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Reprocessa imagens do storage com o detector YOLO')
+    parser.add_argument('--source', default=f"s3://{os.getenv('MINIO_BUCKET', 'images')}",
+                        help='s3://<bucket> (variáveis MINIO_*) ou pasta local com a estrutura do bucket')
+    parser.add_argument('--prefixes', nargs='+', default=list(DEFAULT_PREFIXES), help='Pastas a reprocessar')
+    parser.add_argument('--output', required=True, help='Arquivo .jsonl ou pasta .parquet')
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default=None, help='Padrão: pela extensão da saída')
+    parser.add_argument('--checkpoint', default=None, help='Padrão: <saída>.checkpoint.json')
+    parser.add_argument('--restart', action='store_true', help='Ignora o checkpoint existente')
+    parser.add_argument('--task', choices=['detect', 'food_only', 'segment'], default='detect')
+    parser.add_argument('--confidence', type=float, default=float(os.getenv('YOLO_CONF', '0.35')))
+    parser.add_argument('--max-detections', type=int, default=100)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('BATCH_MAX_SIZE', '8')))
+    parser.add_argument('--prefetch', type=int, default=32, help='Downloads/decodes em andamento')
+    parser.add_argument('--decode-workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--limit', type=int, default=None, help='Máximo de imagens nesta execução')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    source = open_source(args.source)
+    checkpoint_path = args.checkpoint or f"{args.output.rstrip('/')}.checkpoint.json"
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    elif not os.path.exists(checkpoint_path) and output_has_rows(args.output):
+        print(f"❌ {args.output} já tem resultados e não há checkpoint: use --restart para sobrescrever ou outra --output")
+        return 1
+
+    import main as service
+    params = {
+        'source': source.name, 'task': args.task, 'confidence': args.confidence,
+        'max_detections': args.max_detections, 'imgsz': args.imgsz,
+        # nome@sha256: pesos novos no mesmo caminho também invalidam o checkpoint
+        'model': service.weights_version(service.detection_model_name(args.task))
+    }
+    try:
+        checkpoint = Checkpoint(checkpoint_path, params)
+    except BackfillError as e:
+        print(f"❌ {e}")
+        return 1
+    if checkpoint.last_keys:
+        logger.info(f"↩️ Retomando do checkpoint: {checkpoint.last_keys}")
+
+    try:
+        stats = run_backfill(
+            source, args.prefixes, open_writer(args.output, args.format, args.restart), checkpoint,
+            task=args.task, confidence=args.confidence, max_detections=args.max_detections,
+            imgsz=args.imgsz, batch_size=args.batch_size, prefetch=args.prefetch,
+            decode_workers=args.decode_workers, limit=args.limit
+        )
+    except BackfillError as e:
+        logger.error(f"❌ {e}")
+        print(f"❌ Interrompido: {e}. Checkpoint em {checkpoint_path} ({checkpoint.processed} imagens); rode de novo para retomar")
+        return 1
+    print(json.dumps(stats, indent=2))
+    print(f"✅ {stats['processed']} imagens em {stats['elapsed_s']}s ({stats['images_per_s']} img/s), {stats['errors']} erros")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
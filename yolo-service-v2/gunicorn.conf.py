@@ -0,0 +1,36 @@
+"""
+🦾 Gunicorn (prefork) para o serviço YOLO
+Os modelos são carregados uma vez no master; os workers uvicorn são criados
+por fork e compartilham as páginas dos pesos copy-on-write.
+
+Uso: gunicorn -c gunicorn.conf.py main:app
+"""
+
+import gc
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Importa main.py no master (antes do fork)
+preload_app = True
+# Warmup pós-fork roda antes do primeiro heartbeat do worker
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+
+def when_ready(server):
+    """Master: carrega os pesos e congela o heap antes do primeiro fork"""
+    import main
+    main.preload_models()
+    # Objetos congelados saem das varreduras do GC, que senão tocaria (e copiaria) suas páginas nos workers
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"📦 Modelos carregados no master (pid {os.getpid()}), {server.num_workers} workers")
+
+
+def post_fork(server, worker):
+    """Worker: threads intra-op proporcionais aos núcleos; o warmup roda no lifespan"""
+    import main
+    main.init_worker(server.num_workers, worker.age)
@@ -7,14 +7,14 @@ Integração com Sofia IA e Dr. Vital
 GitHub: https://github.com/ultralytics/ultralytics
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from pydantic import BaseModel, Field, ValidationError
+from typing import Optional, List, Dict, Any, Literal, Union, Annotated, Callable, get_origin, get_args
 import cv2
 import numpy as np
-import requests
+import httpx
 from PIL import Image
 import io
 import base64
@@ -22,8 +22,23 @@ import logging
 import time
 import os
 import math
-from contextlib import asynccontextmanager
-from collections import deque
+import asyncio
+import functools
+import hashlib
+import hmac
+import json
+import orjson
+import threading
+import queue
+import random
+import gc
+import bisect
+import itertools
+import types
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextvars import ContextVar
+from contextlib import asynccontextmanager, contextmanager
+from collections import deque, OrderedDict
 
 # Configurar logging
 logging.basicConfig(
@@ -41,14 +56,101 @@ YOLO_CONF = float(os.getenv('YOLO_CONF', '0.35'))
 YOLO_TASK = os.getenv('YOLO_TASK', 'detect')
 # YOLO26-pose = RLE para keypoints mais precisos
 YOLO_POSE_MODEL = os.getenv('YOLO_POSE_MODEL', 'yolo26s-pose.pt')
+# YOLO26-seg = máscaras para task="segment" (carregado só no primeiro uso)
+YOLO_SEG_MODEL = os.getenv('YOLO_SEG_MODEL', 'yolo26s-seg.pt')
+# Backend de inferência: auto, pytorch, onnx ou openvino (artefatos pré-exportados)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'auto').lower()
+# Modelos em INT8 (ex: "detect,pose"): só ativados se aprovados pelo guard de precisão (quantization.py)
+INT8_MODELS = {m.strip() for m in os.getenv('INT8_MODELS', '').lower().split(',') if m.strip()}
+INT8_GUARD_CORPUS = os.getenv('INT8_GUARD_CORPUS', '')
+# Micro-batching: agrupa requisições concorrentes de /detect em um único forward pass
+BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', '10'))
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '8'))
+# Pool de inferência: threads dedicadas + fila limitada (backpressure)
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '16'))
+OVERLOAD_RETRY_AFTER_S = int(os.getenv('OVERLOAD_RETRY_AFTER_S', '1'))
+# Prioridade no pool: pose (realtime) x detecção (bulk); strict = realtime sempre primeiro, weighted = pesos
+SCHEDULER_POLICY = os.getenv('SCHEDULER_POLICY', 'strict').lower()
+SCHEDULER_WEIGHTS = {
+    name.strip(): int(weight)
+    for name, _, weight in (item.partition('=') for item in os.getenv('SCHEDULER_WEIGHTS', 'realtime=4,bulk=1').split(','))
+    if weight.strip()
+}
+# Threads que a classe bulk não pode ocupar (reservadas para frames de pose)
+REALTIME_RESERVED_WORKERS = int(os.getenv('REALTIME_RESERVED_WORKERS', '0'))
+# Prazo padrão de um frame de pose (ms desde a captura/chegada); frames que não cabem são descartados (0 = sem prazo)
+POSE_FRAME_DEADLINE_MS = float(os.getenv('POSE_FRAME_DEADLINE_MS', '1000'))
+# Threads intra-op do torch por processo (0 = auto: núcleos / (workers do gunicorn × INFERENCE_WORKERS))
+TORCH_THREADS = int(os.getenv('TORCH_THREADS', '0'))
+# Auto-tuning no startup (opt-in): varre threads intra-op × inferências concorrentes e persiste por CPU
+AUTOTUNE = os.getenv('AUTOTUNE', 'false').lower() in ('1', 'true', 'yes')
+AUTOTUNE_FILE = os.getenv('AUTOTUNE_FILE', 'autotune.json')
+AUTOTUNE_BATCH = int(os.getenv('AUTOTUNE_BATCH', '4'))
+AUTOTUNE_RUNS = int(os.getenv('AUTOTUNE_RUNS', '5'))
+AUTOTUNE_MAX_S = float(os.getenv('AUTOTUNE_MAX_S', '120'))
+# Download de imagens: cliente HTTP compartilhado (keep-alive) com limites
+FETCH_TIMEOUT_S = float(os.getenv('FETCH_TIMEOUT_S', '15'))
+FETCH_MAX_BYTES = int(os.getenv('FETCH_MAX_BYTES', str(20 * 1024 * 1024)))
+FETCH_MAX_CONNECTIONS = int(os.getenv('FETCH_MAX_CONNECTIONS', '32'))
+FETCH_PER_HOST_LIMIT = int(os.getenv('FETCH_PER_HOST_LIMIT', '8'))
+# Máximo de imagens por chamada em /detect/batch
+BATCH_MAX_IMAGES = int(os.getenv('BATCH_MAX_IMAGES', '32'))
+# Cache de resultados por conteúdo (LRU + TTL em memória, nível opcional em disco)
+RESULT_CACHE_MAX_MB = float(os.getenv('RESULT_CACHE_MAX_MB', '64'))
+RESULT_CACHE_TTL_S = float(os.getenv('RESULT_CACHE_TTL_S', '3600'))
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', '')
+# Cache perceptual (dHash): reenvios recomprimidos a até PHASH_MAX_DISTANCE bits reaproveitam o resultado
+PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', '4'))
+PHASH_CACHE_MAX_ENTRIES = int(os.getenv('PHASH_CACHE_MAX_ENTRIES', '10000'))
+# Decode reduzido: fotos grandes são decodificadas perto do tamanho de entrada do modelo
+DECODE_TARGET_SIZE = int(os.getenv('DECODE_TARGET_SIZE', '640'))
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', str(40_000_000)))
+# Resolução de inferência (imgsz): "auto" escolhe pelo tamanho da imagem, task e meta de latência
+IMGSZ_DEFAULT = os.getenv('IMGSZ_DEFAULT', 'auto').lower()
+IMGSZ_CHOICES = sorted({int(s) for s in os.getenv('IMGSZ_CHOICES', '320,480,640,960,1280').split(',') if s.strip()})
+LATENCY_TARGET_MS = float(os.getenv('LATENCY_TARGET_MS', '300'))
+POSE_LATENCY_TARGET_MS = float(os.getenv('POSE_LATENCY_TARGET_MS', '120'))
+# Corpus de imagens para a curva precisão/latência do /benchmark
+BENCHMARK_CORPUS = os.getenv('BENCHMARK_CORPUS', os.getenv('INT8_GUARD_CORPUS', ''))
+BENCHMARK_MAX_IMAGES = int(os.getenv('BENCHMARK_MAX_IMAGES', '20'))
+# Inferência em tiles (tiling=true): tamanho do tile, sobreposição, máximo de tiles e IoU da supressão entre tiles
+TILE_SIZE = int(os.getenv('TILE_SIZE', '640'))
+TILE_OVERLAP = float(os.getenv('TILE_OVERLAP', '0.2'))
+TILE_MAX = int(os.getenv('TILE_MAX', '16'))
+TILE_MAX_LIMIT = int(os.getenv('TILE_MAX_LIMIT', '64'))
+TILE_NMS_IOU = float(os.getenv('TILE_NMS_IOU', '0.5'))
+# Modelos carregados no startup e mantidos na memória (detect, pose, yoloe, segment); os demais sobem no primeiro uso
+MODELS_RESIDENT = [m.strip() for m in os.getenv('MODELS_RESIDENT', 'detect,pose,yoloe').lower().split(',') if m.strip()]
+# Descarga (LRU) dos modelos não residentes: ociosos há mais de MODEL_IDLE_TTL_S ou acima do orçamento (0 = desligado)
+MODEL_IDLE_TTL_S = float(os.getenv('MODEL_IDLE_TTL_S', '0'))
+MODEL_MEMORY_BUDGET_MB = float(os.getenv('MODEL_MEMORY_BUDGET_MB', '0'))
+# Troca de modelo a quente (/admin/models): exige ADMIN_TOKEN (vazio = endpoints de admin desligados)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+# Versão publicada de cada modelo: os workers do prefork convergem para ela e a troca sobrevive a restarts ('' = só este processo)
+MODEL_SWAP_FILE = os.getenv('MODEL_SWAP_FILE', '')
+MODEL_SWAP_POLL_S = float(os.getenv('MODEL_SWAP_POLL_S', '5'))
+# Shadow: candidatos (ex.: "detect=yolo26n.pt,pose=yolo26n-pose.pt") rodam uma amostra das requisições fora do caminho crítico
+SHADOW_MODELS = {
+    kind.strip(): weights.strip()
+    for kind, _, weights in (item.partition('=') for item in os.getenv('SHADOW_MODELS', '').split(','))
+    if weights.strip()
+}
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', '0.05'))
+SHADOW_MAX_PENDING = int(os.getenv('SHADOW_MAX_PENDING', '16'))
+SHADOW_WINDOW = int(os.getenv('SHADOW_WINDOW', '1000'))
+SHADOW_IOU_THRESHOLD = float(os.getenv('SHADOW_IOU_THRESHOLD', '0.5'))
+# Prioridade (nice) da thread do shadow: o sistema prefere as threads que atendem usuários
+SHADOW_NICE = int(os.getenv('SHADOW_NICE', '10'))
 
-# Modelos globais
-model = None
-model_yoloe = None
-model_pose = None
 
-# Estado das sessões de pose (para contagem contínua)
+# Estado das sessões de pose (para contagem contínua) - local a cada processo
 pose_session_states: Dict[str, Any] = {}
+# Número de chegada dos frames de pose (ordem para a coalescência latest-wins)
+pose_frame_sequence = itertools.count(1)
+
+# Modo de execução: single (uvicorn) ou prefork (gunicorn com pesos carregados no master)
+process_info: Dict[str, Any] = {'mode': 'single', 'workers': 1, 'worker_age': None, 'preloaded': False}
 
 # Classes COCO para alimentos (índices relevantes)
 FOOD_CLASS_IDS = {
@@ -57,6 +159,8 @@ FOOD_CLASS_IDS = {
     49: 'orange', 50: 'broccoli', 51: 'carrot', 52: 'hot dog', 53: 'pizza',
     54: 'donut', 55: 'cake'
 }
+# Lista para o filtro classes= do modelo (task="food_only")
+FOOD_CLASS_ID_LIST = sorted(FOOD_CLASS_IDS)
 
 # Mapeamento para português
 FOOD_TRANSLATIONS = {
@@ -68,6 +172,9 @@ FOOD_TRANSLATIONS = {
     'cake': 'bolo'
 }
 
+# Palavras-chave de prompts que indicam documento (YOLOE)
+DOCUMENT_KEYWORDS = ['documento', 'document', 'tabela', 'table', 'texto', 'text', 'laudo', 'report']
+
 # COCO Pose Keypoints (17 pontos)
 POSE_KEYPOINTS = [
     'nose', 'left_eye', 'right_eye', 'left_ear', 'right_ear',
@@ -99,61 +206,955 @@ EXERCISE_THRESHOLDS = {
 }
 
 
-def load_yolo_model():
-    """Carrega os modelos YOLO26, YOLOE-26 e YOLO26-Pose"""
-    global model, model_yoloe, model_pose
+# ==================== BACKENDS DE INFERÊNCIA ====================
+
+SUPPORTED_BACKENDS = ('pytorch', 'onnx', 'openvino')
+
+# Backend efetivo de cada modelo (reportado em /model/info)
+model_backends: Dict[str, dict] = {}
+
+
+def cpu_info() -> dict:
+    """Fabricante, modelo, núcleos e flags relevantes da CPU (via /proc/cpuinfo)"""
+    info = {'vendor': 'unknown', 'model': 'unknown', 'cores': os.cpu_count() or 1, 'flags': []}
     try:
-        from ultralytics import YOLO
-        
-        # Carregar modelo YOLO26 para alimentos (43% mais rápido, NMS-free)
-        model_path = YOLO_MODEL
-        logger.info(f"🔄 Carregando modelo YOLO26: {model_path}")
-        model = YOLO(model_path)
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                key, value = key.strip(), value.strip()
+                if key == 'vendor_id':
+                    info['vendor'] = value
+                elif key == 'model name':
+                    info['model'] = value
+                elif key == 'flags':
+                    flags = set(value.split())
+                    info['flags'] = sorted(flags & {'avx2', 'avx512f', 'avx512_vnni', 'avx_vnni', 'amx_int8', 'fma'})
+                    break
+    except OSError:
+        pass
+    return info
+
+
+def backend_artifact(weights: str, backend: str) -> str:
+    """Caminho do artefato exportado pelo ultralytics para um backend (yolo26s.pt → yolo26s.onnx)"""
+    stem, _ = os.path.splitext(weights)
+    if backend == 'onnx':
+        return f"{stem}.onnx"
+    if backend == 'openvino':
+        return f"{stem}_openvino_model"
+    return weights
+
+
+def backend_runtime_available(backend: str) -> bool:
+    """Runtime do backend instalado (onnxruntime / openvino)"""
+    module = {'onnx': 'onnxruntime', 'openvino': 'openvino'}.get(backend)
+    if module is None:
+        return True
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def backend_candidates(requested: str) -> List[str]:
+    """Ordem de preferência: backend pedido ou escolha automática pela CPU, sempre terminando em PyTorch"""
+    if requested in ('onnx', 'openvino'):
+        return [requested, 'pytorch']
+    if requested == 'pytorch':
+        return ['pytorch']
+    
+    # auto: OpenVINO rende mais em Intel com AVX2/AVX-512; ONNX Runtime no restante
+    cpu = cpu_info()
+    if cpu['vendor'] == 'GenuineIntel' and {'avx2', 'avx512f'} & set(cpu['flags']):
+        return ['openvino', 'onnx', 'pytorch']
+    return ['onnx', 'openvino', 'pytorch']
+
+
+def load_int8_model(weights: str, task: Optional[str], candidates: List[str]) -> Optional[tuple]:
+    """
+    Tenta o artefato INT8 calibrado de cada backend candidato. Só ativa se o
+    relatório do guard (FP32 vs INT8 no corpus fixo) estiver dentro dos limites;
+    sem relatório válido e com INT8_GUARD_CORPUS configurado, roda o guard agora.
+    """
+    from ultralytics import YOLO
+    from quantization import (
+        int8_artifact, artifact_fingerprint, load_guard_report, guard_verdict, run_accuracy_guard
+    )
+    
+    for backend in candidates:
+        if backend == 'pytorch':
+            continue
+        path = int8_artifact(weights, backend)
+        if not os.path.exists(path) or not backend_runtime_available(backend):
+            continue
         
-        # Warmup YOLO26
-        logger.info("🔥 Fazendo warmup do YOLO26...")
-        dummy_img = np.zeros((640, 640, 3), dtype=np.uint8)
-        model(dummy_img, verbose=False)
-        logger.info(f"✅ YOLO26 {model_path} carregado!")
+        report = load_guard_report(path)
+        approved, reason = guard_verdict(report, path)
+        stale = report is None or report.get('fingerprint') != artifact_fingerprint(path)
+        if stale and INT8_GUARD_CORPUS and os.path.isdir(INT8_GUARD_CORPUS):
+            try:
+                report = run_accuracy_guard(weights, path, INT8_GUARD_CORPUS, task=task)
+                approved, reason = guard_verdict(report, path)
+            except Exception as e:
+                approved, reason = False, f'guard falhou: {e}'
         
-        # Carregar modelo YOLO26-Pose para pose estimation (RLE = mais preciso)
+        if not approved:
+            logger.warning(f"⛔ INT8 recusado para {path}: {reason} - mantendo FP32")
+            continue
         try:
-            pose_path = YOLO_POSE_MODEL
-            logger.info(f"🔄 Carregando modelo YOLO26-Pose: {pose_path}")
-            model_pose = YOLO(pose_path)
-            # Warmup YOLO26-Pose
-            logger.info("🔥 Fazendo warmup do YOLO26-Pose...")
-            model_pose(dummy_img, verbose=False)
-            logger.info(f"✅ YOLO26-Pose {pose_path} carregado!")
+            loaded = YOLO(path, task=task)
         except Exception as e:
-            logger.warning(f"⚠️ YOLO26-Pose erro: {e}")
-            model_pose = None
-        
-        # Carregar modelo YOLOE-26 para vocabulário aberto (Dr. Vital, alimentos brasileiros)
+            logger.warning(f"⚠️ Falha ao carregar {path} (INT8 {backend}): {e} - mantendo FP32")
+            continue
+        logger.info(f"🧮 INT8 aprovado pelo guard: {path} {report['metrics']}")
+        return loaded, {'backend': backend, 'path': path, 'precision': 'int8', 'guard': report['metrics']}
+    
+    logger.warning(f"⚠️ Nenhum artefato INT8 aprovado para {weights} - usando FP32")
+    return None
+
+
+def load_model_with_backend(weights: str, task: Optional[str] = None, requested: str = None,
+                            int8: bool = False) -> tuple:
+    """
+    Carrega o modelo no melhor backend disponível. Usa artefatos ONNX/OpenVINO
+    pré-exportados ao lado dos pesos .pt e cai para PyTorch se faltar o
+    artefato ou o runtime. Com int8=True prefere o artefato INT8 aprovado pelo
+    guard de precisão. Retorna (modelo, info do backend).
+    """
+    from ultralytics import YOLO
+    
+    requested = (requested or INFERENCE_BACKEND).lower()
+    candidates = backend_candidates(requested)
+    if int8:
+        quantized = load_int8_model(weights, task, candidates)
+        if quantized is not None:
+            loaded, info = quantized
+            info['requested'] = requested
+            return loaded, info
+    
+    for backend in candidates:
+        path = backend_artifact(weights, backend)
+        if backend != 'pytorch':
+            if not os.path.exists(path):
+                if requested == backend:
+                    logger.warning(f"⚠️ Artefato {backend} não encontrado: {path} - usando fallback")
+                continue
+            if not backend_runtime_available(backend):
+                logger.warning(f"⚠️ Runtime {backend} não instalado - usando fallback")
+                continue
         try:
-            from ultralytics import YOLO as YOLOE_LOADER
-            yoloe_path = YOLOE_MODEL
-            logger.info(f"🔄 Carregando modelo YOLOE-26: {yoloe_path}")
-            model_yoloe = YOLOE_LOADER(yoloe_path)
-            # Warmup YOLOE-26
-            logger.info("🔥 Fazendo warmup do YOLOE-26...")
-            # YOLOE usa prompts de texto para detecção
-            model_yoloe.predict(dummy_img, verbose=False)
-            logger.info(f"✅ YOLOE-26 {yoloe_path} carregado!")
-        except ImportError:
-            logger.warning("⚠️ YOLOE não disponível - atualize ultralytics: pip install -U ultralytics")
-            model_yoloe = None
+            loaded = YOLO(path, task=task) if backend != 'pytorch' else YOLO(path)
+            return loaded, {'backend': backend, 'path': path, 'requested': requested, 'precision': 'fp32'}
         except Exception as e:
-            logger.warning(f"⚠️ YOLOE-26 erro: {e}")
-            model_yoloe = None
+            if backend == 'pytorch':
+                raise
+            logger.warning(f"⚠️ Falha ao carregar {path} ({backend}): {e} - usando fallback")
+    
+    raise RuntimeError(f"Nenhum backend disponível para {weights}")
+
+
+def supports_batch(loaded_model, backend_info: dict) -> bool:
+    """PyTorch e grafos exportados com batch dinâmico aceitam lotes; grafos estáticos, uma imagem por vez"""
+    if backend_info.get('backend', 'pytorch') == 'pytorch':
+        return True
+    predictor = getattr(loaded_model, 'predictor', None)
+    return bool(getattr(getattr(predictor, 'model', None), 'dynamic', False))
+
+
+def static_imgsz(loaded_model, backend_info: dict) -> Optional[int]:
+    """Tamanho fixo de entrada de grafos exportados sem eixos dinâmicos (None = aceita qualquer imgsz)"""
+    if backend_info.get('backend', 'pytorch') == 'pytorch':
+        return None
+    backend = getattr(getattr(loaded_model, 'predictor', None), 'model', None)
+    if getattr(backend, 'dynamic', False):
+        return None
+    imgsz = getattr(backend, 'imgsz', None)
+    return int(max(imgsz)) if isinstance(imgsz, (list, tuple)) else imgsz
+
+
+def predict_images(loaded_model, images: list, batch: bool = True, **kwargs) -> list:
+    """Executa o modelo em um lote; em grafos estáticos roda imagem a imagem"""
+    if batch or len(images) == 1:
+        return loaded_model(images, **kwargs)
+    results = []
+    for image in images:
+        results.extend(loaded_model(image, **kwargs))
+    return results
+
+
+def model_stage_timing(results) -> dict:
+    """Etapas medidas pelo ultralytics (result.speed, ms por imagem do lote)"""
+    speed = getattr(results[0], 'speed', None) if results else None
+    if not speed:
+        return {}
+    return {f"{stage}_ms": round(speed.get(stage) or 0.0, 2) for stage in ('preprocess', 'inference', 'postprocess')}
+
+
+def warmup_model(loaded_model, backend_info: dict) -> None:
+    """Primeira inferência (cria predictor e sessão do runtime) e capacidades do grafo carregado"""
+    loaded_model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+    backend_info['batch'] = supports_batch(loaded_model, backend_info)
+    backend_info['static_imgsz'] = static_imgsz(loaded_model, backend_info)
+
+
+def fuse_for_sharing(loaded_model, backend_info: dict) -> None:
+    """
+    Funde Conv+BN no master antes do fork. O predictor faria isso no primeiro
+    uso em cada worker, gravando pesos novos e desfazendo o compartilhamento
+    copy-on-write; já fundido, o AutoBackend reaproveita os tensores.
+    """
+    if backend_info.get('backend', 'pytorch') == 'pytorch':
+        loaded_model.fuse()
+
+
+# Pesos e nome de exibição de cada modelo
+MODEL_SPECS = {
+    'detect': (YOLO_MODEL, 'YOLO26'),
+    'pose': (YOLO_POSE_MODEL, 'YOLO26-Pose'),
+    'yoloe': (YOLOE_MODEL, 'YOLOE-26'),
+    'segment': (YOLO_SEG_MODEL, 'YOLO26-Seg'),
+}
+
+
+def load_model_kind(kind: str, warmup: bool = True, on_warmup: Optional[Callable[[], None]] = None,
+                    weights: Optional[str] = None) -> tuple:
+    """
+    Carrega um modelo (detect, pose, yoloe ou segment) a partir dos pesos
+    padrão da task ou de `weights`. Com warmup=False (master do prefork) só
+    carrega os pesos; cada worker faz o warmup após o fork. on_warmup é
+    chamado quando os pesos já estão na memória e o warmup vai começar.
+    Retorna (modelo, info do backend).
+    """
+    default_weights, label = MODEL_SPECS[kind]
+    weights = weights or default_weights
+    if kind == 'yoloe':
+        from ultralytics import YOLO
+        logger.info(f"🔄 Carregando modelo {label}: {weights}")
+        loaded = YOLO(weights)
+        # Prompts variam por requisição e exigem o encoder de texto: só roda em PyTorch
+        backend_info = {
+            'backend': 'pytorch', 'path': weights, 'requested': INFERENCE_BACKEND, 'precision': 'fp32', 'batch': True,
+            'note': 'vocabulário aberto (prompts por requisição) requer PyTorch'
+        }
+        if warmup:
+            logger.info(f"🔥 Fazendo warmup do {label}...")
+            if on_warmup:
+                on_warmup()
+            warmup_model(loaded, backend_info)
+    else:
+        logger.info(f"🔄 Carregando modelo {label}: {weights} (backend: {INFERENCE_BACKEND})")
+        loaded, backend_info = load_model_with_backend(weights, task=kind, int8=kind in INT8_MODELS)
+        if warmup:
+            logger.info(f"🔥 Fazendo warmup do {label}...")
+            if on_warmup:
+                on_warmup()
+            warmup_model(loaded, backend_info)
+        else:
+            fuse_for_sharing(loaded, backend_info)
+    logger.info(f"✅ {label} {backend_info['path']} carregado! (backend: {backend_info['backend']}, {backend_info['precision']})")
+    return loaded, backend_info
+
+
+# ==================== REGISTRO DE MODELOS (SOB DEMANDA) ====================
+
+class ModelUnavailableError(Exception):
+    """Modelo desabilitado ou que falhou ao carregar"""
+    pass
+
+
+class ModelLoadingError(ModelUnavailableError):
+    """Modelo ainda subindo (loading/warming) - o cliente deve tentar novamente em instantes"""
+    pass
+
+
+def model_memory_bytes(loaded_model, backend_info: dict) -> int:
+    """Tamanho dos pesos: tensores do PyTorch ou arquivos do artefato exportado"""
+    module = getattr(loaded_model, 'model', None)
+    if backend_info.get('backend', 'pytorch') == 'pytorch' and hasattr(module, 'parameters'):
+        return sum(t.numel() * t.element_size() for t in itertools.chain(module.parameters(), module.buffers()))
+    path = backend_info.get('path', '')
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+# SHA-256 dos pesos por (caminho, tamanho, mtime), como em quantization.artifact_fingerprint:
+# recargas (TTL ocioso, trocas em cada worker) não releem o arquivo inteiro; herdado pelos workers do prefork
+_weights_digests: Dict[tuple, str] = {}
+
+
+def weights_version(path: str) -> str:
+    """Versão dos pesos carregados: nome + início do SHA-256 do arquivo (mtime em diretórios exportados)"""
+    name = os.path.basename(os.path.normpath(path))
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        fingerprint = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = _weights_digests.get(fingerprint)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(chunk)
+            digest = _weights_digests[fingerprint] = sha.hexdigest()[:12]
+        return f"{name}@{digest}"
+    if os.path.isdir(path):
+        return f"{name}@{int(os.path.getmtime(path))}"
+    return name
+
+
+def release_memory() -> None:
+    """Coleta o modelo descarregado e devolve ao sistema as páginas livres do malloc"""
+    gc.collect()
+    try:
+        import ctypes
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class ModelRegistry:
+    """
+    Modelos carregados sob demanda. Os residentes sobem no startup e nunca
+    saem da memória; os demais carregam no primeiro uso e são descarregados
+    (LRU) quando ficam ociosos além do TTL ou quando a memória estimada dos
+    modelos carregados passa do orçamento. Modelos diferentes carregam em
+    paralelo; a diferença de RSS em volta de uma carga só é atribuída ao
+    modelo quando ela não se sobrepôs a outra e não foi a primeira (que inclui
+    a inicialização do runtime) - senão vale o tamanho dos pesos.
+    
+    Estado de cada modelo (readiness): unloaded, loading, warming, ready, failed.
+    
+    Troca a quente (swap): os pesos novos carregam e aquecem ao lado do
+    modelo ativo e a referência é trocada sob o lock; requisições em
+    andamento seguram a própria referência e terminam no modelo antigo, que
+    fica na memória como versão anterior para o rollback instantâneo (é o
+    primeiro a sair se o orçamento de memória apertar).
+    """
+    
+    STATES = ('unloaded', 'loading', 'warming', 'ready', 'failed')
+    
+    def __init__(self, specs: dict, resident: List[str], idle_ttl_s: float = 0, budget_bytes: int = 0):
+        self.kinds = tuple(specs)
+        self.resident = [kind for kind in resident if kind in specs]
+        for kind in set(resident) - set(specs):
+            logger.warning(f"⚠️ Modelo residente desconhecido ignorado: {kind} (opções: {', '.join(specs)})")
+        self.idle_ttl_s = idle_ttl_s
+        self.budget_bytes = budget_bytes
+        self._models: Dict[str, Any] = {}
+        self._last_used: Dict[str, float] = {}
+        # Pesos ativos de cada modelo (revision cresce a cada troca publicada) e versão anterior para o rollback
+        self.active = {
+            kind: {'weights': weights, 'label': None, 'version': None, 'revision': 0, 'loaded_at': None}
+            for kind, (weights, _) in specs.items()
+        }
+        self.previous: Dict[str, dict] = {}
+        self.swaps: Dict[str, dict] = {}
+        self.swap_counts: Dict[tuple, int] = {}
+        # Estimativa mantida após a descarga: abre espaço antes de recarregar
+        self.memory_bytes: Dict[str, int] = {}
+        self.errors: Dict[str, str] = {}
+        self.loads = {kind: 0 for kind in self.kinds}
+        self.load_seconds = {kind: 0.0 for kind in self.kinds}
+        self.unloads: Dict[tuple, int] = {}
+        self.states = {kind: 'unloaded' for kind in self.kinds}
+        self.state_since = {kind: time.monotonic() for kind in self.kinds}
+        self._runtime_loaded = False
+        self._loading: set = set()
+        self._load_starts = 0
+        self._lock = threading.Lock()
+        self._load_locks = {kind: threading.Lock() for kind in self.kinds}
+        self._swap_locks = {kind: threading.Lock() for kind in self.kinds}
+        # Hash dos pesos já no registro: a primeira requisição não paga a leitura do arquivo
+        for kind in self.kinds:
+            weights_version(self.active[kind]['weights'])
+    
+    def weights_of(self, kind: str) -> str:
+        return self.active[kind]['weights']
+    
+    def version_of(self, kind: str) -> str:
+        """
+        Versão ativa (rótulo da troca ou nome@sha256). Antes da carga usa o
+        hash do arquivo de pesos (cacheado por caminho, tamanho e mtime): a
+        chave do cache de resultados nunca fica só com o caminho, que pode
+        receber pesos novos entre restarts.
+        """
+        active = self.active[kind]
+        return active['label'] or active['version'] or weights_version(active['weights'])
+    
+    def available(self, kind: str) -> bool:
+        """Modelo conhecido e sem falha de carga (pode ainda não estar na memória)"""
+        return kind in self.kinds and kind not in self.errors
+    
+    def loaded(self, kind: str) -> bool:
+        return kind in self._models
+    
+    def peek(self, kind: str):
+        """Modelo já carregado (None se não estiver), sem carregar nem contar como uso"""
+        return self._models.get(kind)
+    
+    def items(self) -> List[tuple]:
+        with self._lock:
+            return list(self._models.items())
+    
+    def get(self, kind: str, warmup: bool = True):
+        """Modelo pronto para uso; carrega no primeiro pedido (bloqueia a thread chamadora). None se indisponível"""
+        with self._lock:
+            loaded = self._models.get(kind)
+            if loaded is not None:
+                self._last_used[kind] = time.monotonic()
+                return loaded
+        if not self.available(kind):
+            return None
+        with self._load_locks[kind]:
+            loaded = self._models.get(kind)
+            if loaded is not None:
+                self._last_used[kind] = time.monotonic()
+                return loaded
+            return self._load(kind, warmup)
+    
+    def require(self, kind: str):
+        """Como get(), mas levanta ModelUnavailableError (503) se o modelo não puder ser usado"""
+        loaded = self.get(kind)
+        if loaded is None:
+            raise ModelUnavailableError(f"Modelo {kind} indisponível: {self.errors.get(kind, 'não carregado')}")
+        return loaded
+    
+    def ensure_ready(self, kind: str) -> None:
+        """
+        Checagem sem bloqueio antes de aceitar uma requisição: modelo subindo
+        responde 503 + Retry-After em vez de ocupar uma thread de inferência
+        esperando; não residentes ainda não carregados sobem no primeiro uso.
+        """
+        state = self.states.get(kind)
+        if state in ('loading', 'warming'):
+            raise ModelLoadingError(f"Modelo {kind} ainda não está pronto ({state})")
+        if not self.available(kind):
+            raise ModelUnavailableError(f"Modelo {kind} indisponível: {self.errors.get(kind, 'desconhecido')}")
+    
+    def mark(self, kinds: List[str], state: str) -> None:
+        now = time.monotonic()
+        for kind in kinds:
+            self.states[kind] = state
+            self.state_since[kind] = now
+    
+    def load_all(self, kinds: List[str], warmup: bool = True) -> None:
+        """Carrega os modelos em paralelo (uma thread por modelo) e espera todos"""
+        kinds = [kind for kind in kinds if not self.loaded(kind)]
+        if not kinds:
+            return
+        self.mark(kinds, 'loading')
+        with ThreadPoolExecutor(max_workers=len(kinds), thread_name_prefix='model-load') as pool:
+            list(pool.map(functools.partial(self.get, warmup=warmup), kinds))
+    
+    def warmup_all(self) -> None:
+        """Warmup em paralelo dos modelos já na memória (worker do prefork, herdados do master)"""
+        loaded = self.items()
+        self.mark([kind for kind, _ in loaded], 'warming')
         
-        return model
+        def warm(item):
+            kind, loaded_model = item
+            logger.info(f"🔥 Warmup pós-fork ({kind})...")
+            try:
+                warmup_model(loaded_model, model_backends[kind])
+                self.mark([kind], 'ready')
+            except Exception as e:
+                logger.warning(f"⚠️ Warmup de {kind} falhou: {e}")
+                self.errors[kind] = str(e)
+                self.unload(kind, 'failed')
+                self.mark([kind], 'failed')
         
-    except Exception as e:
-        logger.error(f"❌ Erro ao carregar modelos: {e}")
+        with ThreadPoolExecutor(max_workers=max(1, len(loaded)), thread_name_prefix='model-warmup') as pool:
+            list(pool.map(warm, loaded))
+    
+    def _load(self, kind: str, warmup: bool):
+        self.make_room(self.memory_bytes.get(kind, 0), keep=kind)
+        with self._lock:
+            overlapped = bool(self._loading)
+            self._loading.add(kind)
+            self._load_starts += 1
+            starts = self._load_starts
+        self.mark([kind], 'loading')
+        rss_before = process_rss_bytes() or 0
+        start = time.perf_counter()
+        try:
+            loaded, backend_info = load_model_kind(
+                kind, warmup=warmup, on_warmup=lambda: self.mark([kind], 'warming'), weights=self.weights_of(kind)
+            )
+            version = weights_version(backend_info['path'])
+        except Exception as e:
+            logger.warning(f"⚠️ {MODEL_SPECS[kind][1]} erro: {e}")
+            with self._lock:
+                self._loading.discard(kind)
+            self.errors[kind] = str(e)
+            self.mark([kind], 'failed')
+            return None
+        elapsed = time.perf_counter() - start
+        rss_delta = (process_rss_bytes() or 0) - rss_before
+        size = model_memory_bytes(loaded, backend_info)
+        with self._lock:
+            self._loading.discard(kind)
+            # Outra carga começou durante esta: o delta de RSS é das duas
+            overlapped = overlapped or self._load_starts != starts
+        if self._runtime_loaded and not overlapped:
+            size = max(size, rss_delta)
+        self._runtime_loaded = True
+        model_backends[kind] = backend_info
+        self.mark([kind], 'ready')
+        with self._lock:
+            self._models[kind] = loaded
+            self._last_used[kind] = time.monotonic()
+            self.memory_bytes[kind] = size
+            self.loads[kind] += 1
+            self.load_seconds[kind] += elapsed
+            self.active[kind].update(version=version, loaded_at=time.time())
+        logger.info(
+            f"📥 Modelo {kind} na memória em {elapsed:.1f}s (~{size / 1e6:.0f}MB; "
+            f"total {self.loaded_bytes() / 1e6:.0f}MB)"
+        )
+        self.make_room(keep=kind)
+        return loaded
+    
+    def swap(self, kind: str, weights: str, label: Optional[str] = None, revision: Optional[int] = None) -> dict:
+        """Carrega e aquece `weights` sem tirar o modelo ativo do ar e troca a referência de uma vez"""
+        with self._swap_locks[kind]:
+            job = {
+                'action': 'swap', 'weights': weights, 'label': label, 'state': 'loading',
+                'revision': revision, 'started_at': time.time()
+            }
+            self.swaps[kind] = job
+            start = time.perf_counter()
+            try:
+                loaded, backend_info = load_model_kind(
+                    kind, on_warmup=lambda: job.update(state='warming'), weights=weights
+                )
+                version = weights_version(backend_info['path'])
+            except Exception as e:
+                logger.error(f"❌ Troca de {kind} para {weights} falhou: {e} - mantendo {self.version_of(kind)}")
+                job.update(state='failed', error=str(e), finished_at=time.time())
+                self._count_swap(kind, 'failed')
+                return job
+            current = self.peek(kind)
+            names_changed = current is not None and getattr(current, 'names', None) != getattr(loaded, 'names', None)
+            if names_changed:
+                logger.warning(f"⚠️ {kind}: as classes dos pesos novos diferem das atuais")
+            previous_version = self._activate(kind, {
+                'model': loaded, 'backend': backend_info, 'memory_bytes': model_memory_bytes(loaded, backend_info),
+                'weights': weights, 'label': label, 'version': version
+            }, revision)
+            job.update(
+                state='done', version=self.version_of(kind), previous_version=previous_version,
+                names_changed=names_changed, revision=self.active[kind]['revision'],
+                seconds=round(time.perf_counter() - start, 2), finished_at=time.time()
+            )
+            logger.info(f"🔁 {kind}: {previous_version} → {job['version']} ({job['seconds']}s, sem downtime)")
+            self._count_swap(kind, 'swap')
+        self.make_room(keep=kind)
+        return job
+    
+    def rollback(self, kind: str, revision: Optional[int] = None) -> dict:
+        """Volta para a versão anterior: troca instantânea se ela ainda estiver na memória, senão recarrega os pesos"""
+        with self._swap_locks[kind]:
+            previous = self.previous.get(kind)
+            if previous is None:
+                raise ValueError(f"Modelo {kind} não tem versão anterior")
+            if previous['model'] is not None:
+                started_at = time.time()
+                replaced = self._activate(kind, previous, revision)
+                job = {
+                    'action': 'rollback', 'weights': previous['weights'], 'label': previous['label'], 'state': 'done',
+                    'version': self.version_of(kind), 'previous_version': replaced,
+                    'revision': self.active[kind]['revision'], 'started_at': started_at, 'finished_at': time.time()
+                }
+                self.swaps[kind] = job
+                self._count_swap(kind, 'rollback')
+                logger.info(f"⏪ {kind}: {replaced} → {job['version']} (versão anterior na memória)")
+                return job
+        job = self.swap(kind, previous['weights'], previous['label'], revision)
+        job['action'] = 'rollback'
+        return job
+    
+    def _activate(self, kind: str, entry: dict, revision: Optional[int]) -> str:
+        """Troca atômica do modelo ativo; o atual vira a versão anterior. Retorna a versão substituída"""
+        with self._lock:
+            current = self._models.get(kind)
+            replaced = self.version_of(kind)
+            active = self.active[kind]
+            self.previous[kind] = {
+                'model': current, 'backend': model_backends.get(kind),
+                'memory_bytes': self.memory_bytes.get(kind, 0) if current is not None else 0,
+                'weights': active['weights'], 'label': active['label'], 'version': active['version']
+            }
+            self._models[kind] = entry['model']
+            model_backends[kind] = entry['backend']
+            self.memory_bytes[kind] = entry['memory_bytes']
+            self._last_used[kind] = time.monotonic()
+            self.errors.pop(kind, None)
+            self.active[kind] = {
+                'weights': entry['weights'], 'label': entry['label'], 'version': entry['version'],
+                'revision': active['revision'] + 1 if revision is None else revision, 'loaded_at': time.time()
+            }
+        self.mark([kind], 'ready')
+        return replaced
+    
+    def _count_swap(self, kind: str, result: str) -> None:
+        with self._lock:
+            self.swap_counts[(kind, result)] = self.swap_counts.get((kind, result), 0) + 1
+    
+    def adopt_revision(self, kind: str, revision: int) -> None:
+        """Revisão atribuída ao publicar a troca já feita neste processo"""
+        with self._lock:
+            self.active[kind]['revision'] = max(self.active[kind]['revision'], revision)
+        job = self.swaps.get(kind)
+        if job is not None and job.get('state') == 'done':
+            job['revision'] = self.active[kind]['revision']
+    
+    def swap_in_progress(self, kind: str) -> bool:
+        return self.swaps.get(kind, {}).get('state') in ('loading', 'warming')
+    
+    def apply_published(self, published: dict) -> List[dict]:
+        """
+        Converge para as versões publicadas (MODEL_SWAP_FILE) por outro worker
+        ou antes de um restart. Modelos fora da memória só adotam os pesos
+        (carregam no primeiro uso); revisões já tentadas não são repetidas.
+        """
+        jobs = []
+        for kind, entry in published.items():
+            revision = entry.get('revision', 0)
+            if kind not in self.active or revision <= self.active[kind]['revision']:
+                continue
+            if self.swaps.get(kind, {}).get('revision') == revision:
+                continue
+            if not self.loaded(kind):
+                with self._lock:
+                    # Pesos anteriores ficam como versão anterior: se os adotados falharem, o rollback volta neles
+                    active = self.active[kind]
+                    if (active['weights'], active['label']) != (entry['weights'], entry.get('label')):
+                        self.previous[kind] = {
+                            'model': None, 'backend': None, 'memory_bytes': 0, 'weights': active['weights'],
+                            'label': active['label'], 'version': active['version']
+                        }
+                    self.active[kind] = {
+                        'weights': entry['weights'], 'label': entry.get('label'), 'version': None,
+                        'revision': revision, 'loaded_at': None
+                    }
+                self.errors.pop(kind, None)
+                logger.info(f"📌 {kind}: adotando {entry['weights']} (revisão {revision})")
+                continue
+            previous = self.previous.get(kind)
+            if (entry.get('action') == 'rollback' and previous is not None
+                    and (previous['weights'], previous['label']) == (entry['weights'], entry.get('label'))):
+                jobs.append(self.rollback(kind, revision))
+            else:
+                jobs.append(self.swap(kind, entry['weights'], entry.get('label'), revision))
+        return jobs
+    
+    def release_previous(self) -> bool:
+        """Libera da memória as versões anteriores (o rollback passa a recarregar os pesos)"""
+        with self._lock:
+            held = [entry for entry in self.previous.values() if entry['model'] is not None]
+            for entry in held:
+                entry.update(model=None, backend=None, memory_bytes=0)
+        if held:
+            release_memory()
+        return bool(held)
+    
+    def versions(self) -> dict:
+        """Versão ativa, anterior e última troca de cada modelo (/model/info e /admin/models)"""
+        report = {}
+        for kind in self.kinds:
+            previous = self.previous.get(kind)
+            report[kind] = {
+                'active': {**self.active[kind], 'version': self.version_of(kind)},
+                'loaded': self.loaded(kind),
+                'previous': {
+                    'weights': previous['weights'],
+                    'version': previous['label'] or previous['version'] or previous['weights'],
+                    'in_memory': previous['model'] is not None
+                } if previous else None,
+                'last_swap': self.swaps.get(kind)
+            }
+        return report
+    
+    def unload(self, kind: str, reason: str) -> bool:
+        """Descarrega o modelo; inferências em andamento mantêm a própria referência até terminar"""
+        with self._lock:
+            if self._models.pop(kind, None) is None:
+                return False
+            if kind in self.previous:
+                self.previous[kind].update(model=None, backend=None, memory_bytes=0)
+            self._last_used.pop(kind, None)
+            self.unloads[(kind, reason)] = self.unloads.get((kind, reason), 0) + 1
+        model_backends.pop(kind, None)
+        self.mark([kind], 'unloaded')
+        release_memory()
+        logger.info(f"📤 Modelo {kind} descarregado ({reason}); total {self.loaded_bytes() / 1e6:.0f}MB")
+        return True
+    
+    def loaded_bytes(self) -> int:
+        held = sum(entry['memory_bytes'] for entry in list(self.previous.values()) if entry['model'] is not None)
+        return held + sum(self.memory_bytes.get(kind, 0) for kind in list(self._models))
+    
+    def make_room(self, incoming: int = 0, keep: Optional[str] = None) -> None:
+        """Descarrega modelos não residentes, do menos recente ao mais recente, até caber no orçamento"""
+        if not self.budget_bytes:
+            return
+        while self.loaded_bytes() + incoming > self.budget_bytes:
+            if self.release_previous():
+                continue
+            with self._lock:
+                candidates = [k for k in self._models if k not in self.resident and k != keep]
+                victim = min(candidates, key=lambda k: self._last_used[k]) if candidates else None
+            if victim is None:
+                logger.warning(
+                    f"⚠️ Orçamento de memória ({self.budget_bytes / 1e6:.0f}MB) excedido só com modelos "
+                    f"residentes ou em uso ({(self.loaded_bytes() + incoming) / 1e6:.0f}MB)"
+                )
+                return
+            self.unload(victim, 'memory')
+    
+    def evict_idle(self) -> List[str]:
+        """Descarrega os modelos não residentes sem uso há mais de idle_ttl_s"""
+        if not self.idle_ttl_s:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                kind for kind in self._models
+                if kind not in self.resident and now - self._last_used[kind] > self.idle_ttl_s
+            ]
+        return [kind for kind in idle if self.unload(kind, 'idle')]
+    
+    async def run_idle_sweeper(self) -> None:
+        """Tarefa do lifespan: verifica a ociosidade periodicamente (descarga fora do event loop)"""
+        interval = min(60.0, max(1.0, self.idle_ttl_s / 4))
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.evict_idle)
+    
+    def readiness(self) -> dict:
+        """Estado de cada modelo (/ready); o processo está pronto quando todos os residentes estão em ready"""
+        now = time.monotonic()
+        return {
+            'ready': all(self.states[kind] == 'ready' for kind in self.resident),
+            'models': {
+                kind: {
+                    'state': self.states[kind],
+                    'resident': kind in self.resident,
+                    'since_s': round(now - self.state_since[kind], 1),
+                    'error': self.errors.get(kind)
+                }
+                for kind in self.kinds
+            }
+        }
+    
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'resident': self.resident,
+                'idle_ttl_s': self.idle_ttl_s,
+                'memory_budget_mb': round(self.budget_bytes / 1e6, 1) if self.budget_bytes else None,
+                'loaded_mb': round(self.loaded_bytes() / 1e6, 1),
+                'models': {
+                    kind: {
+                        'weights': self.active[kind]['weights'],
+                        'version': self.version_of(kind),
+                        'loaded': kind in self._models,
+                        'state': self.states[kind],
+                        'resident': kind in self.resident,
+                        'memory_mb': round(self.memory_bytes[kind] / 1e6, 1) if kind in self.memory_bytes else None,
+                        'idle_s': round(now - self._last_used[kind], 1) if kind in self._last_used else None,
+                        'loads': self.loads[kind],
+                        'load_seconds': round(self.load_seconds[kind], 2),
+                        'unloads': {r: n for (k, r), n in self.unloads.items() if k == kind},
+                        'error': self.errors.get(kind)
+                    }
+                    for kind in self.kinds
+                }
+            }
+
+
+models = ModelRegistry(
+    MODEL_SPECS,
+    resident=MODELS_RESIDENT,
+    idle_ttl_s=MODEL_IDLE_TTL_S,
+    budget_bytes=int(MODEL_MEMORY_BUDGET_MB * 1e6)
+)
+
+
+def load_yolo_model(warmup: bool = True):
+    """
+    Carrega os modelos residentes (MODELS_RESIDENT); os demais sobem no
+    primeiro uso. Os residentes carregam em paralelo, já com as versões
+    publicadas por trocas a quente anteriores (MODEL_SWAP_FILE). Com
+    warmup=False (master do prefork) só carrega os pesos; cada worker faz o
+    warmup após o fork.
+    """
+    models.apply_published(read_swap_state())
+    models.load_all(models.resident, warmup=warmup)
+    if not models.resident:
+        logger.info("💤 Nenhum modelo residente: todos carregam no primeiro uso")
+    return models.peek('detect')
+
+
+def detection_model_name(task: str) -> str:
+    """Pesos ativos de cada task de /detect"""
+    return models.weights_of('segment' if task == "segment" else 'detect')
+
+
+# ==================== TROCA DE MODELO A QUENTE (HOT-SWAP) ====================
+
+def read_swap_state() -> dict:
+    """Versões publicadas em MODEL_SWAP_FILE ({} se desligado ou ausente)"""
+    if not MODEL_SWAP_FILE:
+        return {}
+    try:
+        with open(MODEL_SWAP_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ MODEL_SWAP_FILE ilegível ({e}) - mantendo as versões atuais")
+        return {}
+
+
+def publish_swap(kind: str, action: str, weights: str, label: Optional[str]) -> int:
+    """
+    Publica a troca (ou rollback) já concluída neste processo para os demais
+    workers e para o próximo startup e retorna a revisão. Sem MODEL_SWAP_FILE
+    vale só para este processo.
+    """
+    if not MODEL_SWAP_FILE:
+        return models.active[kind]['revision']
+    import fcntl
+    directory = os.path.dirname(os.path.abspath(MODEL_SWAP_FILE))
+    os.makedirs(directory, exist_ok=True)
+    with open(f"{MODEL_SWAP_FILE}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = read_swap_state()
+        revision = max(state.get(kind, {}).get('revision', 0) + 1, models.active[kind]['revision'])
+        state[kind] = {
+            'action': action, 'weights': weights, 'label': label, 'revision': revision,
+            'published_at': time.time(), 'published_by': os.getpid()
+        }
+        tmp_path = f"{MODEL_SWAP_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, MODEL_SWAP_FILE)
+    # A revisão publicada é a deste processo: o watcher não reaplica a própria troca
+    models.adopt_revision(kind, revision)
+    return revision
+
+
+def swap_and_publish(kind: str, action: str, weights: Optional[str] = None, label: Optional[str] = None) -> dict:
+    """
+    Troca (ou rollback) neste processo e, só se os pesos carregaram e
+    aqueceram, publica. Uma troca que falhou não chega aos outros workers nem
+    ao próximo startup, que continuam nos pesos anteriores.
+    """
+    try:
+        job = models.rollback(kind) if action == 'rollback' else models.swap(kind, weights, label)
+    except ValueError as e:
+        logger.warning(f"⚠️ {e}")
+        return {'action': action, 'state': 'failed', 'error': str(e)}
+    if job['state'] == 'done':
+        try:
+            job['revision'] = publish_swap(kind, action, models.weights_of(kind), models.active[kind]['label'])
+        except OSError as e:
+            logger.error(f"❌ Troca de {kind} feita só neste processo: falha ao publicar em MODEL_SWAP_FILE ({e})")
+            job['publish_error'] = str(e)
+    return job
+
+
+async def run_swap_watcher() -> None:
+    """Tarefa do lifespan (com MODEL_SWAP_FILE): aplica neste worker as trocas publicadas pelos outros"""
+    while True:
+        published = read_swap_state()
+        if published:
+            await asyncio.to_thread(models.apply_published, published)
+        await asyncio.sleep(MODEL_SWAP_POLL_S)
+
+
+def start_swap(fn, *args) -> None:
+    """Troca em thread própria: carga e warmup não ocupam o event loop nem o pool de inferência"""
+    threading.Thread(target=fn, args=args, name=f"model-swap-{args[0]}", daemon=True).start()
+
+
+# ==================== PREFORK (MULTIPROCESSO) ====================
+
+def available_cores() -> int:
+    """Núcleos que o processo pode usar (respeita cpuset/affinity do container)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def set_inference_threads(threads: int) -> None:
+    """Threads intra-op do torch e do OpenCV neste processo"""
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def torch_threads() -> Optional[int]:
+    try:
+        import torch
+        return torch.get_num_threads()
+    except ImportError:
         return None
 
 
+def preload_models() -> None:
+    """
+    Master do gunicorn (gunicorn.conf.py): carrega os pesos uma vez, antes do
+    fork, para que as páginas fiquem compartilhadas copy-on-write entre os
+    workers. Roda com 1 thread e sem inferência: pools OpenMP/ONNX Runtime
+    criados antes do fork não sobrevivem nos filhos.
+    """
+    set_inference_threads(1)
+    load_yolo_model(warmup=False)
+    process_info['preloaded'] = bool(models.items())
+
+
+def init_worker(workers: int, age: int) -> None:
+    """Worker recém-criado pelo fork: divide os núcleos entre workers e threads do pool de inferência"""
+    threads = TORCH_THREADS or max(1, available_cores() // (max(1, workers) * INFERENCE_WORKERS))
+    set_inference_threads(threads)
+    process_info.update({'mode': 'prefork', 'workers': workers, 'worker_age': age})
+    logger.info(f"👷 Worker {os.getpid()} (#{age}): {threads} threads intra-op, {INFERENCE_WORKERS} threads de inferência")
+
+
+def warmup_preloaded_models() -> None:
+    """Warmup no worker dos modelos herdados do master (predictor, sessões ONNX/OpenVINO, capacidades)"""
+    models.warmup_all()
+
+
+def process_stats() -> dict:
+    """Configuração de processos/threads reportada em /health"""
+    prefork = process_info['mode'] == 'prefork'
+    return {
+        'mode': process_info['mode'],
+        'workers': process_info['workers'],
+        'pid': os.getpid(),
+        'master_pid': os.getppid() if prefork else None,
+        'worker_age': process_info['worker_age'],
+        'cpu_cores': available_cores(),
+        'torch_threads': torch_threads(),
+        'inference_threads': inference_pool.max_workers,
+        'autotune': process_info.get('autotune'),
+        'weights_shared': prefork and process_info['preloaded'],
+        # Modelos carregados sob demanda depois do fork ficam na memória de cada worker
+        'models_loaded': [kind for kind, _ in models.items()],
+        # Sessões de pose ficam na memória do worker que as criou
+        'pose_sessions': 'per-worker' if process_info['workers'] > 1 else 'process'
+    }
+
+
 class PoseSessionState:
     """Estado de uma sessão de treino com câmera"""
     def __init__(self, exercise_type: str, calibration: dict = None):
@@ -169,6 +1170,20 @@ class PoseSessionState:
         self.valley_angle = 180  # Ângulo mínimo atingido
         self.peak_angle = 0      # Ângulo máximo atingido
         self.phase_start_time = time.time()
+        # Coalescência latest-wins: só o frame mais novo pendente chega ao contador
+        self.latest_frame = 0
+        self.last_applied_frame = 0
+        self.latest_captured_at: Optional[float] = None
+        self.dropped_frames = {'deadline': 0, 'superseded': 0}
+    
+    def begin_frame(self, seq: int, captured_at: Optional[float]) -> bool:
+        """Registra um frame recebido como o mais novo; False se foi capturado antes do último"""
+        if captured_at is not None and self.latest_captured_at is not None and captured_at < self.latest_captured_at:
+            return False
+        self.latest_frame = seq
+        if captured_at is not None:
+            self.latest_captured_at = captured_at
+        return True
         
     def get_smoothed_angle(self, new_angle: float) -> float:
         """Exponential moving average para suavizar ângulos"""
@@ -206,63 +1221,61 @@ def calculate_angle(p1: tuple, p2: tuple, p3: tuple) -> float:
     return angle
 
 
-def detect_pose(image: Image.Image) -> dict:
-    """Detecta pose na imagem usando YOLO-Pose"""
-    global model_pose
-    
+def detect_pose(image: "DecodedImage", imgsz: Optional[int] = None, loaded_model=None) -> dict:
+    """Detecta pose na imagem usando YOLO-Pose (loaded_model: candidato do shadow no lugar do modelo ativo)"""
+    model_pose = models.get('pose') if loaded_model is None else loaded_model
     if model_pose is None:
         return {'error': 'Modelo YOLO-Pose não carregado'}
     
     start_time = time.time()
     
     try:
-        results = model_pose(image, verbose=False)
+        results = model_pose(image.array, imgsz=imgsz, verbose=False) if imgsz else model_pose(image.array, verbose=False)
         
         keypoints_list = []
         confidence = 0.0
+        high_conf_count = 0
         bbox = None
         
         for result in results:
             if result.keypoints is not None and len(result.keypoints) > 0:
-                kps = result.keypoints[0]  # Primeira pessoa detectada
+                # Primeira pessoa detectada: uma única cópia para o host (17, 2|3)
+                kp_data = result.keypoints.data[0].cpu().numpy()
+                n_kps = min(len(POSE_KEYPOINTS), len(kp_data))
                 
-                # Extrair keypoints
-                if hasattr(kps, 'xy') and kps.xy is not None:
-                    xy = kps.xy[0].cpu().numpy()  # Shape: (17, 2)
-                    conf = kps.conf[0].cpu().numpy() if kps.conf is not None else np.ones(17) * 0.5
-                    
-                    for i, (name, c) in enumerate(zip(POSE_KEYPOINTS, conf)):
-                        x, y = xy[i] if i < len(xy) else (0, 0)
-                        keypoints_list.append({
-                            'id': name,
-                            'name': name,
-                            'x': float(x) / image.width if image.width > 0 else 0,  # Normalizado
-                            'y': float(y) / image.height if image.height > 0 else 0,
-                            'confidence': float(c)
-                        })
-                    
-                    confidence = float(np.mean(conf))
+                # Normalizar coordenadas de uma vez
+                scale = np.array([
+                    1.0 / image.width if image.width > 0 else 0.0,
+                    1.0 / image.height if image.height > 0 else 0.0
+                ])
+                xy_norm = kp_data[:n_kps, :2] * scale
+                conf = kp_data[:n_kps, 2] if kp_data.shape[1] > 2 else np.full(n_kps, 0.5)
+                
+                keypoints_list = [
+                    {'id': name, 'name': name, 'x': x, 'y': y, 'confidence': c}
+                    for name, (x, y), c in zip(POSE_KEYPOINTS, xy_norm.tolist(), conf.tolist())
+                ]
+                confidence = float(np.mean(conf)) if n_kps else 0.0
+                high_conf_count = int(np.count_nonzero(conf > 0.5))
                 
                 # Bounding box
                 if result.boxes is not None and len(result.boxes) > 0:
-                    box = result.boxes[0]
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+                    x1, y1, x2, y2 = result.boxes.xyxy[0].cpu().numpy().tolist()
                     bbox = {
-                        'x': float(x1) / image.width,
-                        'y': float(y1) / image.height,
-                        'width': float(x2 - x1) / image.width,
-                        'height': float(y2 - y1) / image.height
+                        'x': x1 / image.width,
+                        'y': y1 / image.height,
+                        'width': (x2 - x1) / image.width,
+                        'height': (y2 - y1) / image.height
                     }
         
         inference_time = (time.time() - start_time) * 1000
         
         # Verificar se é corpo completo (pelo menos 12 keypoints com confiança > 0.5)
-        high_conf_count = len([k for k in keypoints_list if k['confidence'] > 0.5])
-        
         return {
             'keypoints': keypoints_list,
             'confidence': confidence,
             'inference_time_ms': inference_time,
+            'stages': model_stage_timing(results),
             'bbox': bbox,
             'is_full_body': high_conf_count >= 12
         }
@@ -322,13 +1335,47 @@ def analyze_squat_form(keypoints: List[dict], angle: float, thresholds: dict) ->
     return hints
 
 
+async def finish_startup(startup) -> None:
+    """Espera a carga/warmup dos residentes e então calibra as threads (AUTOTUNE)"""
+    start = time.perf_counter()
+    await startup
+    states = models.readiness()['models']
+    logger.info(
+        f"🟢 Modelos residentes prontos em {time.perf_counter() - start:.1f}s: "
+        + ', '.join(f"{kind}={states[kind]['state']}" for kind in models.resident)
+    )
+    if AUTOTUNE:
+        await asyncio.to_thread(autotune_threads)
+    if SHADOW_MODELS:
+        shadow.load_configured(SHADOW_MODELS)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifecycle do FastAPI - carrega modelo na inicialização"""
     logger.info("🚀 Iniciando serviço YOLO...")
-    load_yolo_model()
+    # Modelos sobem em segundo plano: o servidor já aceita conexões e cada endpoint
+    # atende assim que o seu modelo fica pronto (estado por modelo em /ready)
+    if process_info['preloaded']:
+        # Prefork: pesos herdados do master, só falta o warmup neste worker
+        models.mark([kind for kind, _ in models.items()], 'warming')
+        startup = asyncio.to_thread(warmup_preloaded_models)
+    else:
+        if TORCH_THREADS:
+            set_inference_threads(TORCH_THREADS)
+        models.mark(models.resident, 'loading')
+        startup = asyncio.to_thread(load_yolo_model)
+    startup_task = asyncio.create_task(finish_startup(startup))
+    if process_info['workers'] > 1:
+        logger.warning("⚠️ Sessões de pose são locais ao worker: use afinidade por session_id no proxy")
+    idle_sweeper = asyncio.create_task(models.run_idle_sweeper()) if MODEL_IDLE_TTL_S else None
+    swap_watcher = asyncio.create_task(run_swap_watcher()) if MODEL_SWAP_FILE else None
     yield
     logger.info("👋 Encerrando serviço YOLO...")
+    for task in (startup_task, idle_sweeper, swap_watcher):
+        if task is not None:
+            task.cancel()
+    await image_fetcher.close()
 
 
 # Criar app FastAPI
@@ -350,21 +1397,55 @@ app.add_middleware(
 
 
 # Modelos Pydantic
-class DetectionRequest(BaseModel):
+# detect = todas as classes; food_only = só classes de alimento (filtradas no modelo);
+# segment = todas as classes + máscaras (modelo de segmentação)
+DetectionTask = Literal["detect", "food_only", "segment"]
+# Resolução de inferência por requisição: inteiro (múltiplo de 32) ou "auto" (padrão: IMGSZ_DEFAULT)
+ImgszParam = Optional[Union[Annotated[int, Field(ge=128, le=1920)], Literal["auto"]]]
+
+
+class ResponseFormatParams(BaseModel):
+    """Formato da resposta: full (lista de objetos) ou compact (arrays paralelos) + seleção de campos"""
+    format: Literal["full", "compact"] = "full"
+    fields: Optional[List[str]] = None  # Ex.: ["food_objects", "total_food"] (success sempre incluído)
+
+
+class DeadlineParams(BaseModel):
+    """Prazo opcional: captura no cliente (epoch em ms) e/ou orçamento em ms a partir dela (ou da chegada)"""
+    captured_at: Optional[float] = None
+    deadline_ms: Optional[float] = Field(None, gt=0)
+
+
+class TilingParams(BaseModel):
+    """Parâmetros da inferência em tiles (compartilhados por /detect e /detect/prompt)"""
+    tiling: bool = False  # Inferência em tiles sobrepostos (fotos de alta resolução)
+    tile_size: int = Field(TILE_SIZE, ge=256, le=2048)
+    tile_overlap: float = Field(TILE_OVERLAP, ge=0.0, le=0.5)
+    max_tiles: int = Field(TILE_MAX, ge=1, le=TILE_MAX_LIMIT)
+    
+    def tile_config(self) -> Optional[tuple]:
+        return (self.tile_size, self.tile_overlap, self.max_tiles) if self.tiling else None
+
+
+class DetectionRequest(TilingParams, ResponseFormatParams, DeadlineParams):
     image_url: Optional[str] = None
     image_base64: Optional[str] = None
     confidence: float = 0.35
-    task: str = "detect"  # detect, food_only, segment
-    max_detections: int = 100
+    task: DetectionTask = "detect"
+    max_detections: int = Field(100, ge=1, le=300)
+    imgsz: ImgszParam = None
+    bypass_cache: bool = False  # Ignora o cache (o resultado novo ainda é gravado)
 
 
 class DetectionResult(BaseModel):
+    class_id: Optional[int] = None
     class_name: str
     class_name_pt: str
     confidence: float
     bbox: List[float]
     is_food: bool
     area: float
+    mask: Optional[List[List[float]]] = None  # Polígono [[x, y], ...] (task="segment")
 
 
 class DetectionResponse(BaseModel):
@@ -376,107 +1457,2065 @@ class DetectionResponse(BaseModel):
     inference_time_ms: float
     model_version: str
     message: str = ""
+    task: str = "detect"
+    imgsz: Optional[int] = None  # Resolução aplicada na inferência
+    timing: Dict[str, Any] = {}
+    cached: bool = False
+    cache_match: Optional[str] = None  # exact (mesmo conteúdo) ou perceptual (quase duplicata)
 
 
-def download_image(url: str) -> Optional[Image.Image]:
-    """Baixa imagem da URL"""
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (compatible; YOLOService/2.0)'
+class ImageTooLargeError(ValueError):
+    """Imagem acima dos limites de bytes (FETCH_MAX_BYTES) ou pixels (MAX_IMAGE_PIXELS)"""
+    pass
+
+
+class ImageFetcher:
+    """
+    Cliente HTTP assíncrono compartilhado para download de imagens.
+    
+    Mantém conexões keep-alive (reaproveita DNS, TCP e sessão TLS com os
+    hosts de storage MinIO/Supabase), limita downloads simultâneos por host
+    e lê o corpo em streaming, abortando acima de `max_bytes`.
+    """
+    def __init__(self, timeout_s: float, max_bytes: int, max_connections: int, per_host_limit: int):
+        self.timeout_s = timeout_s
+        self.max_bytes = max_bytes
+        self.max_connections = max_connections
+        self.per_host_limit = max(1, per_host_limit)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        # Métricas
+        self.fetches = 0
+        self.errors = 0
+        self.rejected_too_large = 0
+        self.bytes_downloaded = 0
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout_s, connect=min(5.0, self.timeout_s)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0
+                ),
+                headers={'User-Agent': 'Mozilla/5.0 (compatible; YOLOService/2.0)'},
+                follow_redirects=True
+            )
+        return self._client
+    
+    async def fetch(self, url: str) -> bytearray:
+        """Baixa o corpo da URL respeitando o limite por host e o tamanho máximo"""
+        client = self._get_client()
+        host = httpx.URL(url).host
+        slots = self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+        
+        async with slots:
+            try:
+                async with client.stream('GET', url) as response:
+                    response.raise_for_status()
+                    
+                    content_length = response.headers.get('content-length')
+                    if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+                        raise ImageTooLargeError(f"Imagem com {content_length} bytes excede o limite de {self.max_bytes}")
+                    
+                    data = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        data.extend(chunk)
+                        if len(data) > self.max_bytes:
+                            raise ImageTooLargeError(f"Imagem excede o limite de {self.max_bytes} bytes")
+            except ImageTooLargeError:
+                self.rejected_too_large += 1
+                raise
+            except Exception:
+                self.errors += 1
+                raise
+        
+        self.fetches += 1
+        self.bytes_downloaded += len(data)
+        return data
+    
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    def stats(self) -> dict:
+        return {
+            'fetches': self.fetches,
+            'errors': self.errors,
+            'rejected_too_large': self.rejected_too_large,
+            'bytes_downloaded': self.bytes_downloaded,
+            'max_bytes': self.max_bytes,
+            'per_host_limit': self.per_host_limit,
+            'hosts_in_flight': {
+                host: self.per_host_limit - slots._value
+                for host, slots in self._host_slots.items()
+                if slots._value < self.per_host_limit
+            }
         }
-        response = requests.get(url, timeout=15, headers=headers)
-        response.raise_for_status()
-        return Image.open(io.BytesIO(response.content)).convert('RGB')
+
+
+image_fetcher = ImageFetcher(
+    timeout_s=FETCH_TIMEOUT_S,
+    max_bytes=FETCH_MAX_BYTES,
+    max_connections=FETCH_MAX_CONNECTIONS,
+    per_host_limit=FETCH_PER_HOST_LIMIT
+)
+
+
+class DecodedImage:
+    """
+    Imagem pronta para o modelo: array BGR uint8 contíguo (convenção do
+    OpenCV/ultralytics) + dimensões originais, para devolver as coordenadas
+    na escala da imagem enviada mesmo quando o decode foi reduzido.
+    """
+    __slots__ = ('array', 'orig_width', 'orig_height')
+    
+    def __init__(self, array: np.ndarray, orig_width: int, orig_height: int):
+        self.array = array
+        self.orig_width = orig_width
+        self.orig_height = orig_height
+    
+    @property
+    def width(self) -> int:
+        return self.array.shape[1]
+    
+    @property
+    def height(self) -> int:
+        return self.array.shape[0]
+    
+    @property
+    def scale(self) -> tuple:
+        """Fator (x, y) do array decodificado para a imagem original"""
+        return self.orig_width / self.width, self.orig_height / self.height
+
+
+# Flags de decode reduzido do OpenCV (escala DCT do libjpeg para JPEG)
+_REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def read_image_size(view: memoryview) -> tuple:
+    """Dimensões da imagem lendo só o cabeçalho (prefixo de 256 KB; completo se necessário)"""
+    try:
+        return Image.open(io.BytesIO(view[:256 * 1024])).size
+    except Exception:
+        return Image.open(io.BytesIO(view)).size
+
+
+def decode_image_bytes(data: bytes, target_size: Optional[int] = DECODE_TARGET_SIZE) -> Optional[DecodedImage]:
+    """
+    Decodifica bytes de imagem (JPEG, PNG, ...) direto para um array BGR.
+    
+    Lê só o cabeçalho para obter as dimensões, escolhe o maior fator de
+    redução (1/2, 1/4, 1/8) que mantém o lado maior >= target_size e
+    decodifica já reduzido. Acima de MAX_IMAGE_PIXELS (pixels decodificados:
+    reduzidos no OpenCV, resolução cheia no fallback via PIL) levanta ImageTooLargeError.
+    """
+    view = memoryview(data)
+    try:
+        orig_width, orig_height = read_image_size(view)
+    except Exception as e:
+        logger.error(f"❌ Erro ao decodificar imagem: {e}")
+        return None
+    
+    factor = 1
+    if target_size:
+        while factor < 8 and max(orig_width, orig_height) // (factor * 2) >= target_size:
+            factor *= 2
+    
+    decoded_pixels = (orig_width // factor) * (orig_height // factor)
+    if decoded_pixels > MAX_IMAGE_PIXELS:
+        raise ImageTooLargeError(
+            f"Imagem {orig_width}x{orig_height} excede o limite de {MAX_IMAGE_PIXELS} pixels"
+        )
+    
+    try:
+        buffer = np.frombuffer(view, dtype=np.uint8)  # Sem cópia do buffer da requisição
+        array = cv2.imdecode(buffer, _REDUCED_DECODE_FLAGS[factor] | cv2.IMREAD_IGNORE_ORIENTATION)
+    except Exception as e:
+        logger.error(f"❌ Erro ao decodificar imagem: {e}")
+        return None
+    
+    if array is None:
+        # Formatos sem suporte no OpenCV (ex.: GIF): decode completo via PIL, então o limite vale para a resolução cheia
+        if orig_width * orig_height > MAX_IMAGE_PIXELS:
+            raise ImageTooLargeError(
+                f"Imagem {orig_width}x{orig_height} excede o limite de {MAX_IMAGE_PIXELS} pixels"
+            )
+        try:
+            rgb = np.asarray(Image.open(io.BytesIO(data)).convert('RGB'))
+            array = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+        except Exception as e:
+            logger.error(f"❌ Erro ao decodificar imagem: {e}")
+            return None
+    return DecodedImage(np.ascontiguousarray(array), orig_width, orig_height)
+
+
+async def fetch_image_bytes(url: str, timing: Optional[dict] = None) -> Optional[bytearray]:
+    """Baixa os bytes da imagem pela URL (cliente compartilhado)"""
+    start = time.perf_counter()
+    try:
+        return await image_fetcher.fetch(url)
+    except ImageTooLargeError:
+        raise
     except Exception as e:
         logger.error(f"❌ Erro ao baixar imagem: {e}")
         return None
+    finally:
+        if timing is not None:
+            timing['fetch_ms'] = round((time.perf_counter() - start) * 1000, 2)
 
 
-def decode_base64_image(base64_str: str) -> Optional[Image.Image]:
-    """Decodifica imagem base64"""
+def decode_base64_bytes(base64_str: str) -> Optional[bytes]:
+    """Decodifica string base64 para os bytes da imagem"""
     try:
         # Remover prefixo data:image se existir
         if ',' in base64_str:
             base64_str = base64_str.split(',')[1]
         
-        image_data = base64.b64decode(base64_str)
-        return Image.open(io.BytesIO(image_data)).convert('RGB')
+        return base64.b64decode(base64_str)
     except Exception as e:
         logger.error(f"❌ Erro ao decodificar base64: {e}")
         return None
 
 
-def detect_objects(image: Image.Image, confidence: float = 0.35) -> tuple:
-    """Detecta objetos na imagem usando YOLO"""
-    global model
+async def decode_request_image(image_bytes: bytes, timing: dict,
+                               target_size: Optional[int] = DECODE_TARGET_SIZE) -> Optional[DecodedImage]:
+    """Decodifica a imagem no pool de inferência registrando decode_ms"""
+    start = time.perf_counter()
+    image = await inference_pool.run(decode_image_bytes, image_bytes, target_size)
+    timing['decode_ms'] = round((time.perf_counter() - start) * 1000, 2)
+    return image
+
+
+async def read_request_image(image_url: Optional[str], image_base64: Optional[str],
+                             timing: dict, prefer_base64: bool = False) -> Optional[bytes]:
+    """Obtém os bytes da imagem da requisição (URL ou base64) sem bloquear o event loop"""
+    if image_base64 and (prefer_base64 or not image_url):
+        return await inference_pool.run(decode_base64_bytes, image_base64)
+    if image_url:
+        return await fetch_image_bytes(image_url, timing)
+    return None
+
+
+_class_tables_cache: Dict[int, tuple] = {}
+
+
+def get_class_tables(names: Dict[int, str]) -> tuple:
+    """
+    Tabelas indexadas por class_id (nome, nome em português e máscara is_food),
+    montadas a partir de FOOD_CLASS_IDS/FOOD_TRANSLATIONS uma vez por modelo.
+    """
+    cached = _class_tables_cache.get(id(names))
+    if cached is not None and cached[0] is names:
+        return cached[1]
     
-    if model is None:
+    size = max(max(names.keys(), default=0), max(FOOD_CLASS_IDS.keys())) + 1
+    class_names = np.array([names.get(i, f"class_{i}") for i in range(size)], dtype=object)
+    class_names_pt = np.array([FOOD_TRANSLATIONS.get(n, n) for n in class_names], dtype=object)
+    food_mask = np.zeros(size, dtype=bool)
+    food_mask[list(FOOD_CLASS_IDS.keys())] = True
+    
+    tables = (class_names, class_names_pt, food_mask)
+    _class_tables_cache[id(names)] = (names, tables)
+    return tables
+
+
+def build_detection_objects(data: np.ndarray, names: Dict[int, str]) -> List[dict]:
+    """Linhas (N, 6) = x1, y1, x2, y2, conf, cls já na escala original → dicts de DetectionResult"""
+    class_names, names_pt, food_mask = get_class_tables(names)
+    class_ids = np.clip(data[:, 5].astype(np.int64), 0, len(class_names) - 1)
+    
+    xy = data[:, :2]
+    wh = data[:, 2:4] - xy
+    bboxes = np.concatenate([xy, wh], axis=1)
+    areas = np.round(wh[:, 0] * wh[:, 1], 2)
+    confs = np.round(data[:, 4], 4)
+    
+    return [
+        {
+            'class_id': class_id,
+            'class_name': name,
+            'class_name_pt': name_pt,
+            'confidence': conf,
+            'bbox': bbox,
+            'is_food': is_food,
+            'area': area
+        }
+        for class_id, name, name_pt, conf, bbox, is_food, area in zip(
+            class_ids.tolist(),
+            class_names[class_ids].tolist(),
+            names_pt[class_ids].tolist(),
+            confs.tolist(),
+            bboxes.tolist(),
+            food_mask[class_ids].tolist(),
+            areas.tolist()
+        )
+    ]
+
+
+def detect_objects_batch(images: List[DecodedImage], confidences: List[float],
+                         max_detections: List[int], task: str = "detect",
+                         imgsz: Optional[int] = None, loaded_model=None,
+                         raise_errors: bool = False) -> List[tuple]:
+    """
+    Detecta objetos em um lote de imagens com um único forward pass.
+    
+    food_only passa as classes de alimento e o max_det para o modelo (a poda
+    acontece antes do pós-processamento); segment usa o modelo de segmentação
+    e inclui o polígono da máscara de cada objeto. loaded_model substitui o
+    modelo ativo da task (candidato do shadow). Com raise_errors=True, falha
+    de inferência ou modelo indisponível levantam exceção em vez de devolver
+    listas vazias (backfill e shadow não podem confundir falha com "nada detectado").
+    """
+    kind = 'segment' if task == "segment" else 'detect'
+    active_model = models.get(kind) if loaded_model is None else loaded_model
+    if active_model is None:
+        if raise_errors:
+            raise ModelUnavailableError(f"Modelo {kind} indisponível: {models.errors.get(kind, 'não carregado')}")
         logger.warning("⚠️ Modelo não carregado!")
-        return [], 0
+        return [([], 0, {}) for _ in images]
     
     start_time = time.time()
     
     try:
-        # Executar detecção
-        results = model(image, conf=confidence, verbose=False)
+        # Executar detecção do lote inteiro com o menor threshold e o maior max_det;
+        # o threshold e o limite de cada requisição são aplicados depois, por imagem
+        predict_kwargs = {'conf': min(confidences), 'max_det': max(max_detections), 'verbose': False}
+        if imgsz:
+            predict_kwargs['imgsz'] = imgsz
+        if task == "food_only":
+            predict_kwargs['classes'] = FOOD_CLASS_ID_LIST
+        results = predict_images(
+            active_model, [image.array for image in images],
+            batch=model_backends.get('segment' if task == "segment" else 'detect', {}).get('batch', True),
+            **predict_kwargs
+        )
         
-        detected_objects = []
+        batch_objects = []
+        post_start = time.perf_counter()
         
-        for result in results:
-            if result.boxes is not None:
-                boxes = result.boxes
-                for box in boxes:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    conf = float(box.conf[0].cpu().numpy())
-                    class_id = int(box.cls[0].cpu().numpy())
-                    
-                    # Obter nome da classe
-                    class_name = result.names.get(class_id, f"class_{class_id}")
-                    class_name_pt = FOOD_TRANSLATIONS.get(class_name, class_name)
-                    
-                    # Verificar se é alimento
-                    is_food = class_id in FOOD_CLASS_IDS
-                    
-                    # Calcular área
-                    width = float(x2 - x1)
-                    height = float(y2 - y1)
-                    area = width * height
-                    
-                    detected_objects.append(DetectionResult(
-                        class_name=class_name,
-                        class_name_pt=class_name_pt,
-                        confidence=round(conf, 4),
-                        bbox=[float(x1), float(y1), width, height],
-                        is_food=is_food,
-                        area=round(area, 2)
-                    ))
+        for result, image, min_conf, max_det in zip(results, images, confidences, max_detections):
+            if result.boxes is None or len(result.boxes) == 0:
+                batch_objects.append([])
+                continue
+            
+            # Uma única cópia para o host: (N, 6) = x1, y1, x2, y2, conf, cls
+            data = result.boxes.data.cpu().numpy().astype(np.float64)
+            names, names_pt, food_mask = get_class_tables(result.names)
+            
+            # Linhas mantidas: threshold da requisição, só alimentos em food_only, limite max_det
+            keep = data[:, 4] >= min_conf
+            if task == "food_only":
+                keep &= food_mask[np.clip(data[:, 5].astype(np.int64), 0, len(names) - 1)]
+            keep = np.flatnonzero(keep)[:max_det]
+            
+            data = data[keep]
+            data[:, :4] *= np.tile(image.scale, 2)  # Coordenadas na escala original
+            objects = build_detection_objects(data, result.names)
+            
+            # Polígonos das máscaras (já na resolução da imagem decodificada)
+            if task == "segment" and result.masks is not None:
+                polygons = result.masks.xy
+                for obj, index in zip(objects, keep.tolist()):
+                    obj['mask'] = np.round(polygons[index] * image.scale, 1).tolist()
+            
+            batch_objects.append(objects)
+        
+        # Pós-processamento = NMS/decodificação do ultralytics + conversão para objetos (por imagem)
+        stages = model_stage_timing(results)
+        if stages:
+            own_ms = (time.perf_counter() - post_start) * 1000 / len(images)
+            stages['postprocess_ms'] = round(stages['postprocess_ms'] + own_ms, 2)
         
         inference_time = (time.time() - start_time) * 1000
-        logger.info(f"🦾 Detectados {len(detected_objects)} objetos em {inference_time:.1f}ms")
+        total = sum(len(objs) for objs in batch_objects)
+        logger.info(f"🦾 Detectados {total} objetos ({task}) em {len(images)} imagem(ns) em {inference_time:.1f}ms")
         
-        return detected_objects, inference_time
+        return [(objs, inference_time, stages) for objs in batch_objects]
         
     except Exception as e:
         logger.error(f"❌ Erro na detecção: {e}")
-        return [], 0
+        if raise_errors:
+            raise
+        return [([], 0, {}) for _ in images]
+
+
+def detect_objects(image: DecodedImage, confidence: float = 0.35, task: str = "detect",
+                   max_detections: int = 300, imgsz: Optional[int] = None) -> tuple:
+    """Detecta objetos na imagem usando YOLO"""
+    return detect_objects_batch([image], [confidence], [max_detections], task, imgsz)[0]
+
+
+def prompt_detections_from_results(results, prompts: List[str], scale: tuple = (1.0, 1.0)) -> tuple:
+    """Converte resultados do YOLOE em detecções por prompt (pós-processamento vetorizado)"""
+    rows = [
+        result.boxes.data.cpu().numpy().astype(np.float64)
+        for result in results
+        if result.boxes is not None and len(result.boxes) > 0
+    ]
+    if not rows:
+        return [], False, 0.0
+    
+    data = np.concatenate(rows)
+    data[:, :4] *= np.tile(scale, 2)  # Coordenadas na escala original
+    return prompt_detections_from_rows(data, prompts)
+
+
+def prompt_detections_from_rows(data: np.ndarray, prompts: List[str]) -> tuple:
+    """Linhas (N, 6) do YOLOE já na escala original → (detecções, is_document, document_confidence)"""
+    if len(data) == 0:
+        return [], False, 0.0
+    
+    # Tabela class_id → prompt e máscara de prompts de documento
+    prompt_table = np.array(list(prompts), dtype=object)
+    doc_prompt_mask = np.array(
+        [any(kw in p.lower() for kw in DOCUMENT_KEYWORDS) for p in prompts], dtype=bool
+    )
+    
+    class_ids = data[:, 5].astype(np.int64)
+    known = class_ids < len(prompts)
+    
+    prompt_names = np.array([f"class_{c}" for c in class_ids], dtype=object)
+    prompt_names[known] = prompt_table[class_ids[known]]
+    
+    xy = data[:, :2]
+    wh = data[:, 2:4] - xy
+    bboxes = np.concatenate([xy, wh], axis=1)
+    areas = np.round(wh[:, 0] * wh[:, 1], 2)
+    
+    detections = [
+        {'prompt': name, 'confidence': conf, 'bbox': bbox, 'area': area}
+        for name, conf, bbox, area in zip(
+            prompt_names.tolist(),
+            np.round(data[:, 4], 4).tolist(),
+            bboxes.tolist(),
+            areas.tolist()
+        )
+    ]
+    
+    # Verificar se é documento
+    is_doc = np.zeros(len(class_ids), dtype=bool)
+    is_doc[known] = doc_prompt_mask[class_ids[known]]
+    document_confidence = float(data[is_doc, 4].max()) if is_doc.any() else 0.0
+    
+    return detections, bool(is_doc.any()), document_confidence
+
+
+# ==================== INFERÊNCIA EM TILES ====================
+
+def tile_windows(width: int, height: int, tile_size: int, overlap: float, max_tiles: int) -> List[tuple]:
+    """
+    Janelas (x0, y0, x1, y1) sobrepostas cobrindo a imagem. Se a grade passar
+    de max_tiles, o tile cresce até caber (cada tile é reduzido ao imgsz na inferência).
+    """
+    def starts(length: int, size: int, stride: int) -> List[int]:
+        if length <= size:
+            return [0]
+        count = math.ceil((length - size) / stride) + 1
+        return [min(i * stride, length - size) for i in range(count)]
+    
+    size = tile_size
+    while True:
+        stride = max(1, int(size * (1 - overlap)))
+        xs, ys = starts(width, size, stride), starts(height, size, stride)
+        if len(xs) * len(ys) <= max_tiles:
+            break
+        size = int(size * 1.25)
+    
+    return [(x, y, min(x + size, width), min(y + size, height)) for y in ys for x in xs]
+
+
+def tile_decode_target(tile_size: int, max_tiles: int) -> int:
+    """Lado maior necessário para a grade de tiles (o decode reduzido não desce abaixo disso)"""
+    return int(tile_size * math.sqrt(max_tiles))
+
+
+def tiled_predict(tile_model, image: DecodedImage, windows: List[tuple], batch: bool = True, **kwargs) -> np.ndarray:
+    """
+    Roda o modelo em todos os tiles num único lote e devolve as caixas
+    (N, 6) nas coordenadas da imagem decodificada.
+    """
+    crops = [image.array[y0:y1, x0:x1] for x0, y0, x1, y1 in windows]
+    results = predict_images(tile_model, crops, batch=batch, **kwargs)
+    
+    rows = []
+    for result, (x0, y0, _, _) in zip(results, windows):
+        if result.boxes is None or len(result.boxes) == 0:
+            continue
+        data = result.boxes.data.cpu().numpy().astype(np.float64)[:, :6]
+        data[:, [0, 2]] += x0
+        data[:, [1, 3]] += y0
+        rows.append(data)
+    return np.concatenate(rows) if rows else np.zeros((0, 6))
+
+
+def merge_tile_boxes(data: np.ndarray, iou_threshold: float = TILE_NMS_IOU,
+                     ios_threshold: float = 0.85) -> np.ndarray:
+    """
+    Supressão entre tiles, por classe e em ordem de confiança: remove as
+    duplicatas da faixa de sobreposição (IoU) e os pedaços de objetos
+    cortados na borda do tile contidos numa caixa maior (interseção sobre
+    a menor área).
+    """
+    if len(data) < 2:
+        return data
+    
+    data = data[np.argsort(-data[:, 4], kind='stable')]
+    areas = np.prod(np.clip(data[:, 2:4] - data[:, :2], 0, None), axis=1)
+    suppressed = np.zeros(len(data), dtype=bool)
+    keep = []
+    
+    for i in range(len(data)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        rest = np.flatnonzero(~suppressed[i + 1:]) + i + 1
+        rest = rest[data[rest, 5] == data[i, 5]]
+        if len(rest) == 0:
+            continue
+        top_left = np.maximum(data[i, :2], data[rest, :2])
+        bottom_right = np.minimum(data[i, 2:4], data[rest, 2:4])
+        inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        ios = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        suppressed[rest[(iou > iou_threshold) | (ios > ios_threshold)]] = True
+    
+    return data[keep]
+
+
+def image_tile_windows(image: DecodedImage, tile_size: int, overlap: float, max_tiles: int) -> List[tuple]:
+    """
+    Tiles da imagem + uma passada na imagem inteira (objetos grandes que não
+    cabem num tile); o total de passadas respeita max_tiles.
+    """
+    windows = tile_windows(image.width, image.height, tile_size, overlap, max(1, max_tiles - 1))
+    if len(windows) > 1:
+        windows.append((0, 0, image.width, image.height))
+    return windows
+
+
+def detect_objects_tiled(image: DecodedImage, confidence: float, max_detections: int, task: str,
+                         imgsz: Optional[int], tile_size: int, overlap: float, max_tiles: int) -> tuple:
+    """Detecção em tiles (detect/food_only). Retorna (objetos, inference_time_ms, número de tiles)"""
+    model = models.get('detect')
+    if model is None:
+        logger.warning("⚠️ Modelo não carregado!")
+        return [], 0, 0
+    
+    start_time = time.time()
+    windows = image_tile_windows(image, tile_size, overlap, max_tiles)
+    
+    try:
+        predict_kwargs = {'conf': confidence, 'max_det': max_detections, 'verbose': False}
+        if imgsz:
+            predict_kwargs['imgsz'] = imgsz
+        if task == "food_only":
+            predict_kwargs['classes'] = FOOD_CLASS_ID_LIST
+        data = tiled_predict(
+            model, image, windows,
+            batch=model_backends.get('detect', {}).get('batch', True),
+            **predict_kwargs
+        )
+        
+        data = merge_tile_boxes(data)[:max_detections]
+        data[:, :4] *= np.tile(image.scale, 2)  # Coordenadas na escala original
+        objects = build_detection_objects(data, model.names)
+        if task == "food_only":
+            objects = [obj for obj in objects if obj['is_food']]
+        
+        inference_time = (time.time() - start_time) * 1000
+        logger.info(f"🧩 Detectados {len(objects)} objetos ({task}) em {len(windows)} tiles em {inference_time:.1f}ms")
+        return objects, inference_time, len(windows)
+        
+    except Exception as e:
+        logger.error(f"❌ Erro na detecção em tiles: {e}")
+        return [], 0, len(windows)
+
+
+def detect_prompt_tiled(image: DecodedImage, prompts: List[str], confidence: float, imgsz: Optional[int],
+                        tile_size: int, overlap: float, max_tiles: int) -> tuple:
+    """Detecção YOLOE em tiles. Retorna (detecções, is_document, document_confidence, número de tiles)"""
+    windows = image_tile_windows(image, tile_size, overlap, max_tiles)
+    data = tiled_predict(
+        models.require('yoloe'), image, windows,
+        prompts=prompts, conf=confidence, imgsz=imgsz, verbose=False
+    )
+    data = merge_tile_boxes(data)
+    data[:, :4] *= np.tile(image.scale, 2)  # Coordenadas na escala original
+    logger.info(f"🧩 YOLOE: {len(data)} detecções em {len(windows)} tiles")
+    return (*prompt_detections_from_rows(data, prompts), len(windows))
+
+
+# ==================== POOL DE INFERÊNCIA ====================
+
+class QueueFullError(Exception):
+    """Fila de inferência cheia - o cliente deve tentar novamente mais tarde"""
+    pass
+
+
+class DroppedRequestError(Exception):
+    """Requisição descartada sem inferência: prazo impossível de cumprir ou frame substituído por um mais novo"""
+    def __init__(self, reason: str, context: Optional[dict] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.context = context or {}
+
+
+# Classes de prioridade do pool de inferência, da mais urgente para a menos urgente
+PRIORITY_CLASSES = ('realtime', 'bulk')
+
+# Classe da requisição corrente: definida pela dependência de admissão e lida em BoundedExecutor.run
+inference_class: ContextVar[str] = ContextVar('inference_class', default='bulk')
+
+# Verificação de descarte da requisição corrente (retorna o motivo ou None), conferida antes de cada trabalho
+inference_guard: ContextVar[Optional[Callable[[], Optional[str]]]] = ContextVar('inference_guard', default=None)
+
+
+class InferenceJob:
+    """Trabalho enfileirado no pool: função, future, verificação de descarte e instantes de entrada/início"""
+    __slots__ = ('fn', 'future', 'priority', 'guard', 'submitted', 'started')
+    
+    def __init__(self, fn, priority: str, guard: Optional[Callable[[], Optional[str]]] = None):
+        self.fn = fn
+        self.future: Future = Future()
+        self.priority = priority
+        self.guard = guard
+        self.submitted = time.perf_counter()
+        self.started: Optional[float] = None
+    
+    @property
+    def wait_ms(self) -> float:
+        return ((self.started or self.submitted) - self.submitted) * 1000
+
+
+class BoundedExecutor:
+    """
+    Pool de threads dedicado para trabalho bloqueante (inferência e decode),
+    fora do event loop, com uma fila por classe de prioridade.
+    
+    Cada thread livre escolhe o próximo trabalho entre as filas: em `strict`
+    a classe realtime (frames de pose) sempre passa à frente da bulk
+    (fotos de /detect e /detect/prompt); em `weighted` as classes se alternam
+    na proporção dos pesos (round-robin ponderado), sem inanição da bulk.
+    Trabalho já em execução não é interrompido; `reserved_realtime` threads
+    ficam fora do alcance da bulk para que um frame nunca espere um lote.
+    Ao sair da fila, trabalhos cuja verificação de descarte (prazo estourado,
+    frame substituído) retorna um motivo falham com DroppedRequestError.
+    Limita requisições em andamento a `max_workers + max_queue` por classe
+    (a bulk conta também as realtime); acima disso rejeita na admissão.
+    """
+    def __init__(self, max_workers: int, max_queue: int, policy: str = 'strict',
+                 weights: Optional[Dict[str, int]] = None, reserved_realtime: int = 0):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.policy = policy if policy in ('strict', 'weighted') else 'strict'
+        self.weights = {name: max(1, (weights or {}).get(name, 1)) for name in PRIORITY_CLASSES}
+        self.reserved_realtime = max(0, reserved_realtime)
+        self._cond = threading.Condition()
+        self._queues: Dict[str, deque] = {name: deque() for name in PRIORITY_CLASSES}
+        self._running = {name: 0 for name in PRIORITY_CLASSES}
+        self._credits = {name: 0 for name in PRIORITY_CLASSES}
+        self._threads = 0
+        self._retire = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.admitted = 0
+        # Métricas por classe
+        self.in_flight_by_class = {name: 0 for name in PRIORITY_CLASSES}
+        self.rejected_by_class = {name: 0 for name in PRIORITY_CLASSES}
+        self.dispatched = {name: 0 for name in PRIORITY_CLASSES}
+        self.wait_sum_ms = {name: 0.0 for name in PRIORITY_CLASSES}
+        self.queue_waits_ms = {name: deque(maxlen=1000) for name in PRIORITY_CLASSES}
+        self.jumped_bulk = 0  # Trabalhos realtime despachados com bulk esperando na fila
+        self.dropped: Dict[str, int] = {}
+    
+    @contextmanager
+    def admit(self, priority: str = 'bulk'):
+        """Reserva uma vaga para a requisição ou levanta QueueFullError"""
+        limit = self.max_workers + self.max_queue
+        current = self.in_flight if priority == 'bulk' else self.in_flight_by_class[priority]
+        if current >= limit:
+            self.rejected += 1
+            self.rejected_by_class[priority] += 1
+            raise QueueFullError(
+                f"Serviço sobrecarregado ({self.in_flight} requisições em andamento). Tente novamente."
+            )
+        self.in_flight += 1
+        self.in_flight_by_class[priority] += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.in_flight_by_class[priority] -= 1
+    
+    def resize(self, max_workers: int) -> None:
+        """Troca o número de threads do pool (usado no startup, antes de atender requisições)"""
+        with self._cond:
+            self.max_workers = max(1, max_workers)
+            if self._threads > self.max_workers:
+                self._retire += self._threads - self.max_workers
+                self._cond.notify_all()
+            self._spawn_threads()
+    
+    def _spawn_threads(self):
+        # Threads criadas só no primeiro uso: em prefork nascem no worker, não no master
+        while self._threads - self._retire < self.max_workers:
+            self._threads += 1
+            threading.Thread(target=self._worker, name=f'inference-{self._threads}', daemon=True).start()
+    
+    def _pick(self) -> Optional[InferenceJob]:
+        """Próximo trabalho pela política (chamado com o lock)"""
+        bulk_cap = max(1, self.max_workers - min(self.reserved_realtime, self.max_workers - 1))
+        ready = [
+            name for name in PRIORITY_CLASSES
+            if self._queues[name] and (name != 'bulk' or self._running['bulk'] < bulk_cap)
+        ]
+        if not ready:
+            return None
+        if self.policy == 'strict' or len(ready) == 1:
+            chosen = ready[0]
+        else:
+            # Round-robin ponderado suave: cada classe pronta ganha o próprio peso, a escolhida paga o total
+            for name in ready:
+                self._credits[name] += self.weights[name]
+            chosen = max(ready, key=lambda name: self._credits[name])
+            self._credits[chosen] -= sum(self.weights[name] for name in ready)
+        job = self._queues[chosen].popleft()
+        
+        reason = job.guard() if job.guard else None
+        if reason:
+            self.dropped[reason] = self.dropped.get(reason, 0) + 1
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_exception(DroppedRequestError(reason))
+            return self._pick()
+        
+        if chosen == 'realtime' and self._queues['bulk']:
+            self.jumped_bulk += 1
+        self._running[chosen] += 1
+        return job
+    
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = None
+                while job is None:
+                    if self._retire:
+                        self._retire -= 1
+                        self._threads -= 1
+                        return
+                    job = self._pick()
+                    if job is None:
+                        self._cond.wait()
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    job.started = time.perf_counter()
+                    try:
+                        job.future.set_result(job.fn())
+                    except BaseException as e:
+                        job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._running[job.priority] -= 1
+                    # Vaga da bulk liberada (reserva realtime): acorda uma thread ociosa
+                    self._cond.notify()
+    
+    def submit(self, priority: str, fn, guard: Optional[Callable[[], Optional[str]]] = None) -> InferenceJob:
+        """Enfileira fn() na fila da classe"""
+        job = InferenceJob(fn, priority if priority in self._queues else 'bulk', guard)
+        with self._cond:
+            self._spawn_threads()
+            self._queues[job.priority].append(job)
+            self._cond.notify()
+        return job
+    
+    async def _wait(self, job: InferenceJob):
+        try:
+            return await asyncio.wrap_future(job.future)
+        finally:
+            if job.started is not None:
+                self.dispatched[job.priority] += 1
+                self.wait_sum_ms[job.priority] += job.wait_ms
+                self.queue_waits_ms[job.priority].append(job.wait_ms)
+    
+    async def run(self, fn, *args, **kwargs):
+        """Executa uma função bloqueante no pool, na fila da classe da requisição corrente"""
+        return await self._wait(self.submit(
+            inference_class.get(), functools.partial(fn, *args, **kwargs), inference_guard.get()
+        ))
+    
+    async def run_timed(self, timing: dict, fn, *args, **kwargs):
+        """Como run(), registrando em timing['queue_wait_ms'] a espera por uma thread livre"""
+        job = self.submit(inference_class.get(), functools.partial(fn, *args, **kwargs), inference_guard.get())
+        result = await self._wait(job)
+        timing['queue_wait_ms'] = round(job.wait_ms, 2)
+        return result
+    
+    def queue_depth(self, priority: str) -> int:
+        return len(self._queues[priority])
+    
+    def stats(self) -> dict:
+        def percentile(waits: list, p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 2) if waits else 0.0
+        
+        classes = {}
+        for name in PRIORITY_CLASSES:
+            waits = sorted(self.queue_waits_ms[name])
+            classes[name] = {
+                'queued': len(self._queues[name]),
+                'running': self._running[name],
+                'in_flight': self.in_flight_by_class[name],
+                'dispatched': self.dispatched[name],
+                'rejected': self.rejected_by_class[name],
+                'queue_wait_ms': {
+                    'p50': percentile(waits, 0.50),
+                    'p90': percentile(waits, 0.90),
+                    'p99': percentile(waits, 0.99),
+                    'max': round(waits[-1], 2) if waits else 0.0
+                }
+            }
+        return {
+            'workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'in_flight': self.in_flight,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'policy': self.policy,
+            'weights': self.weights,
+            'reserved_realtime': self.reserved_realtime,
+            'realtime_jumped_bulk': self.jumped_bulk,
+            'dropped': dict(self.dropped),
+            'classes': classes
+        }
+
+
+inference_pool = BoundedExecutor(
+    INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE,
+    policy=SCHEDULER_POLICY,
+    weights=SCHEDULER_WEIGHTS,
+    reserved_realtime=REALTIME_RESERVED_WORKERS
+)
+
+
+# ==================== AUTO-TUNING DE THREADS ====================
+
+def autotune_key() -> str:
+    """Perfil salvo por modelo de CPU e núcleos (e workers/modelo/backend, que mudam o ótimo)"""
+    info = model_backends.get('detect', {})
+    return '|'.join([
+        cpu_info()['model'], f"{available_cores()} cores", f"{process_info['workers']} workers",
+        str(info.get('path', YOLO_MODEL)), str(info.get('backend', 'pytorch'))
+    ])
+
+
+def autotune_configs(cores: int, backend: str) -> List[tuple]:
+    """
+    Combinações (inferências concorrentes, threads intra-op) com streams × threads <= núcleos.
+    ONNX Runtime/OpenVINO têm pools próprios: para eles só varia a concorrência.
+    """
+    configs = []
+    for streams in range(1, min(4, cores) + 1):
+        budget = cores // streams
+        if backend == 'pytorch':
+            options = sorted({t for t in (1, 2, 4, 8, 16, 32) if t <= budget} | {budget})
+        else:
+            options = [budget]
+        configs.extend((streams, threads) for threads in options)
+    return configs
+
+
+def measure_config(tune_model, backend_info: dict, images: list, streams: int, threads: int,
+                   runs: int) -> dict:
+    """Vazão (imagens/s) e latência p95 de `streams` chamadas concorrentes com `threads` threads cada"""
+    set_inference_threads(threads)
+    batch = backend_info.get('batch', True)
+    latencies = []
+    
+    def stream():
+        predict_images(tune_model, images, batch=batch, verbose=False)  # Aquecimento da configuração
+        for _ in range(runs):
+            start = time.perf_counter()
+            predict_images(tune_model, images, batch=batch, verbose=False)
+            latencies.append((time.perf_counter() - start) * 1000)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=streams, thread_name_prefix='autotune') as pool:
+        for future in [pool.submit(stream) for _ in range(streams)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'streams': streams,
+        'threads': threads,
+        'images_per_s': round(streams * (runs + 1) * len(images) / elapsed, 2),
+        'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2)
+    }
+
+
+def pick_config(results: List[dict], latency_bound_ms: float) -> dict:
+    """Maior vazão dentro do limite de latência; se nenhuma cabe, a de menor latência"""
+    within = [r for r in results if r['p95_ms'] <= latency_bound_ms]
+    if within:
+        return max(within, key=lambda r: r['images_per_s'])
+    return min(results, key=lambda r: r['p95_ms'])
+
+
+def load_autotune_profiles() -> dict:
+    try:
+        with open(AUTOTUNE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_autotune_profile(key: str, profile: dict) -> None:
+    """Grava o perfil (escrita atômica, preservando os de outras CPUs)"""
+    profiles = load_autotune_profiles()
+    profiles[key] = profile
+    directory = os.path.dirname(os.path.abspath(AUTOTUNE_FILE))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{AUTOTUNE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(tmp_path, AUTOTUNE_FILE)
+
+
+def run_autotune(tune_model, backend_info: dict) -> dict:
+    """Varre as configurações num lote sintético e retorna o perfil escolhido"""
+    cores = max(1, available_cores() // max(1, process_info['workers']))
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, (640, 640, 3), dtype=np.uint8) for _ in range(max(1, AUTOTUNE_BATCH))]
+    deadline = time.perf_counter() + AUTOTUNE_MAX_S
+    results = []
+    for streams, threads in autotune_configs(cores, backend_info.get('backend', 'pytorch')):
+        if results and time.perf_counter() > deadline:
+            logger.warning(f"⏱️ Auto-tuning interrompido após {len(results)} configurações (AUTOTUNE_MAX_S)")
+            break
+        result = measure_config(tune_model, backend_info, images, streams, threads, max(1, AUTOTUNE_RUNS))
+        logger.info(f"📐 streams={streams} threads={threads}: {result['images_per_s']} img/s, p95 {result['p95_ms']}ms")
+        results.append(result)
+    best = pick_config(results, LATENCY_TARGET_MS)
+    return {
+        'streams': best['streams'],
+        'threads': best['threads'],
+        'images_per_s': best['images_per_s'],
+        'p95_ms': best['p95_ms'],
+        'latency_bound_ms': LATENCY_TARGET_MS,
+        'batch': len(images),
+        'measured_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results
+    }
+
+
+def autotune_threads() -> Optional[dict]:
+    """
+    Aplica o perfil de threads salvo para esta CPU ou, sem perfil, calibra
+    agora (após o warmup) e persiste em AUTOTUNE_FILE. Em prefork um lock de
+    arquivo serializa a calibração: os demais workers reaproveitam o resultado.
+    """
+    if TORCH_THREADS:
+        logger.info(f"📐 Auto-tuning ignorado: TORCH_THREADS={TORCH_THREADS} fixado")
+        return None
+    tune_model = models.peek('detect')
+    if tune_model is None:
+        logger.info("📐 Auto-tuning ignorado: requer o modelo de detecção residente (MODELS_RESIDENT)")
+        return None
+    
+    import fcntl
+    key = autotune_key()
+    lock_path = f"{AUTOTUNE_FILE}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        profile = load_autotune_profiles().get(key)
+        source = 'cache'
+        if profile is None:
+            logger.info(f"📐 Calibrando threads para {key}...")
+            profile = run_autotune(tune_model, model_backends['detect'])
+            save_autotune_profile(key, profile)
+            source = 'measured'
+    
+    set_inference_threads(profile['threads'])
+    inference_pool.resize(profile['streams'])
+    process_info['autotune'] = {
+        'source': source, 'key': key, 'file': AUTOTUNE_FILE,
+        **{k: profile[k] for k in ('streams', 'threads', 'images_per_s', 'p95_ms', 'measured_at')}
+    }
+    logger.info(
+        f"📐 Perfil de threads ({source}): {profile['streams']} inferências concorrentes × "
+        f"{profile['threads']} threads ({profile['images_per_s']} img/s, p95 {profile['p95_ms']}ms)"
+    )
+    return profile
+
+
+# ==================== RESOLUÇÃO ADAPTATIVA (IMGSZ) ====================
+
+# Maior imgsz útil por task: pose roda em frames de câmera, prompts (documentos) ganham com detalhe
+IMGSZ_TASK_CAP = {'detect': 640, 'food_only': 640, 'segment': 640, 'pose': 480, 'prompt': 960}
+
+# Modelo (chave de model_backends) de cada task
+IMGSZ_TASK_MODEL = {'detect': 'detect', 'food_only': 'detect', 'segment': 'segment', 'pose': 'pose', 'prompt': 'yoloe'}
+
+
+def normalize_imgsz(value: int) -> int:
+    """Múltiplo de 32 (stride do modelo) dentro da faixa de IMGSZ_CHOICES"""
+    value = int(round(value / 32) * 32)
+    return min(max(value, IMGSZ_CHOICES[0]), IMGSZ_CHOICES[-1])
+
+
+class ImgszController:
+    """
+    Controlador de SLO da resolução automática.
+    
+    O tamanho ideal vem da imagem (sem upscale além do lado maior) e do teto
+    da task; o controlador desce um degrau em IMGSZ_CHOICES quando o p90 da
+    latência observada passa da meta ou a fila do pool cresce, e sobe de
+    volta quando há folga (p90 abaixo de metade da meta).
+    """
+    def __init__(self, name: str, target_ms: float, window: int = 50, cooldown_s: float = 2.0):
+        self.name = name
+        self.target_ms = target_ms
+        self.cooldown_s = cooldown_s
+        self.level = 0  # Degraus abaixo do tamanho ideal
+        self.step_downs = 0
+        self.step_ups = 0
+        self._samples: deque = deque(maxlen=window)
+        self._last_change = 0.0
+    
+    def ideal(self, task: str, width: Optional[int], height: Optional[int]) -> int:
+        """Menor tamanho que cobre o lado maior da imagem, limitado pelo teto da task"""
+        cap = IMGSZ_TASK_CAP.get(task, 640)
+        allowed = [size for size in IMGSZ_CHOICES if size <= cap] or IMGSZ_CHOICES[:1]
+        if not width or not height:
+            return allowed[-1]
+        long_side = max(width, height)
+        return next((size for size in allowed if size >= long_side), allowed[-1])
+    
+    def pick(self, task: str, width: Optional[int], height: Optional[int]) -> int:
+        ideal = self.ideal(task, width, height)
+        level = self.level
+        # Sob carga (mais requisições que workers) desce um degrau extra imediatamente
+        if inference_pool.in_flight > inference_pool.max_workers * 2:
+            level += 1
+        return IMGSZ_CHOICES[max(0, IMGSZ_CHOICES.index(ideal) - level)]
+    
+    def observe(self, latency_ms: float):
+        """Registra a latência (fila + inferência) de uma requisição e ajusta o degrau"""
+        self._samples.append(latency_ms)
+        now = time.monotonic()
+        if len(self._samples) < 10 or now - self._last_change < self.cooldown_s:
+            return
+        
+        p90 = sorted(self._samples)[int(0.9 * (len(self._samples) - 1))]
+        if p90 > self.target_ms and self.level < len(IMGSZ_CHOICES) - 1:
+            self.level += 1
+            self.step_downs += 1
+        elif p90 < self.target_ms / 2 and self.level > 0:
+            self.level -= 1
+            self.step_ups += 1
+        else:
+            return
+        
+        logger.info(f"📐 imgsz {self.name}: p90 {p90:.0f}ms (meta {self.target_ms:.0f}ms) → degrau {self.level}")
+        self._samples.clear()
+        self._last_change = now
+    
+    def expected_ms(self) -> float:
+        """Latência típica recente (mediana): quanto uma requisição ainda precisa para ser atendida"""
+        if not self._samples:
+            return 0.0
+        return sorted(self._samples)[len(self._samples) // 2]
+    
+    def stats(self) -> dict:
+        samples = sorted(self._samples)
+        return {
+            'target_ms': self.target_ms,
+            'level': self.level,
+            'step_downs': self.step_downs,
+            'step_ups': self.step_ups,
+            'p90_ms': round(samples[int(0.9 * (len(samples) - 1))], 2) if samples else None
+        }
+
+
+imgsz_controllers = {
+    'detect': ImgszController('detect', LATENCY_TARGET_MS),
+    'prompt': ImgszController('prompt', LATENCY_TARGET_MS),
+    'pose': ImgszController('pose', POSE_LATENCY_TARGET_MS),
+}
+
+
+def imgsz_controller(task: str) -> ImgszController:
+    return imgsz_controllers['detect' if task in ('detect', 'food_only', 'segment') else task]
+
+
+# ==================== PRAZOS (DEADLINES) ====================
+
+def request_deadline(params: "DeadlineParams", default_ms: float = 0) -> Optional[float]:
+    """
+    Prazo absoluto (relógio perf_counter) da requisição: deadline_ms (ou o
+    padrão) contado a partir de captured_at - epoch em ms no relógio do
+    cliente - ou da chegada. None = sem prazo.
+    """
+    budget_ms = params.deadline_ms or default_ms
+    if not budget_ms:
+        return None
+    age_ms = max(0.0, time.time() * 1000 - params.captured_at) if params.captured_at is not None else 0.0
+    return time.perf_counter() + (budget_ms - age_ms) / 1000
+
+
+def deadline_guard(deadline: Optional[float], task: str) -> Optional[Callable[[], Optional[str]]]:
+    """Descarta quando o tempo restante já não cobre a latência típica da task"""
+    if deadline is None:
+        return None
+    controller = imgsz_controller(task)
+    return lambda: 'deadline' if time.perf_counter() + controller.expected_ms() / 1000 > deadline else None
+
+
+def apply_guard(guard: Optional[Callable[[], Optional[str]]]) -> None:
+    """Vale para os trabalhos seguintes desta requisição; já descarta se o prazo não cabe mais"""
+    inference_guard.set(guard)
+    reason = guard() if guard else None
+    if reason:
+        raise DroppedRequestError(reason)
+
+
+def image_dimensions(data: bytes) -> tuple:
+    """(largura, altura) pelo cabeçalho, sem decodificar; (None, None) se ilegível"""
+    try:
+        return read_image_size(memoryview(data))
+    except Exception:
+        return None, None
+
+
+def probe_image_bytes(data: bytes) -> tuple:
+    """Hash do conteúdo + dimensões: (hash, largura, altura)"""
+    return (content_hash(data), *image_dimensions(data))
+
+
+def tile_imgsz(task: str, tile_size: int) -> int:
+    """imgsz dos tiles: resolução nativa do tile (ou o tamanho fixo do grafo exportado)"""
+    fixed = model_backends.get(IMGSZ_TASK_MODEL.get(task, 'detect'), {}).get('static_imgsz')
+    return fixed or normalize_imgsz(tile_size)
+
+
+def resolve_imgsz(task: str, requested, width: Optional[int], height: Optional[int]) -> int:
+    """
+    imgsz aplicado: tamanho fixo do grafo exportado (se estático), senão o
+    pedido na requisição, senão IMGSZ_DEFAULT; "auto" usa o controlador de SLO.
+    """
+    fixed = model_backends.get(IMGSZ_TASK_MODEL.get(task, 'detect'), {}).get('static_imgsz')
+    if fixed:
+        return fixed
+    
+    requested = IMGSZ_DEFAULT if requested is None else requested
+    if str(requested) != 'auto':
+        return normalize_imgsz(int(requested))
+    return imgsz_controller(task).pick(task, width, height)
+
+
+# ==================== MICRO-BATCHING ====================
+
+class MicroBatcher:
+    """
+    Agrupa chamadas concorrentes em lotes para um único forward pass.
+    
+    Cada chamada entra numa fila; o worker espera até `window_ms` a partir da
+    requisição mais antiga (ou até o lote encher) e executa `run_batch` com
+    todos os payloads no pool de inferência. Enquanto todas as threads do pool
+    estão ocupadas a fila continua acumulando, o que aumenta o próximo lote.
+    Cada chamador recebe o próprio resultado.
+    """
+    def __init__(self, name: str, run_batch, window_ms: float, max_batch: int,
+                 executor: BoundedExecutor):
+        self.name = name
+        self.run_batch = run_batch
+        self.window_s = max(0.0, window_ms) / 1000
+        self.max_batch = max(1, max_batch)
+        self.executor = executor
+        self._queue: deque = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        # Lotes em execução; o teto é lido do pool a cada lote (o autotune pode redimensioná-lo)
+        self._running = 0
+        self._slot_freed: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        # Métricas
+        self.batch_sizes: Dict[int, int] = {}
+        self.total_batches = 0
+        self.total_items = 0
+        self.dropped = 0
+        self.queue_waits_ms = deque(maxlen=1000)
+    
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._slot_freed = asyncio.Event()
+            self._running = 0
+            self._worker = asyncio.create_task(self._run())
+    
+    async def submit(self, payload) -> tuple:
+        """Enfileira um payload e retorna (resultado, info do lote)"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((payload, future, time.perf_counter(), inference_guard.get()))
+        if len(self._queue) >= self.max_batch:
+            self._full.set()
+        self._wakeup.set()
+        return await future
+    
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._queue:
+                # Janela de coleta contada a partir da requisição mais antiga
+                remaining = self.window_s - (time.perf_counter() - self._queue[0][2])
+                if len(self._queue) < self.max_batch and remaining > 0:
+                    self._full.clear()
+                    try:
+                        await asyncio.wait_for(self._full.wait(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                
+                # Aguarda uma thread livre no pool antes de fechar o lote
+                while self._running >= self.executor.max_workers:
+                    self._slot_freed.clear()
+                    await self._slot_freed.wait()
+                self._running += 1
+                batch = []
+                while self._queue and len(batch) < self.max_batch:
+                    entry = self._queue.popleft()
+                    reason = entry[3]() if entry[3] else None
+                    if reason:
+                        # Prazo que não cabe mais: falha já, sem ocupar lugar no lote
+                        self.dropped += 1
+                        if not entry[1].done():
+                            entry[1].set_exception(DroppedRequestError(reason))
+                        continue
+                    batch.append(entry)
+                if batch:
+                    asyncio.create_task(self._dispatch(batch))
+                else:
+                    self._release_slot()
+    
+    def _release_slot(self):
+        self._running -= 1
+        self._slot_freed.set()
+    
+    async def _dispatch(self, batch: list):
+        # O lote não herda classe nem verificação de descarte da requisição que criou o worker
+        inference_class.set('bulk')
+        inference_guard.set(None)
+        dispatched_at = time.perf_counter()
+        waits = [(dispatched_at - enqueued_at) * 1000 for _, _, enqueued_at, _ in batch]
+        
+        try:
+            results = await self.executor.run(self.run_batch, [payload for payload, _, _, _ in batch])
+        except Exception as e:
+            logger.error(f"❌ Erro no lote {self.name}: {e}")
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._release_slot()
+        
+        size = len(batch)
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+        self.total_batches += 1
+        self.total_items += size
+        self.queue_waits_ms.extend(waits)
+        
+        for (_, future, _, _), result, wait_ms in zip(batch, results, waits):
+            if not future.done():
+                future.set_result((result, {
+                    'batch_size': size,
+                    'queue_wait_ms': round(wait_ms, 2)
+                }))
+    
+    def stats(self) -> dict:
+        """Distribuição de tamanhos de lote e espera na fila"""
+        waits = sorted(self.queue_waits_ms)
+        
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))], 2)
+        
+        return {
+            'window_ms': self.window_s * 1000,
+            'max_batch': self.max_batch,
+            'pending': len(self._queue),
+            'total_batches': self.total_batches,
+            'total_items': self.total_items,
+            'dropped': self.dropped,
+            'avg_batch_size': round(self.total_items / self.total_batches, 2) if self.total_batches else 0.0,
+            'batch_size_distribution': dict(sorted(self.batch_sizes.items())),
+            'queue_wait_ms': {
+                'p50': percentile(0.50),
+                'p90': percentile(0.90),
+                'p99': percentile(0.99),
+                'max': round(waits[-1], 2) if waits else 0.0
+            }
+        }
+
+
+def run_detect_batch(payloads: list, task: str) -> List[tuple]:
+    """Executa o lote da task; requisições com imgsz diferentes viram forward passes separados"""
+    groups: Dict[Optional[int], List[int]] = {}
+    for index, (_, _, _, imgsz) in enumerate(payloads):
+        groups.setdefault(imgsz, []).append(index)
+    
+    results = [None] * len(payloads)
+    for imgsz, indexes in groups.items():
+        group = [payloads[i] for i in indexes]
+        group_results = detect_objects_batch(
+            [image for image, _, _, _ in group],
+            [confidence for _, confidence, _, _ in group],
+            [max_det for _, _, max_det, _ in group],
+            task,
+            imgsz
+        )
+        for index, result in zip(indexes, group_results):
+            results[index] = result
+    return results
+
+
+# Um micro-batcher por task: classes filtradas e modelo de segmentação não se misturam no lote
+detect_batchers = {
+    task: MicroBatcher(
+        task,
+        functools.partial(run_detect_batch, task=task),
+        window_ms=BATCH_WINDOW_MS,
+        max_batch=BATCH_MAX_SIZE,
+        executor=inference_pool
+    )
+    for task in ("detect", "food_only", "segment")
+}
+
+
+# ==================== CACHE DE RESULTADOS ====================
+
+def content_hash(data: bytes) -> str:
+    """Hash do conteúdo da imagem (endereçamento do cache)"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """
+    Cache LRU de resultados de detecção, endereçado por conteúdo.
+    
+    A chave combina o hash da imagem com modelo e parâmetros da inferência.
+    O nível em memória é limitado por bytes e expira por TTL; o nível opcional
+    em disco (RESULT_CACHE_DIR) é compartilhado entre workers do uvicorn.
+    """
+    def __init__(self, max_bytes: int, ttl_s: float, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.disk_dir = disk_dir
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, size, value)
+        self._size = 0
+        self._last_disk_sweep = 0.0
+        # Métricas
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+    
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.blake2b('|'.join(str(p) for p in parts).encode(), digest_size=20).hexdigest()
+    
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+    
+    def _store_memory(self, key: str, value: Any, expires_at: float, size: int):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[1]
+        self._entries[key] = (expires_at, size, value)
+        self._size += size
+        while self._size > self.max_bytes and self._entries:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self.evictions += 1
+    
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry['expires_at'] < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry['expires_at'], entry['value']
+    
+    def _write_disk(self, key: str, value: Any, expires_at: float):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f)
+            os.replace(tmp_path, path)  # Escrita atômica entre workers
+        except OSError as e:
+            logger.warning(f"⚠️ Cache em disco: falha ao gravar {path}: {e}")
+        
+        # Limpeza periódica de entradas expiradas
+        now = time.time()
+        if now - self._last_disk_sweep > 600:
+            self._last_disk_sweep = now
+            self._sweep_disk(now)
+    
+    def _sweep_disk(self, now: float):
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) + self.ttl_s < now:
+                        os.remove(path)
+                except OSError:
+                    pass
+    
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] >= time.time():
+                self._entries.move_to_end(key)
+                self.hits_memory += 1
+                return entry[2]
+            self._size -= self._entries.pop(key)[1]
+        
+        if self.disk_dir:
+            disk_entry = await asyncio.to_thread(self._read_disk, key)
+            if disk_entry is not None:
+                expires_at, value = disk_entry
+                self._store_memory(key, value, expires_at, len(json.dumps(value)))
+                self.hits_disk += 1
+                return value
+        
+        self.misses += 1
+        return None
+    
+    async def put(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_s
+        self._store_memory(key, value, expires_at, len(json.dumps(value)))
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value, expires_at)
+    
+    def stats(self) -> dict:
+        hits = self.hits_memory + self.hits_disk
+        lookups = hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._size,
+            'max_bytes': self.max_bytes,
+            'ttl_s': self.ttl_s,
+            'disk_dir': self.disk_dir,
+            'hits_memory': self.hits_memory,
+            'hits_disk': self.hits_disk,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0
+        }
+
+
+result_cache = ResultCache(
+    max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+    ttl_s=RESULT_CACHE_TTL_S,
+    disk_dir=RESULT_CACHE_DIR or None
+)
+
+
+# ==================== CACHE PERCEPTUAL (QUASE DUPLICATAS) ====================
+
+def perceptual_hash(data: bytes) -> Optional[int]:
+    """dHash de 64 bits: tons de cinza decodificados a 1/8 (escala DCT), 9x8, gradiente horizontal"""
+    buffer = np.frombuffer(memoryview(data), dtype=np.uint8)
+    gray = cv2.imdecode(buffer, cv2.IMREAD_REDUCED_GRAYSCALE_8 | cv2.IMREAD_IGNORE_ORIENTATION)
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class PerceptualCache:
+    """
+    Índice de quase-duplicatas por dHash (imagens encaminhadas/reenviadas e
+    recomprimidas, onde o hash exato do conteúdo falha).
+    
+    Busca por distância de Hamming com multi-index hashing: o hash de 64 bits
+    é dividido em max_distance + 1 blocos; pela casa dos pombos, um hash a
+    distância <= max_distance coincide exatamente em pelo menos um bloco, então
+    só os candidatos desses buckets são comparados. Entradas são separadas por
+    namespace (modelo + parâmetros), limitadas a max_entries (LRU) e expiram por TTL.
+    """
+    def __init__(self, max_entries: int, max_distance: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.max_distance = max(0, max_distance)
+        self.ttl_s = ttl_s
+        
+        n_chunks = self.max_distance + 1
+        bounds = [64 * i // n_chunks for i in range(n_chunks + 1)]
+        self._chunks = [(start, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        
+        self._entries: OrderedDict = OrderedDict()  # (namespace, hash) -> (expires_at, largura, altura, valor)
+        self._buckets: Dict[tuple, set] = {}
+        # Métricas
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+    
+    def _bucket_keys(self, namespace: str, phash: int) -> List[tuple]:
+        return [(namespace, i, (phash >> shift) & mask) for i, (shift, mask) in enumerate(self._chunks)]
+    
+    def _remove(self, entry_key: tuple):
+        if self._entries.pop(entry_key, None) is None:
+            return
+        for bucket_key in self._bucket_keys(*entry_key):
+            bucket = self._buckets.get(bucket_key)
+            if bucket is not None:
+                bucket.discard(entry_key)
+                if not bucket:
+                    del self._buckets[bucket_key]
+    
+    def get(self, namespace: str, phash: int, width: int, height: int) -> Optional[tuple]:
+        """Resultado mais próximo dentro da distância e com a mesma proporção: (valor, largura, altura, distância)"""
+        now = time.time()
+        candidates = set()
+        for bucket_key in self._bucket_keys(namespace, phash):
+            candidates.update(self._buckets.get(bucket_key, ()))
+        
+        best = None
+        for entry_key in candidates:
+            expires_at, cached_width, cached_height, _ = self._entries[entry_key]
+            if expires_at < now:
+                self._remove(entry_key)
+                continue
+            # Recortes mudam a proporção: só aceita a mesma imagem reescalada
+            if abs(width * cached_height - height * cached_width) > 0.02 * width * cached_height:
+                continue
+            distance = (phash ^ entry_key[1]).bit_count()
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, entry_key)
+        
+        if best is None:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        self._entries.move_to_end(best[1])
+        _, cached_width, cached_height, value = self._entries[best[1]]
+        return value, cached_width, cached_height, best[0]
+    
+    def put(self, namespace: str, phash: int, width: int, height: int, value: Any):
+        entry_key = (namespace, phash)
+        self._remove(entry_key)
+        self._entries[entry_key] = (time.time() + self.ttl_s, width, height, value)
+        for bucket_key in self._bucket_keys(namespace, phash):
+            self._buckets.setdefault(bucket_key, set()).add(entry_key)
+        
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'max_distance': self.max_distance,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions
+        }
+
+
+perceptual_cache = PerceptualCache(
+    max_entries=PHASH_CACHE_MAX_ENTRIES,
+    max_distance=PHASH_MAX_DISTANCE,
+    ttl_s=RESULT_CACHE_TTL_S
+)
+
+
+def rescale_cached_items(items: List[dict], sx: float, sy: float) -> List[dict]:
+    """Ajusta bbox, área e máscara de um resultado em cache às dimensões da nova imagem"""
+    if abs(sx - 1.0) < 1e-6 and abs(sy - 1.0) < 1e-6:
+        return items
+    rescaled = []
+    for item in items:
+        x, y, w, h = item['bbox']
+        item = {**item, 'bbox': [x * sx, y * sy, w * sx, h * sy], 'area': round(item['area'] * sx * sy, 2)}
+        if item.get('mask'):
+            item['mask'] = [[round(px * sx, 1), round(py * sy, 1)] for px, py in item['mask']]
+        rescaled.append(item)
+    return rescaled
+
+
+async def lookup_near_duplicate(image_bytes: bytes, namespace: str, width: Optional[int],
+                                height: Optional[int], timing: dict) -> tuple:
+    """
+    Consulta o cache perceptual. Retorna (valor ou None, fatores de escala,
+    phash) — o phash é reaproveitado para gravar o resultado em caso de miss.
+    """
+    if not perceptual_cache.enabled or not width or not height:
+        return None, None, None
+    phash = await inference_pool.run(perceptual_hash, image_bytes)
+    if phash is None:
+        return None, None, None
+    
+    match = perceptual_cache.get(namespace, phash, width, height)
+    if match is None:
+        return None, None, phash
+    value, cached_width, cached_height, distance = match
+    timing['phash_distance'] = distance
+    return value, (width / cached_width, height / cached_height), phash
+
+
+async def run_detection(image_bytes: bytes, confidence: float, timing: dict,
+                        bypass_cache: bool = False, task: str = "detect",
+                        max_detections: int = 100, imgsz=None, tiles: Optional[tuple] = None) -> tuple:
+    """
+    Detecção com cache por conteúdo: decode e inferência (micro-batching,
+    ou tiles quando `tiles` = (tile_size, overlap, max_tiles)) só acontecem
+    em cache miss (exato ou perceptual). Retorna (objetos, inference_time_ms,
+    cache_match: 'exact' | 'perceptual' | None, imgsz aplicado).
+    """
+    if tiles and task == "segment":
+        raise HTTPException(status_code=400, detail="tiling não suporta task=segment")
+    
+    digest, width, height = await inference_pool.run(probe_image_bytes, image_bytes)
+    applied_imgsz = tile_imgsz(task, tiles[0]) if tiles else resolve_imgsz(task, imgsz, width, height)
+    # Versão ativa na chave: depois de uma troca a quente o cache não devolve resultados do modelo antigo
+    params = (models.version_of('segment' if task == "segment" else 'detect'), confidence, task, max_detections,
+              applied_imgsz, tiles)
+    cache_key = result_cache.make_key(digest, *params)
+    namespace = result_cache.make_key(*params)
+    phash = None
+    if not bypass_cache:
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            return cached['objects'], cached['inference_time_ms'], 'exact', applied_imgsz
+        
+        # Quase duplicata (reenvio recomprimido/redimensionado): reaproveita o resultado reescalado
+        cached, factors, phash = await lookup_near_duplicate(image_bytes, namespace, width, height, timing)
+        if cached is not None:
+            objects = rescale_cached_items(cached['objects'], *factors)
+            return objects, cached['inference_time_ms'], 'perceptual', applied_imgsz
+    
+    target_size = tile_decode_target(tiles[0], tiles[2]) if tiles else applied_imgsz
+    image = await decode_request_image(image_bytes, timing, target_size=target_size)
+    if image is None:
+        raise HTTPException(status_code=400, detail="Não foi possível decodificar a imagem.")
+    
+    if tiles:
+        objects, inference_time, timing['tiles'] = await inference_pool.run(
+            detect_objects_tiled, image, confidence, max_detections, task, applied_imgsz, *tiles
+        )
+    else:
+        (objects, inference_time, stages), batch_info = await detect_batchers[task].submit(
+            (image, confidence, max_detections, applied_imgsz)
+        )
+        timing.update(batch_info)
+        timing.update(stages)
+        if inference_time > 0:
+            imgsz_controller(task).observe(batch_info['queue_wait_ms'] + inference_time)
+    
+    # Falhas de inferência retornam tempo 0 e não devem ser cacheadas
+    if inference_time > 0:
+        value = {'objects': objects, 'inference_time_ms': inference_time}
+        await result_cache.put(cache_key, value)
+        if phash is not None:
+            perceptual_cache.put(namespace, phash, image.orig_width, image.orig_height, value)
+    return objects, inference_time, None, applied_imgsz
+
+
+# ==================== SERIALIZAÇÃO ====================
+
+class FastJSONResponse(JSONResponse):
+    """JSON serializado com orjson direto dos dicts/listas (sem modelos pydantic por item)"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def compact_detections(objects: List[dict]) -> dict:
+    """Objetos de detecção → arrays paralelos (boxes achatadas: x, y, w, h, x, y, w, h, ...)"""
+    compact = {
+        'boxes': [v for obj in objects for v in obj['bbox']],
+        'class_ids': [obj.get('class_id') for obj in objects],
+        'confidences': [obj['confidence'] for obj in objects],
+        'is_food': [obj['is_food'] for obj in objects],
+        'classes': {obj.get('class_id'): obj['class_name_pt'] for obj in objects}
+    }
+    if any('mask' in obj for obj in objects):
+        compact['masks'] = [obj.get('mask') for obj in objects]
+    return compact
+
+
+def compact_prompt_detections(detections: List[dict], prompts: List[str]) -> dict:
+    """Detecções YOLOE → arrays paralelos (prompt_ids indexam prompts_used; -1 = classe desconhecida)"""
+    prompt_index = {prompt: i for i, prompt in enumerate(prompts)}
+    return {
+        'boxes': [v for det in detections for v in det['bbox']],
+        'prompt_ids': [prompt_index.get(det['prompt'], -1) for det in detections],
+        'confidences': [det['confidence'] for det in detections]
+    }
+
+
+def compact_keypoints(keypoints: List[dict]) -> dict:
+    """Keypoints → matriz Nx3 [x, y, confiança] na ordem de ids"""
+    return {
+        'ids': [k['id'] for k in keypoints],
+        'points': [[k['x'], k['y'], k['confidence']] for k in keypoints]
+    }
+
+
+def check_response_fields(params: ResponseFormatParams, response_model) -> None:
+    """Valida a seleção de campos antes da inferência (422 para campos inexistentes)"""
+    if params.fields:
+        unknown = sorted(set(params.fields) - set(response_model.model_fields) - {'format'})
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Campos desconhecidos: {unknown}. Disponíveis: {sorted(response_model.model_fields)}"
+            )
+
+
+def shape_payload(payload: dict, params: ResponseFormatParams, compact: Dict[str, Callable]) -> dict:
+    """Aplica o formato compacto (arrays paralelos por campo) e a seleção de campos"""
+    if params.format == "compact":
+        payload = {**payload, **{key: fn(payload[key]) for key, fn in compact.items() if key in payload}}
+        payload['format'] = "compact"
+    if params.fields:
+        selected = {'success': payload['success']}
+        selected.update((key, payload[key]) for key in params.fields if key in payload)
+        return selected
+    return payload
 
 
 # ==================== ENDPOINTS ====================
 
+# ==================== MÉTRICAS (PROMETHEUS) ====================
+
+# Buckets de latência em segundos (unidade base do Prometheus)
+LATENCY_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Chave do dict de timing → etapa registrada no histograma
+TIMING_STAGES = {
+    'fetch_ms': 'fetch',
+    'decode_ms': 'decode',
+    'queue_wait_ms': 'queue_wait',
+    'preprocess_ms': 'preprocess',
+    'inference_ms': 'inference',
+    'postprocess_ms': 'postprocess',
+    'serialize_ms': 'serialize',
+}
+
+
+class Histogram:
+    """Histograma de latência com buckets fixos (contagens não cumulativas; acumuladas na exposição)"""
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS_S):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Último = +Inf
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class StageMetrics:
+    """
+    Histogramas de latência por (endpoint, modelo, etapa). Observações e
+    exposição acontecem no event loop, sem concorrência entre threads.
+    Em prefork cada worker tem os próprios contadores (label pid no /metrics).
+    """
+    def __init__(self):
+        self.histograms: Dict[tuple, Histogram] = {}
+        self.requests: Dict[tuple, int] = {}
+        self.dropped: Dict[tuple, int] = {}
+    
+    def observe(self, endpoint: str, model_name: str, stage: str, seconds: float):
+        key = (endpoint, model_name, stage)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(seconds)
+    
+    def count_dropped(self, endpoint: str, reason: str):
+        self.dropped[(endpoint, reason)] = self.dropped.get((endpoint, reason), 0) + 1
+    
+    def observe_timing(self, endpoint: str, model_name: str, timing: dict):
+        """Registra as etapas presentes no dict de timing de uma requisição"""
+        self.requests[(endpoint, model_name)] = self.requests.get((endpoint, model_name), 0) + 1
+        for key, stage in TIMING_STAGES.items():
+            value = timing.get(key)
+            if isinstance(value, (int, float)):
+                self.observe(endpoint, model_name, stage, value / 1000)
+
+
+stage_metrics = StageMetrics()
+
+
+def metrics_response(payload: dict, endpoint: str, model_name: str, timing: dict) -> FastJSONResponse:
+    """Serializa a resposta e registra as etapas da requisição (serialize incluso) nos histogramas"""
+    start = time.perf_counter()
+    response = FastJSONResponse(payload)
+    stage_metrics.observe_timing(endpoint, model_name, {
+        **timing, 'serialize_ms': (time.perf_counter() - start) * 1000
+    })
+    return response
+
+
+def process_rss_bytes() -> Optional[int]:
+    """Memória residente do processo (VmRSS de /proc/self/status)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def prometheus_labels(**labels) -> str:
+    """{nome="valor",...} com escape de barra invertida, aspas e quebra de linha"""
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def render_metrics() -> str:
+    """Texto no formato de exposição do Prometheus (0.0.4)"""
+    pid = os.getpid()
+    lines = []
+    
+    def metric(name: str, kind: str, help_text: str, samples: list):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{prometheus_labels(pid=pid, **labels)} {value}")
+    
+    histogram_samples = []
+    for (endpoint, model_name, stage), histogram in sorted(stage_metrics.histograms.items()):
+        labels = {'endpoint': endpoint, 'model': model_name, 'stage': stage}
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            histogram_samples.append(('_bucket', {**labels, 'le': bound}, cumulative))
+        histogram_samples.append(('_bucket', {**labels, 'le': '+Inf'}, histogram.count))
+        histogram_samples.append(('_sum', labels, round(histogram.sum, 6)))
+        histogram_samples.append(('_count', labels, histogram.count))
+    metric('yolo_stage_duration_seconds', 'histogram',
+           'Latência por etapa (fetch, decode, queue_wait, preprocess, inference, postprocess, serialize)',
+           histogram_samples)
+    metric('yolo_requests_total', 'counter', 'Requisições atendidas por endpoint e modelo', [
+        ('', {'endpoint': endpoint, 'model': model_name}, count)
+        for (endpoint, model_name), count in sorted(stage_metrics.requests.items())
+    ])
+    
+    metric('yolo_requests_dropped_total', 'counter', 'Requisições descartadas sem inferência (deadline, superseded)', [
+        ('', {'endpoint': endpoint, 'reason': reason}, count)
+        for (endpoint, reason), count in sorted(stage_metrics.dropped.items())
+    ])
+    
+    metric('yolo_pose_sessions_active', 'gauge', 'Sessões de pose ativas neste processo',
+           [('', {}, len(pose_session_states))])
+    pool = inference_pool.stats()
+    metric('yolo_inference_in_flight', 'gauge', 'Requisições admitidas no pool de inferência',
+           [('', {}, pool['in_flight'])])
+    metric('yolo_inference_queue_depth', 'gauge', 'Trabalhos aguardando uma thread de inferência por classe', [
+        ('', {'class': name}, stats['queued']) for name, stats in pool['classes'].items()
+    ])
+    queue_wait_samples = []
+    for name in PRIORITY_CLASSES:
+        for quantile, key in ((0.5, 'p50'), (0.9, 'p90'), (0.99, 'p99')):
+            queue_wait_samples.append(('', {'class': name, 'quantile': quantile},
+                                       round(pool['classes'][name]['queue_wait_ms'][key] / 1000, 6)))
+        queue_wait_samples.append(('_sum', {'class': name}, round(inference_pool.wait_sum_ms[name] / 1000, 6)))
+        queue_wait_samples.append(('_count', {'class': name}, pool['classes'][name]['dispatched']))
+    metric('yolo_scheduler_queue_wait_seconds', 'summary', 'Espera na fila do pool de inferência por classe',
+           queue_wait_samples)
+    metric('yolo_inference_rejected_total', 'counter', 'Requisições recusadas com 503 (fila cheia)',
+           [('', {}, pool['rejected'])])
+    metric('yolo_batch_queue_depth', 'gauge', 'Itens aguardando no micro-batcher por task', [
+        ('', {'task': task}, batcher.stats()['pending']) for task, batcher in detect_batchers.items()
+    ])
+    
+    rss = process_rss_bytes()
+    if rss is not None:
+        metric('process_resident_memory_bytes', 'gauge', 'Memória residente do processo (RSS)', [('', {}, rss)])
+    
+    registry = models.stats()['models']
+    metric('yolo_model_loaded', 'gauge', 'Modelo na memória deste processo (1) ou não (0)', [
+        ('', {'model': kind, 'resident': str(info['resident']).lower()}, int(info['loaded']))
+        for kind, info in registry.items()
+    ])
+    metric('yolo_model_memory_bytes', 'gauge', 'Memória estimada de cada modelo carregado', [
+        ('', {'model': kind}, models.memory_bytes.get(kind, 0)) for kind, info in registry.items() if info['loaded']
+    ])
+    metric('yolo_model_loads_total', 'counter', 'Cargas de modelo (startup e sob demanda)', [
+        ('', {'model': kind}, info['loads']) for kind, info in registry.items()
+    ])
+    metric('yolo_model_load_seconds_total', 'counter', 'Tempo gasto carregando modelos', [
+        ('', {'model': kind}, info['load_seconds']) for kind, info in registry.items()
+    ])
+    metric('yolo_model_unloads_total', 'counter', 'Descargas de modelo por motivo (idle, memory)', [
+        ('', {'model': kind, 'reason': reason}, count)
+        for (kind, reason), count in sorted(models.unloads.items())
+    ])
+    metric('yolo_model_info', 'gauge', 'Pesos e versão ativos de cada modelo', [
+        ('', {'model': kind, 'weights': models.weights_of(kind), 'version': models.version_of(kind),
+              'revision': models.active[kind]['revision']}, 1)
+        for kind in models.kinds
+    ])
+    metric('yolo_model_swaps_total', 'counter', 'Trocas a quente por resultado (swap, rollback, failed)', [
+        ('', {'model': kind, 'result': result}, count)
+        for (kind, result), count in sorted(models.swap_counts.items())
+    ])
+    
+    shadow_report = shadow.report()['models']
+    metric('yolo_shadow_samples_total', 'counter', 'Requisições avaliadas também no candidato do shadow', [
+        ('', {'model': kind, 'candidate': info['candidate']['version'] or info['candidate']['weights']},
+         info['counters'].get('evaluated', 0))
+        for kind, info in shadow_report.items()
+    ])
+    metric('yolo_shadow_dropped_total', 'counter', 'Amostras do shadow descartadas (fila cheia, pool ocupado, erro)', [
+        ('', {'model': kind, 'reason': reason}, info['counters'].get(key, 0))
+        for kind, info in shadow_report.items()
+        for reason, key in (('queue_full', 'dropped_queue_full'), ('busy', 'dropped_busy'), ('error', 'errors'))
+    ])
+    metric('yolo_shadow_latency_delta_ms', 'gauge', 'p50 do candidato menos p50 do modelo ativo (janela móvel)', [
+        ('', {'model': kind}, info['latency_ms']['delta_p50'])
+        for kind, info in shadow_report.items() if info['latency_ms']['delta_p50'] is not None
+    ])
+    metric('yolo_shadow_agreement', 'gauge', 'Concordância média candidato × ativo (IoU, classe, keypoints)', [
+        ('', {'model': kind, 'metric': name}, value)
+        for kind, info in shadow_report.items() for name, value in info['agreement'].items() if value is not None
+    ])
+    
+    result = result_cache.stats()
+    perceptual = perceptual_cache.stats()
+    metric('yolo_cache_hits_total', 'counter', 'Acertos de cache', [
+        ('', {'cache': 'result', 'tier': 'memory'}, result['hits_memory']),
+        ('', {'cache': 'result', 'tier': 'disk'}, result['hits_disk']),
+        ('', {'cache': 'perceptual', 'tier': 'memory'}, perceptual['hits']),
+    ])
+    metric('yolo_cache_misses_total', 'counter', 'Falhas de cache', [
+        ('', {'cache': 'result'}, result['misses']),
+        ('', {'cache': 'perceptual'}, perceptual['misses']),
+    ])
+    metric('yolo_cache_hit_ratio', 'gauge', 'Taxa de acerto acumulada do cache', [
+        ('', {'cache': 'result'}, result['hit_rate']),
+        ('', {'cache': 'perceptual'}, perceptual['hit_rate']),
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    """Backpressure: responde rápido com 503 + Retry-After em vez de acumular latência"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(OVERLOAD_RETRY_AFTER_S)}
+    )
+
+
+@app.exception_handler(ModelUnavailableError)
+async def model_unavailable_handler(request: Request, exc: ModelUnavailableError):
+    """Modelo que falhou ao carregar (sob demanda ou no startup) ou que ainda está subindo (Retry-After)"""
+    headers = {"Retry-After": str(OVERLOAD_RETRY_AFTER_S)} if isinstance(exc, ModelLoadingError) else None
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers=headers)
+
+
+@app.exception_handler(ImageTooLargeError)
+async def image_too_large_handler(request: Request, exc: ImageTooLargeError):
+    """Imagem acima do limite de bytes ou de pixels por requisição"""
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+
+def dropped_request_status(exc: DroppedRequestError) -> tuple:
+    """(status, corpo) de uma requisição descartada: 409 se um frame mais novo a substituiu, 504 se o prazo não cabia mais"""
+    superseded = exc.reason == 'superseded'
+    return 409 if superseded else 504, {
+        'detail': 'Frame substituído por um mais novo da sessão' if superseded
+                  else 'Prazo da requisição estourado - descartada sem inferência',
+        'reason': exc.reason,
+        'dropped': True,
+        **exc.context
+    }
+
+
+@app.exception_handler(DroppedRequestError)
+async def dropped_request_handler(request: Request, exc: DroppedRequestError):
+    """Descartada sem inferência (ver dropped_request_status)"""
+    stage_metrics.count_dropped(request.url.path, exc.reason)
+    status_code, content = dropped_request_status(exc)
+    return JSONResponse(status_code=status_code, content=content)
+
+
+async def inference_admission():
+    """Dependência: reserva uma vaga no pool de inferência durante a requisição"""
+    with inference_pool.admit():
+        yield
+
+
+async def realtime_admission():
+    """Dependência dos endpoints de pose: vaga e fila realtime (passa à frente da detecção)"""
+    inference_class.set('realtime')
+    with inference_pool.admit('realtime'):
+        yield
+
+
 @app.get("/")
 async def root():
     """Informações do serviço"""
     return {
         "service": "YOLO Food Detection Service",
         "version": "2.0.0",
-        "model": YOLO_MODEL,
-        "status": "running" if model else "model_not_loaded",
+        "model": models.weights_of('detect'),
+        "status": "running" if models.items() else "model_not_loaded",
         "endpoints": {
             "health": "/health",
+            "ready": "/ready",
             "detect": "POST /detect",
             "detect_upload": "POST /detect/upload",
+            "detect_raw": "POST /detect/raw",
+            "detect_prompt_raw": "POST /detect/prompt/raw",
+            "pose_analyze_raw": "POST /pose/analyze/raw",
+            "detect_batch": "POST /detect/batch (NDJSON)",
             "classes": "/classes",
-            "benchmark": "/benchmark"
+            "benchmark": "/benchmark?compare_backends=true",
+            "stats": "/stats",
+            "metrics": "/metrics",
+            "shadow_report": "/shadow/report"
         }
     }
 
@@ -492,90 +3531,153 @@ async def health_check():
         pass
     
     return {
-        "status": "healthy" if model else "degraded",
+        "status": "healthy" if all(models.loaded(kind) for kind in models.resident) else "degraded",
         "service": "yolo-food-detection",
         "version": "2.1.0",
-        "model_loaded": model is not None,
-        "model_name": YOLO_MODEL,
+        "model_loaded": models.loaded('detect'),
+        "model_name": models.weights_of('detect'),
+        "model_version": models.version_of('detect'),
         "ultralytics_version": ultralytics_version,
-        "confidence_threshold": YOLO_CONF
+        "confidence_threshold": YOLO_CONF,
+        "models": models.stats(),
+        "process": process_stats()
     }
 
 
-@app.post("/detect", response_model=DetectionResponse)
+@app.get("/ready")
+async def readiness():
+    """Readiness: estado de cada modelo (loading/warming/ready/failed); 503 até os residentes ficarem prontos"""
+    report = models.readiness()
+    return JSONResponse(status_code=200 if report['ready'] else 503, content=report)
+
+
+@app.get("/ready/{model_kind}")
+async def model_readiness(model_kind: str):
+    """Readiness de um modelo: 200 quando pronto (não residentes ainda não carregados contam como prontos sob demanda)"""
+    report = models.readiness()['models'].get(model_kind)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {model_kind} (opções: {', '.join(models.kinds)})")
+    ready = report['state'] == 'ready' or (report['state'] == 'unloaded' and not report['resident'])
+    return JSONResponse(status_code=200 if ready else 503, content={'model': model_kind, 'ready': ready, **report})
+
+
+@app.post("/detect", response_model=DetectionResponse, dependencies=[Depends(inference_admission)])
 async def detect(request: DetectionRequest):
     """Endpoint principal para detecção de objetos"""
     
-    # Obter imagem
-    image = None
-    
-    if request.image_url:
-        image = download_image(request.image_url)
-    elif request.image_base64:
-        image = decode_base64_image(request.image_base64)
+    # Obter imagem (download e decode fora do event loop)
+    timing = {}
+    image_bytes = await read_request_image(request.image_url, request.image_base64, timing)
     
-    if image is None:
+    if image_bytes is None:
         raise HTTPException(
             status_code=400,
             detail="Não foi possível obter a imagem. Forneça image_url ou image_base64."
         )
     
-    # Detectar objetos
-    objects, inference_time = detect_objects(image, request.confidence)
-    
-    # Filtrar alimentos
-    food_objects = [obj for obj in objects if obj.is_food]
-    
-    # Limitar resultados
-    objects = objects[:request.max_detections]
-    food_objects = food_objects[:request.max_detections]
-    
-    return DetectionResponse(
-        success=True,
-        objects=objects,
-        food_objects=food_objects,
-        total_objects=len(objects),
-        total_food=len(food_objects),
-        inference_time_ms=round(inference_time, 2),
-        model_version=YOLO_MODEL,
-        message=f"Detectados {len(food_objects)} alimentos de {len(objects)} objetos"
+    return metrics_response(
+        await detect_image_bytes(request, image_bytes, timing), "/detect", detection_model_name(request.task), timing
     )
 
 
-@app.post("/detect/upload")
+async def detect_image_bytes(request: DetectionRequest, image_bytes: bytes, timing: dict) -> dict:
+    """
+    Detecção a partir dos bytes da imagem (compartilhado entre /detect e /detect/raw).
+    Retorna o payload de DetectionResponse como dict, já no formato pedido.
+    """
+    check_response_fields(request, DetectionResponse)
+    models.ensure_ready('segment' if request.task == "segment" else 'detect')
+    apply_guard(deadline_guard(request_deadline(request), request.task))
+    
+    # Detectar objetos (cache por conteúdo + micro-batching); task e limite já aplicados no modelo
+    objects, inference_time, cache_match, imgsz = await run_detection(
+        image_bytes, request.confidence, timing, request.bypass_cache,
+        request.task, request.max_detections, request.imgsz, request.tile_config()
+    )
+    if cache_match is None and not request.tile_config():
+        shadow.offer('segment' if request.task == "segment" else 'detect', image_bytes, {
+            'confidence': request.confidence, 'max_detections': request.max_detections,
+            'task': request.task, 'imgsz': imgsz
+        }, objects, inference_time)
+    
+    # Filtrar alimentos (em food_only o modelo só retorna alimentos)
+    food_objects = objects if request.task == "food_only" else [obj for obj in objects if obj['is_food']]
+    
+    return shape_payload({
+        'success': True,
+        'objects': objects,
+        'food_objects': food_objects,
+        'total_objects': len(objects),
+        'total_food': len(food_objects),
+        'inference_time_ms': round(inference_time, 2),
+        'model_version': detection_model_name(request.task),
+        'message': f"Detectados {len(food_objects)} alimentos de {len(objects)} objetos",
+        'task': request.task,
+        'imgsz': imgsz,
+        'timing': timing,
+        'cached': cache_match is not None,
+        'cache_match': cache_match
+    }, request, {'objects': compact_detections, 'food_objects': compact_detections})
+
+
+@app.post("/detect/upload", dependencies=[Depends(inference_admission)])
 async def detect_upload(
     file: UploadFile = File(...),
-    confidence: float = 0.35
+    confidence: float = 0.35,
+    task: DetectionTask = "detect",
+    max_detections: int = Query(100, ge=1, le=300),
+    imgsz: Optional[str] = None,
+    format: Literal["full", "compact"] = "full",
+    fields: Optional[str] = None,
+    bypass_cache: bool = False
 ):
     """Detecção via upload de arquivo"""
     
     try:
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert('RGB')
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao processar imagem: {e}")
     
-    objects, inference_time = detect_objects(image, confidence)
-    food_objects = [obj for obj in objects if obj.is_food]
-    
-    return DetectionResponse(
-        success=True,
-        objects=objects,
-        food_objects=food_objects,
-        total_objects=len(objects),
-        total_food=len(food_objects),
-        inference_time_ms=round(inference_time, 2),
-        model_version=YOLO_MODEL,
-        message=f"Detectados {len(food_objects)} alimentos"
+    try:
+        request = DetectionRequest(
+            confidence=confidence, task=task, max_detections=max_detections,
+            imgsz=imgsz, format=format, fields=fields.split(',') if fields else None,
+            bypass_cache=bypass_cache
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json(include_url=False)))
+    timing = {}
+    return metrics_response(
+        await detect_image_bytes(request, contents, timing), "/detect/upload", detection_model_name(request.task), timing
     )
 
 
+@app.get("/stats")
+async def runtime_stats():
+    """Métricas de execução (pool de inferência, downloads, cache e micro-batching)"""
+    return {
+        "executor": inference_pool.stats(),
+        "fetcher": image_fetcher.stats(),
+        "result_cache": result_cache.stats(),
+        "perceptual_cache": perceptual_cache.stats(),
+        "batching": {task: batcher.stats() for task, batcher in detect_batchers.items()},
+        "imgsz": {name: controller.stats() for name, controller in imgsz_controllers.items()}
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas no formato Prometheus: latência por etapa/endpoint/modelo, filas, sessões, RSS e caches"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/classes")
 async def get_classes():
     """Retorna classes suportadas"""
     all_classes = {}
-    if model:
-        all_classes = model.names
+    if models.available('detect'):
+        models.ensure_ready('detect')
+        all_classes = (await inference_pool.run(models.require, 'detect')).names
     
     return {
         "food_classes": FOOD_CLASS_IDS,
@@ -585,24 +3687,18 @@ async def get_classes():
     }
 
 
-@app.get("/benchmark")
-async def benchmark():
-    """Benchmark do modelo"""
-    if model is None:
-        raise HTTPException(status_code=503, detail="Modelo não carregado")
-    
-    # Criar imagem de teste
+def benchmark_model(bench_model, runs: int = 3) -> List[dict]:
+    """Mede a latência média do modelo em imagens sintéticas de 320, 640 e 1280"""
     test_sizes = [(320, 320), (640, 640), (1280, 1280)]
     results = []
     
     for size in test_sizes:
         dummy_img = np.random.randint(0, 255, (*size, 3), dtype=np.uint8)
-        pil_img = Image.fromarray(dummy_img)
         
         times = []
-        for _ in range(3):
+        for _ in range(runs):
             start = time.time()
-            model(pil_img, verbose=False)
+            bench_model(dummy_img, verbose=False)
             times.append((time.time() - start) * 1000)
         
         avg_time = sum(times) / len(times)
@@ -612,39 +3708,509 @@ async def benchmark():
             "fps": round(1000 / avg_time, 1)
         })
     
+    return results
+
+
+def imgsz_curve(bench_model, sizes: List[int], conf: float = 0.25) -> dict:
+    """
+    Curva precisão/latência por imgsz. Com BENCHMARK_CORPUS, mede a latência
+    média em cada tamanho e a concordância com o maior tamanho (referência):
+    recall de caixas, IoU médio e classes. Sem corpus, só latência sintética.
+    """
+    from quantization import list_images, result_arrays, compare_results, empty_drift_stats, summarize_drift
+    
+    paths = list_images(BENCHMARK_CORPUS, BENCHMARK_MAX_IMAGES) if os.path.isdir(BENCHMARK_CORPUS) else []
+    images = [img for img in (cv2.imread(p, cv2.IMREAD_COLOR) for p in paths) if img is not None]
+    synthetic = not images
+    if synthetic:
+        images = [np.random.randint(0, 255, (1080, 1440, 3), dtype=np.uint8)] * 3
+    
+    reference_size = sizes[-1]
+    references = [] if synthetic else [
+        result_arrays(bench_model(img, imgsz=reference_size, conf=conf, verbose=False)[0]) for img in images
+    ]
+    
+    curve = []
+    for size in sizes:
+        bench_model(images[0], imgsz=size, verbose=False)  # Warmup do tamanho
+        stats = empty_drift_stats()
+        times = []
+        for index, img in enumerate(images):
+            start = time.time()
+            result = bench_model(img, imgsz=size, conf=conf, verbose=False)[0]
+            times.append((time.time() - start) * 1000)
+            if not synthetic:
+                compare_results(references[index], result_arrays(result), stats)
+        
+        avg_time = sum(times) / len(times)
+        entry = {'imgsz': size, 'avg_inference_ms': round(avg_time, 2), 'fps': round(1000 / avg_time, 1)}
+        if not synthetic:
+            summary = summarize_drift(stats, len(images))
+            entry.update({k: summary[k] for k in ('box_recall', 'mean_iou', 'class_agreement')})
+        curve.append(entry)
+    
     return {
-        "model": YOLO_MODEL,
-        "benchmarks": results,
+        'corpus': None if synthetic else BENCHMARK_CORPUS,
+        'images': 0 if synthetic else len(images),
+        'reference_imgsz': reference_size,
+        'latency_target_ms': LATENCY_TARGET_MS,
+        'curve': curve
+    }
+
+
+def compare_backend_benchmarks() -> List[dict]:
+    """Benchmark lado a lado de PyTorch, ONNX Runtime e OpenVINO para os pesos ativos de detecção"""
+    weights = models.weights_of('detect')
+    active = model_backends.get('detect', {}).get('backend')
+    comparison = []
+    
+    for backend in SUPPORTED_BACKENDS:
+        entry = {'backend': backend, 'path': backend_artifact(weights, backend), 'active': backend == active}
+        if backend == active:
+            entry['benchmarks'] = benchmark_model(models.require('detect'))
+        elif backend != 'pytorch' and not os.path.exists(entry['path']):
+            entry['error'] = 'artefato não exportado'
+        elif not backend_runtime_available(backend):
+            entry['error'] = 'runtime não instalado'
+        else:
+            try:
+                candidate, _ = load_model_with_backend(weights, task='detect', requested=backend)
+                candidate(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)  # Warmup
+                entry['benchmarks'] = benchmark_model(candidate)
+                del candidate
+            except Exception as e:
+                entry['error'] = str(e)
+        comparison.append(entry)
+    
+    # Speedup em 640x640 relativo ao PyTorch
+    baseline = next((c for c in comparison if c['backend'] == 'pytorch' and 'benchmarks' in c), None)
+    if baseline:
+        base_ms = baseline['benchmarks'][1]['avg_inference_ms']
+        for entry in comparison:
+            if 'benchmarks' in entry:
+                entry['speedup_vs_pytorch_640'] = round(base_ms / entry['benchmarks'][1]['avg_inference_ms'], 2)
+    
+    return comparison
+
+
+@app.get("/benchmark")
+async def benchmark(compare_backends: bool = False, imgsz_curve_enabled: bool = Query(True, alias="imgsz_curve")):
+    """
+    Benchmark do modelo (compare_backends=true compara PyTorch, ONNX e OpenVINO;
+    imgsz_curve traz a curva precisão/latência por resolução)
+    """
+    models.ensure_ready('detect')
+    model = await inference_pool.run(models.require, 'detect')
+    
+    response = {
+        "model": models.weights_of('detect'),
+        "version": models.version_of('detect'),
+        "backend": model_backends.get('detect', {}).get('backend', 'pytorch'),
+        "benchmarks": await inference_pool.run(benchmark_model, model),
         "recommendation": "Use 640x640 para melhor balanço velocidade/precisão"
     }
+    if imgsz_curve_enabled:
+        fixed = model_backends.get('detect', {}).get('static_imgsz')
+        response["imgsz_curve"] = await inference_pool.run(
+            imgsz_curve, model, [fixed] if fixed else IMGSZ_CHOICES
+        )
+    if compare_backends:
+        response["backend_comparison"] = await inference_pool.run(compare_backend_benchmarks)
+    return response
 
 
 @app.get("/model/info")
 async def model_info():
     """Informações detalhadas do modelo"""
-    if model is None:
-        raise HTTPException(status_code=503, detail="Modelo não carregado")
+    models.ensure_ready('detect')
+    model = await inference_pool.run(models.require, 'detect')
     
     return {
-        "model_name": YOLO_MODEL,
+        "model_name": models.weights_of('detect'),
+        "version": models.version_of('detect'),
         "task": model.task,
         "names": model.names,
         "num_classes": len(model.names),
         "input_size": 640,
-        "yoloe_available": model_yoloe is not None,
-        "yoloe_model": YOLOE_MODEL if model_yoloe else None
+        "yoloe_available": models.available('yoloe'),
+        "yoloe_model": models.weights_of('yoloe') if models.available('yoloe') else None,
+        "segment_model": models.weights_of('segment'),
+        "segment_loaded": models.loaded('segment'),
+        # Versão ativa/anterior de cada modelo (troca a quente em /admin/models)
+        "versions": models.versions(),
+        "models": models.stats(),
+        "inference_backend": INFERENCE_BACKEND,
+        "backends": model_backends,
+        "cpu": cpu_info()
+    }
+
+
+# ==================== ADMIN: TROCA DE MODELO A QUENTE ====================
+
+class ModelSwapRequest(BaseModel):
+    """Pesos novos: caminho local (.pt, com .onnx/_openvino_model ao lado) ou nome de um modelo do ultralytics"""
+    weights: str = Field(..., min_length=1)
+    version: Optional[str] = None  # Rótulo exibido em /model/info (padrão: nome@sha256 do arquivo)
+
+
+async def admin_auth(request: Request):
+    """Endpoints de admin: token em X-Admin-Token ou Authorization: Bearer (desligados sem ADMIN_TOKEN)"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin desabilitado (defina ADMIN_TOKEN)")
+    token = request.headers.get('x-admin-token') or request.headers.get('authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Token de admin inválido")
+
+
+def check_model_kind(model_kind: str) -> None:
+    if model_kind not in models.kinds:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {model_kind} (opções: {', '.join(models.kinds)})")
+    if models.swap_in_progress(model_kind):
+        raise HTTPException(status_code=409, detail=f"Troca de {model_kind} já em andamento")
+
+
+def swap_scope() -> str:
+    """Alcance de uma troca: todos os workers (MODEL_SWAP_FILE) ou só o processo que recebeu a chamada"""
+    return 'shared' if MODEL_SWAP_FILE else 'process'
+
+
+@app.get("/admin/models", dependencies=[Depends(admin_auth)])
+async def admin_models():
+    """Versão ativa, anterior e última troca de cada modelo neste processo"""
+    return {'pid': os.getpid(), 'scope': swap_scope(), 'models': models.versions()}
+
+
+@app.post("/admin/models/{model_kind}/swap", status_code=202, dependencies=[Depends(admin_auth)])
+async def swap_model(model_kind: str, request: ModelSwapRequest):
+    """
+    Troca a quente: carrega e aquece os pesos novos em segundo plano e troca
+    a referência de uma vez; requisições em andamento terminam no modelo
+    antigo e sessões de pose são preservadas. Acompanhe em /admin/models.
+    """
+    check_model_kind(model_kind)
+    start_swap(swap_and_publish, model_kind, 'swap', request.weights, request.version)
+    if swap_scope() == 'process' and process_info['workers'] > 1:
+        logger.warning(f"⚠️ Troca de {model_kind} só neste worker: defina MODEL_SWAP_FILE para propagar")
+    return {
+        'accepted': True, 'action': 'swap', 'model': model_kind, 'weights': request.weights,
+        'scope': swap_scope(), 'current_version': models.version_of(model_kind)
+    }
+
+
+@app.post("/admin/models/{model_kind}/rollback", status_code=202, dependencies=[Depends(admin_auth)])
+async def rollback_model(model_kind: str):
+    """Volta para a versão anterior (instantâneo se ela ainda estiver na memória)"""
+    check_model_kind(model_kind)
+    previous = models.previous.get(model_kind)
+    if previous is None:
+        raise HTTPException(status_code=409, detail=f"Modelo {model_kind} não tem versão anterior")
+    start_swap(swap_and_publish, model_kind, 'rollback')
+    return {
+        'accepted': True, 'action': 'rollback', 'model': model_kind, 'weights': previous['weights'],
+        'scope': swap_scope(), 'current_version': models.version_of(model_kind),
+        'in_memory': previous['model'] is not None
+    }
+
+
+# ==================== SHADOW (AVALIAÇÃO DE CANDIDATOS) ====================
+
+def box_iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU entre caixas [x, y, w, h]: (N, 4) × (M, 4) → (N, M)"""
+    a_xyxy = np.concatenate([a[:, :2], a[:, :2] + a[:, 2:]], axis=1)
+    b_xyxy = np.concatenate([b[:, :2], b[:, :2] + b[:, 2:]], axis=1)
+    lt = np.maximum(a_xyxy[:, None, :2], b_xyxy[None, :, :2])
+    rb = np.minimum(a_xyxy[:, None, 2:], b_xyxy[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def box_agreement(primary: List[dict], candidate: List[dict], label_key: str, iou_threshold: float) -> dict:
+    """
+    Concordância entre as caixas do modelo ativo e do candidato: pareamento
+    guloso pelo maior IoU (acima de iou_threshold, sem olhar a classe), IoU
+    médio dos pares, fração dos pares com a mesma classe e taxa de pareamento.
+    """
+    if not primary and not candidate:
+        return {'match_rate': 1.0, 'mean_iou': None, 'class_match': None, 'count_delta': 0}
+    pairs = []
+    if primary and candidate:
+        iou = box_iou_matrix(
+            np.array([obj['bbox'] for obj in primary], dtype=np.float64),
+            np.array([obj['bbox'] for obj in candidate], dtype=np.float64)
+        )
+        used_primary, used_candidate = set(), set()
+        for flat in np.argsort(-iou, axis=None).tolist():
+            i, j = divmod(flat, iou.shape[1])
+            if iou[i, j] < iou_threshold:
+                break
+            if i in used_primary or j in used_candidate:
+                continue
+            used_primary.add(i)
+            used_candidate.add(j)
+            pairs.append((i, j, float(iou[i, j])))
+    return {
+        'match_rate': len(pairs) / max(len(primary), len(candidate)),
+        'mean_iou': sum(p[2] for p in pairs) / len(pairs) if pairs else None,
+        'class_match': sum(primary[i][label_key] == candidate[j][label_key] for i, j, _ in pairs) / len(pairs) if pairs else None,
+        'count_delta': len(candidate) - len(primary)
+    }
+
+
+def keypoint_agreement(primary: List[dict], candidate: List[dict], min_confidence: float = 0.5,
+                       pck_threshold: float = 0.05) -> dict:
+    """
+    Concordância de pose: distância média (coordenadas normalizadas) entre os
+    keypoints visíveis nos dois modelos e PCK (fração a menos de pck_threshold).
+    """
+    if not primary or not candidate:
+        return {'person_match': float(bool(primary) == bool(candidate)), 'mean_distance': None, 'pck': None}
+    other = {kp['name']: kp for kp in candidate}
+    distances = [
+        math.hypot(kp['x'] - other[kp['name']]['x'], kp['y'] - other[kp['name']]['y'])
+        for kp in primary
+        if kp['name'] in other and kp['confidence'] >= min_confidence and other[kp['name']]['confidence'] >= min_confidence
+    ]
+    return {
+        'person_match': 1.0,
+        'mean_distance': sum(distances) / len(distances) if distances else None,
+        'pck': sum(d < pck_threshold for d in distances) / len(distances) if distances else None
     }
 
 
+class ShadowEvaluator:
+    """
+    Avaliação de modelos candidatos em tráfego real. Depois que a resposta do
+    modelo ativo está pronta, uma amostra das requisições (sample_rate) entra
+    numa fila limitada; uma thread própria, com prioridade baixa (nice), roda
+    o candidato e compara latência e saída. Fila cheia ou trabalho de usuário
+    esperando no pool de inferência = amostra descartada: ninguém espera pelo
+    shadow. O relatório é uma janela móvel por modelo, local ao processo.
+    """
+    
+    def __init__(self, sample_rate: float, max_pending: int, window: int, iou_threshold: float):
+        self.default_sample_rate = sample_rate
+        self.window = window
+        self.iou_threshold = iou_threshold
+        self.candidates: Dict[str, dict] = {}
+        self.samples: Dict[str, deque] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_pending))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def set_candidate(self, kind: str, weights: str, sample_rate: Optional[float] = None,
+                      label: Optional[str] = None) -> dict:
+        """Carrega e aquece o candidato (bloqueia: chamar fora do event loop); substitui o anterior e zera a janela"""
+        candidate = {
+            'weights': weights, 'label': label, 'version': None, 'state': 'loading', 'error': None,
+            'sample_rate': self.default_sample_rate if sample_rate is None else sample_rate,
+            'since': time.time(), 'model': None
+        }
+        with self._lock:
+            self.candidates[kind] = candidate
+            self.samples[kind] = deque(maxlen=self.window)
+            self.counters[kind] = {'sampled': 0, 'evaluated': 0, 'dropped_queue_full': 0, 'dropped_busy': 0, 'errors': 0}
+        try:
+            loaded, backend_info = load_model_kind(
+                kind, on_warmup=lambda: candidate.update(state='warming'), weights=weights
+            )
+        except Exception as e:
+            logger.error(f"❌ Candidato shadow {kind} ({weights}) falhou: {e}")
+            candidate.update(state='failed', error=str(e))
+            return candidate
+        candidate.update(model=loaded, version=label or weights_version(backend_info['path']), state='ready')
+        logger.info(f"👥 Shadow {kind}: {candidate['version']} em {candidate['sample_rate'] * 100:.1f}% das requisições")
+        return candidate
+    
+    def load_configured(self, configured: Dict[str, str]) -> None:
+        """Candidatos de SHADOW_MODELS, carregados em segundo plano (depois dos residentes)"""
+        for kind, weights in configured.items():
+            if kind not in MODEL_SPECS:
+                logger.warning(f"⚠️ SHADOW_MODELS: modelo desconhecido ignorado: {kind} (opções: {', '.join(MODEL_SPECS)})")
+                continue
+            threading.Thread(target=self.set_candidate, args=(kind, weights), name=f"shadow-load-{kind}", daemon=True).start()
+    
+    def clear(self, kind: str) -> bool:
+        with self._lock:
+            candidate = self.candidates.pop(kind, None)
+            self.samples.pop(kind, None)
+            self.counters.pop(kind, None)
+        if candidate is not None:
+            candidate['model'] = None
+            release_memory()
+        return candidate is not None
+    
+    def loading(self, kind: str) -> bool:
+        return self.candidates.get(kind, {}).get('state') in ('loading', 'warming')
+    
+    def offer(self, kind: str, source, params: dict, primary: List[dict], primary_ms: float) -> None:
+        """
+        Chamado com o resultado do modelo ativo já pronto; nunca bloqueia.
+        source = DecodedImage ou bytes (decodificados na thread do shadow).
+        """
+        candidate = self.candidates.get(kind)
+        if candidate is None or candidate['state'] != 'ready' or random.random() >= candidate['sample_rate']:
+            return
+        counters = self.counters[kind]
+        counters['sampled'] += 1
+        if not isinstance(source, (bytes, DecodedImage)):
+            source = bytes(source)  # bytearray/memoryview do download podem ser reaproveitados
+        try:
+            self._queue.put_nowait((kind, candidate, source, params, primary, primary_ms))
+        except queue.Full:
+            counters['dropped_queue_full'] += 1
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='shadow', daemon=True)
+                    self._thread.start()
+    
+    def _run(self) -> None:
+        try:
+            # Linux: nice por thread (as threads OpenMP criadas a partir desta herdam a prioridade)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), SHADOW_NICE)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            kind, candidate, source, params, primary, primary_ms = self._queue.get()
+            counters = self.counters.get(kind)
+            if counters is None or self.candidates.get(kind) is not candidate:
+                continue
+            # Trabalho de usuário esperando uma thread de inferência: o shadow cede a CPU
+            if any(inference_pool.queue_depth(name) for name in PRIORITY_CLASSES):
+                counters['dropped_busy'] += 1
+                continue
+            try:
+                sample = self.evaluate(kind, candidate, source, params, primary, primary_ms)
+            except Exception as e:
+                counters['errors'] += 1
+                logger.warning(f"⚠️ Shadow {kind}: {e}")
+                continue
+            self.samples[kind].append(sample)
+            counters['evaluated'] += 1
+    
+    def evaluate(self, kind: str, candidate: dict, source, params: dict, primary: List[dict],
+                 primary_ms: float) -> dict:
+        """Roda o candidato na mesma imagem e parâmetros do modelo ativo e compara as saídas"""
+        image = source if isinstance(source, DecodedImage) else decode_image_bytes(
+            source, target_size=params.get('imgsz') or DECODE_TARGET_SIZE
+        )
+        if image is None:
+            raise ValueError("imagem não decodificável")
+        start = time.perf_counter()
+        if kind == 'pose':
+            result = detect_pose(image, params.get('imgsz'), loaded_model=candidate['model'])
+            if 'error' in result:
+                raise RuntimeError(result['error'])
+            agreement = keypoint_agreement(primary, result['keypoints'])
+        elif kind == 'yoloe':
+            results = candidate['model'].predict(
+                source=image.array, prompts=params['prompts'], conf=params['confidence'],
+                imgsz=params.get('imgsz'), verbose=False
+            )
+            detections, _, _ = prompt_detections_from_results(results, params['prompts'], image.scale)
+            agreement = box_agreement(primary, detections, 'prompt', self.iou_threshold)
+        else:
+            objects, _, _ = detect_objects_batch(
+                [image], [params['confidence']], [params['max_detections']], params['task'],
+                params.get('imgsz'), loaded_model=candidate['model'], raise_errors=True
+            )[0]
+            agreement = box_agreement(primary, objects, 'class_id', self.iou_threshold)
+        return {'primary_ms': primary_ms, 'candidate_ms': (time.perf_counter() - start) * 1000, **agreement}
+    
+    def report(self) -> dict:
+        """Relatório da janela móvel: latências (p50/p95), delta, speedup e concordância média por modelo"""
+        def summary(values: List[float]) -> dict:
+            if not values:
+                return {'p50': None, 'p95': None, 'mean': None}
+            ordered = sorted(values)
+            return {
+                'p50': round(ordered[len(ordered) // 2], 2),
+                'p95': round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 2),
+                'mean': round(sum(ordered) / len(ordered), 2)
+            }
+        
+        report = {}
+        for kind, candidate in list(self.candidates.items()):
+            samples = list(self.samples.get(kind, ()))
+            primary = summary([s['primary_ms'] for s in samples])
+            shadow_ms = summary([s['candidate_ms'] for s in samples])
+            metric_keys = [key for key in (samples[0] if samples else {}) if key not in ('primary_ms', 'candidate_ms')]
+            agreement = {}
+            for key in metric_keys:
+                values = [s[key] for s in samples if s[key] is not None]
+                agreement[key] = round(sum(values) / len(values), 4) if values else None
+            report[kind] = {
+                'active': {'weights': models.weights_of(kind), 'version': models.version_of(kind)},
+                'candidate': {k: candidate[k] for k in ('weights', 'version', 'state', 'error', 'sample_rate', 'since')},
+                'samples': len(samples),
+                'window': self.window,
+                'counters': dict(self.counters.get(kind, {})),
+                'latency_ms': {
+                    'active': primary,
+                    'candidate': shadow_ms,
+                    'delta_p50': round(shadow_ms['p50'] - primary['p50'], 2) if samples else None,
+                    'speedup_p50': round(primary['p50'] / shadow_ms['p50'], 3) if samples and shadow_ms['p50'] else None
+                },
+                'agreement': agreement
+            }
+        return {'pending': self._queue.qsize(), 'iou_threshold': self.iou_threshold, 'models': report}
+
+
+shadow = ShadowEvaluator(
+    sample_rate=SHADOW_SAMPLE_RATE,
+    max_pending=SHADOW_MAX_PENDING,
+    window=SHADOW_WINDOW,
+    iou_threshold=SHADOW_IOU_THRESHOLD
+)
+
+
+class ShadowCandidateRequest(BaseModel):
+    """Candidato do shadow: pesos (como em /admin/models/{modelo}/swap) e fração das requisições avaliadas"""
+    weights: str = Field(..., min_length=1)
+    version: Optional[str] = None
+    sample_rate: Optional[float] = Field(None, ge=0, le=1)
+
+
+@app.get("/shadow/report")
+async def shadow_report():
+    """Comparação rolante candidato × modelo ativo (latência e concordância) neste processo"""
+    return {'pid': os.getpid(), **shadow.report()}
+
+
+@app.post("/admin/shadow/{model_kind}", status_code=202, dependencies=[Depends(admin_auth)])
+async def set_shadow_candidate(model_kind: str, request: ShadowCandidateRequest):
+    """Carrega um candidato em segundo plano; uma amostra do tráfego passa a rodar nele também"""
+    if model_kind not in models.kinds:
+        raise HTTPException(status_code=404, detail=f"Modelo desconhecido: {model_kind} (opções: {', '.join(models.kinds)})")
+    if shadow.loading(model_kind):
+        raise HTTPException(status_code=409, detail=f"Candidato de {model_kind} ainda carregando")
+    threading.Thread(
+        target=shadow.set_candidate, args=(model_kind, request.weights, request.sample_rate, request.version),
+        name=f"shadow-load-{model_kind}", daemon=True
+    ).start()
+    return {'accepted': True, 'model': model_kind, 'weights': request.weights, 'report': '/shadow/report'}
+
+
+@app.delete("/admin/shadow/{model_kind}", dependencies=[Depends(admin_auth)])
+async def clear_shadow_candidate(model_kind: str):
+    """Remove o candidato (e a janela de amostras) e libera a memória"""
+    return {'model': model_kind, 'removed': shadow.clear(model_kind)}
+
+
 # ==================== YOLOE - VOCABULÁRIO ABERTO ====================
 
-class PromptDetectionRequest(BaseModel):
+class PromptDetectionRequest(TilingParams, ResponseFormatParams, DeadlineParams):
     """Request para detecção com prompts de texto (YOLOE)"""
     image_url: Optional[str] = None
     image_base64: Optional[str] = None
     prompts: List[str] = ["documento", "tabela", "texto", "laudo médico"]
     confidence: float = 0.25
     max_detections: int = 50
+    imgsz: ImgszParam = None
+    bypass_cache: bool = False  # Ignora o cache (o resultado novo ainda é gravado)
 
 
 class PromptDetectionResult(BaseModel):
@@ -666,9 +4232,13 @@ class PromptDetectionResponse(BaseModel):
     is_document: bool
     document_confidence: float
     message: str = ""
+    imgsz: Optional[int] = None  # Resolução aplicada na inferência
+    timing: Dict[str, Any] = {}
+    cached: bool = False
+    cache_match: Optional[str] = None  # exact (mesmo conteúdo) ou perceptual (quase duplicata)
 
 
-@app.post("/detect/prompt", response_model=PromptDetectionResponse)
+@app.post("/detect/prompt", response_model=PromptDetectionResponse, dependencies=[Depends(inference_admission)])
 async def detect_with_prompt(request: PromptDetectionRequest):
     """
     🆕 Detecção com vocabulário aberto usando YOLOE
@@ -680,90 +4250,131 @@ async def detect_with_prompt(request: PromptDetectionRequest):
     - ["documento", "tabela", "texto"] para exames médicos
     - ["pizza", "hambúrguer", "salada"] para alimentos específicos
     """
-    global model_yoloe
-    
-    if model_yoloe is None:
+    if not models.available('yoloe'):
         raise HTTPException(
             status_code=503,
             detail="YOLOE não está disponível. Use /detect para detecção padrão."
         )
     
     # Obter imagem
-    image = None
-    if request.image_url:
-        image = download_image(request.image_url)
-    elif request.image_base64:
-        image = decode_base64_image(request.image_base64)
+    timing = {}
+    image_bytes = await read_request_image(request.image_url, request.image_base64, timing)
     
-    if image is None:
+    if image_bytes is None:
         raise HTTPException(
             status_code=400,
             detail="Não foi possível obter a imagem."
         )
     
+    return metrics_response(
+        await detect_prompt_image_bytes(request, image_bytes, timing), "/detect/prompt", models.weights_of('yoloe'), timing
+    )
+
+
+def predict_prompts(source: np.ndarray, prompts: List[str], confidence: float, imgsz: Optional[int]) -> list:
+    """YOLOE com os prompts da requisição (na thread de inferência: carrega o modelo no primeiro uso)"""
+    return models.require('yoloe').predict(source=source, prompts=prompts, conf=confidence, imgsz=imgsz, verbose=False)
+
+
+async def detect_prompt_image_bytes(request: PromptDetectionRequest, image_bytes: bytes,
+                                    timing: dict) -> dict:
+    """Detecção YOLOE a partir dos bytes da imagem (compartilhado entre /detect/prompt e /detect/prompt/raw)"""
+    check_response_fields(request, PromptDetectionResponse)
+    models.ensure_ready('yoloe')
+    apply_guard(deadline_guard(request_deadline(request), 'prompt'))
+    
+    # Cache por conteúdo + modelo + confiança + conjunto de prompts + imgsz aplicado + tiles
+    tiles = request.tile_config()
+    digest, width, height = await inference_pool.run(probe_image_bytes, image_bytes)
+    imgsz = tile_imgsz('prompt', tiles[0]) if tiles else resolve_imgsz('prompt', request.imgsz, width, height)
+    params = (models.version_of('yoloe'), request.confidence, tuple(request.prompts), imgsz, tiles)
+    cache_key = result_cache.make_key(digest, *params)
+    namespace = result_cache.make_key(*params)
+    cached = None if request.bypass_cache else await result_cache.get(cache_key)
+    cache_match = 'exact' if cached is not None else None
+    phash = None
+    if cached is None and not request.bypass_cache:
+        # Quase duplicata (reenvio recomprimido/redimensionado): reaproveita o resultado reescalado
+        cached, factors, phash = await lookup_near_duplicate(image_bytes, namespace, width, height, timing)
+        if cached is not None:
+            cached = {**cached, 'detections': rescale_cached_items(cached['detections'], *factors)}
+            cache_match = 'perceptual'
+    
     start_time = time.time()
     
     try:
-        # Executar detecção com prompts
-        logger.info(f"🦾 YOLOE detectando com prompts: {request.prompts}")
-        
-        results = model_yoloe.predict(
-            source=image,
-            prompts=request.prompts,
-            conf=request.confidence,
-            verbose=False
-        )
-        
-        detections = []
-        is_document = False
-        document_confidence = 0.0
-        
-        for result in results:
-            if result.boxes is not None:
-                for i, box in enumerate(result.boxes):
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    conf = float(box.conf[0].cpu().numpy())
-                    class_id = int(box.cls[0].cpu().numpy())
-                    
-                    # Obter o prompt correspondente
-                    prompt_name = request.prompts[class_id] if class_id < len(request.prompts) else f"class_{class_id}"
-                    
-                    width = float(x2 - x1)
-                    height = float(y2 - y1)
-                    area = width * height
-                    
-                    detections.append(PromptDetectionResult(
-                        prompt=prompt_name,
-                        confidence=round(conf, 4),
-                        bbox=[float(x1), float(y1), width, height],
-                        area=round(area, 2)
-                    ))
-                    
-                    # Verificar se é documento
-                    doc_keywords = ['documento', 'document', 'tabela', 'table', 'texto', 'text', 'laudo', 'report']
-                    if any(kw in prompt_name.lower() for kw in doc_keywords):
-                        is_document = True
-                        document_confidence = max(document_confidence, conf)
-        
-        inference_time = (time.time() - start_time) * 1000
+        if cached is not None:
+            detections = cached['detections']
+            is_document = cached['is_document']
+            document_confidence = cached['document_confidence']
+            inference_time = cached['inference_time_ms']
+        else:
+            target_size = tile_decode_target(tiles[0], tiles[2]) if tiles else imgsz
+            image = await decode_request_image(image_bytes, timing, target_size=target_size)
+            if image is None:
+                raise HTTPException(status_code=400, detail="Não foi possível decodificar a imagem.")
+            
+            # Executar detecção com prompts
+            logger.info(f"🦾 YOLOE detectando com prompts: {request.prompts}")
+            
+            if tiles:
+                detections, is_document, document_confidence, timing['tiles'] = await inference_pool.run(
+                    detect_prompt_tiled, image, request.prompts, request.confidence, imgsz, *tiles
+                )
+            else:
+                results = await inference_pool.run_timed(
+                    timing,
+                    predict_prompts,
+                    image.array,
+                    request.prompts,
+                    request.confidence,
+                    imgsz
+                )
+                detections, is_document, document_confidence = prompt_detections_from_results(
+                    results, request.prompts, image.scale
+                )
+                timing.update(model_stage_timing(results))
+            
+            inference_time = (time.time() - start_time) * 1000
+            if not tiles:
+                imgsz_controller('prompt').observe(inference_time)
+                shadow.offer('yoloe', image, {
+                    'prompts': request.prompts, 'confidence': request.confidence, 'imgsz': imgsz
+                }, detections, inference_time)
+            
+            value = {
+                'detections': detections,
+                'is_document': is_document,
+                'document_confidence': document_confidence,
+                'inference_time_ms': inference_time
+            }
+            await result_cache.put(cache_key, value)
+            if phash is not None:
+                perceptual_cache.put(namespace, phash, image.orig_width, image.orig_height, value)
         
         # Limitar resultados
         detections = detections[:request.max_detections]
         
         logger.info(f"✅ YOLOE: {len(detections)} detecções em {inference_time:.1f}ms (documento: {is_document})")
         
-        return PromptDetectionResponse(
-            success=True,
-            detections=detections,
-            prompts_used=request.prompts,
-            total_detections=len(detections),
-            inference_time_ms=round(inference_time, 2),
-            model_version=YOLOE_MODEL,
-            is_document=is_document,
-            document_confidence=round(document_confidence, 4),
-            message=f"YOLOE detectou {len(detections)} objetos" + (f" - É documento ({document_confidence*100:.0f}%)" if is_document else "")
-        )
+        return shape_payload({
+            'success': True,
+            'detections': detections,
+            'prompts_used': request.prompts,
+            'total_detections': len(detections),
+            'inference_time_ms': round(inference_time, 2),
+            'model_version': models.weights_of('yoloe'),
+            'is_document': is_document,
+            'document_confidence': round(document_confidence, 4),
+            'imgsz': imgsz,
+            'timing': timing,
+            'cached': cache_match is not None,
+            'cache_match': cache_match,
+            'message': f"YOLOE detectou {len(detections)} objetos" + (f" - É documento ({document_confidence*100:.0f}%)" if is_document else "")
+        }, request, {'detections': functools.partial(compact_prompt_detections, prompts=request.prompts)})
         
+    except (HTTPException, ImageTooLargeError, DroppedRequestError, ModelUnavailableError):
+        raise
     except Exception as e:
         logger.error(f"❌ Erro no YOLOE: {e}")
         raise HTTPException(status_code=500, detail=f"Erro na detecção: {str(e)}")
@@ -771,13 +4382,14 @@ async def detect_with_prompt(request: PromptDetectionRequest):
 
 # ==================== YOLO-POSE - POSE ESTIMATION ====================
 
-class PoseAnalyzeRequest(BaseModel):
+class PoseAnalyzeRequest(ResponseFormatParams, DeadlineParams):
     """Request para análise de pose"""
     image_base64: Optional[str] = None
     image_url: Optional[str] = None
     session_id: str
     exercise: str = 'squat'
     calibration: Optional[dict] = None
+    imgsz: ImgszParam = None
 
 
 class PoseKeypointResult(BaseModel):
@@ -811,9 +4423,12 @@ class PoseAnalyzeResponse(BaseModel):
     angles: dict
     is_valid_rep: bool
     is_full_body: bool
+    imgsz: Optional[int] = None  # Resolução aplicada na inferência
+    dropped_frames: Dict[str, int] = {}  # Frames da sessão descartados: prazo estourado / substituídos
+    timing: Dict[str, Any] = {}
 
 
-@app.post("/pose/analyze", response_model=PoseAnalyzeResponse)
+@app.post("/pose/analyze", response_model=PoseAnalyzeResponse, dependencies=[Depends(realtime_admission)])
 async def analyze_pose(request: PoseAnalyzeRequest):
     """
     🏋️ Análise de pose para treino com câmera
@@ -823,32 +4438,33 @@ async def analyze_pose(request: PoseAnalyzeRequest):
     
     Exercícios suportados: squat, pushup, situp
     """
-    global pose_session_states
-    
     # Verificar se modelo está carregado
-    if model_pose is None:
+    if not models.available('pose'):
         raise HTTPException(
             status_code=503,
             detail="YOLO-Pose não está disponível. Verifique se o modelo foi carregado."
         )
     
     # Obter imagem
-    image = None
-    if request.image_base64:
-        image = decode_base64_image(request.image_base64)
-    elif request.image_url:
-        image = download_image(request.image_url)
+    timing = {}
+    image_bytes = await read_request_image(
+        request.image_url, request.image_base64, timing, prefer_base64=True
+    )
     
-    if image is None:
+    if image_bytes is None:
         raise HTTPException(status_code=400, detail="Imagem não fornecida ou inválida")
     
-    # Detectar pose
-    pose_result = detect_pose(image)
-    
-    if 'error' in pose_result:
-        raise HTTPException(status_code=500, detail=pose_result['error'])
-    
-    keypoints = pose_result['keypoints']
+    return metrics_response(
+        await analyze_pose_image_bytes(request, image_bytes, timing), "/pose/analyze", models.weights_of('pose'), timing
+    )
+
+
+async def analyze_pose_image_bytes(request: PoseAnalyzeRequest, image_bytes: bytes,
+                                   timing: dict) -> dict:
+    """Análise de pose a partir dos bytes do frame (compartilhado entre /pose/analyze e /pose/analyze/raw)"""
+    global pose_session_states
+    check_response_fields(request, PoseAnalyzeResponse)
+    models.ensure_ready('pose')
     
     # Obter ou criar estado da sessão
     if request.session_id not in pose_session_states:
@@ -859,6 +4475,46 @@ async def analyze_pose(request: PoseAnalyzeRequest):
     
     state = pose_session_states[request.session_id]
     
+    # Latest-wins: um frame mais novo da sessão substitui este enquanto ele espera na fila
+    seq = next(pose_frame_sequence)
+    in_order = state.begin_frame(seq, request.captured_at)
+    expired = deadline_guard(request_deadline(request, POSE_FRAME_DEADLINE_MS), 'pose')
+    
+    def frame_guard() -> Optional[str]:
+        if not in_order or state.latest_frame != seq:
+            return 'superseded'
+        return expired() if expired else None
+    
+    try:
+        apply_guard(frame_guard)
+        
+        width, height = await inference_pool.run(image_dimensions, image_bytes)
+        imgsz = resolve_imgsz('pose', request.imgsz, width, height)
+        image = await decode_request_image(image_bytes, timing, target_size=imgsz)
+        if image is None:
+            raise HTTPException(status_code=400, detail="Imagem não fornecida ou inválida")
+        
+        # Detectar pose
+        start = time.perf_counter()
+        pose_result = await inference_pool.run_timed(timing, detect_pose, image, imgsz)
+        imgsz_controller('pose').observe((time.perf_counter() - start) * 1000)
+        
+        # Com threads em paralelo um frame mais novo pode terminar antes: este não volta o contador no tempo
+        if seq < state.last_applied_frame:
+            raise DroppedRequestError('superseded')
+    except DroppedRequestError as e:
+        state.dropped_frames[e.reason] = state.dropped_frames.get(e.reason, 0) + 1
+        e.context = {'session_id': request.session_id, 'dropped_frames': dict(state.dropped_frames)}
+        raise
+    state.last_applied_frame = seq
+    
+    if 'error' in pose_result:
+        raise HTTPException(status_code=500, detail=pose_result['error'])
+    timing.update(pose_result['stages'])
+    shadow.offer('pose', image, {'imgsz': imgsz}, pose_result['keypoints'], pose_result['inference_time_ms'])
+    
+    keypoints = pose_result['keypoints']
+    
     # Obter thresholds do exercício
     thresholds = EXERCISE_THRESHOLDS.get(request.exercise, EXERCISE_THRESHOLDS['squat'])
     
@@ -984,41 +4640,33 @@ async def analyze_pose(request: PoseAnalyzeRequest):
     # Limitar hints para não sobrecarregar (máximo 2)
     form_hints = sorted(form_hints, key=lambda x: x['priority'])[:2]
     
-    # Converter keypoints para response
-    keypoints_response = [
-        PoseKeypointResult(
-            id=k['id'],
-            name=k['name'],
-            x=k['x'],
-            y=k['y'],
-            confidence=k['confidence']
-        )
-        for k in keypoints
-    ]
-    
-    # Converter hints para response
+    # Hints no formato de FormHintResult (keypoints já vêm no formato de PoseKeypointResult)
     hints_response = [
-        FormHintResult(type=h['type'], message=h['message'], priority=h['priority'])
+        {'type': h['type'], 'message': h['message'], 'priority': h['priority']}
         for h in form_hints
     ]
     
     logger.info(f"🏋️ Pose: {request.exercise} | Reps: {state.rep_count} | Fase: {state.current_phase} | Ângulo: {angles.get('knee', angles.get('elbow', 0))}°")
     
-    return PoseAnalyzeResponse(
-        success=True,
-        keypoints=keypoints_response,
-        rep_count=state.rep_count,
-        partial_reps=state.partial_reps,
-        current_phase=state.current_phase,
-        phase_progress=round(phase_progress, 1),
-        form_hints=hints_response,
-        confidence=pose_result['confidence'],
-        warnings=warnings,
-        inference_time_ms=round(pose_result['inference_time_ms'], 2),
-        angles=angles,
-        is_valid_rep=is_valid_rep,
-        is_full_body=pose_result['is_full_body']
-    )
+    payload = {
+        'success': True,
+        'keypoints': keypoints,
+        'rep_count': state.rep_count,
+        'partial_reps': state.partial_reps,
+        'current_phase': state.current_phase,
+        'phase_progress': round(phase_progress, 1),
+        'form_hints': hints_response,
+        'confidence': pose_result['confidence'],
+        'warnings': warnings,
+        'inference_time_ms': round(pose_result['inference_time_ms'], 2),
+        'angles': angles,
+        'is_valid_rep': is_valid_rep,
+        'is_full_body': pose_result['is_full_body'],
+        'imgsz': imgsz,
+        'dropped_frames': dict(state.dropped_frames),
+        'timing': timing
+    }
+    return shape_payload(payload, request, {'keypoints': compact_keypoints})
 
 
 @app.get("/pose/session/{session_id}")
@@ -1033,7 +4681,8 @@ async def get_pose_session(session_id: str):
         'exercise': state.exercise_type,
         'rep_count': state.rep_count,
         'partial_reps': state.partial_reps,
-        'current_phase': state.current_phase
+        'current_phase': state.current_phase,
+        'dropped_frames': state.dropped_frames
     }
 
 
@@ -1048,6 +4697,7 @@ async def end_pose_session(session_id: str):
             'exercise': state.exercise_type,
             'total_reps': state.rep_count,
             'partial_reps': state.partial_reps,
+            'dropped_frames': state.dropped_frames,
             'message': f'Sessão encerrada com {state.rep_count} reps válidas!'
         }
     return {
@@ -1060,14 +4710,303 @@ async def end_pose_session(session_id: str):
 async def pose_health():
     """Health check do serviço de pose estimation"""
     return {
-        'status': 'healthy' if model_pose else 'degraded',
-        'pose_model_loaded': model_pose is not None,
-        'pose_model_name': YOLO_POSE_MODEL,
+        'status': 'healthy' if models.available('pose') else 'degraded',
+        'pose_model_loaded': models.loaded('pose'),
+        'pose_model_name': models.weights_of('pose'),
         'active_sessions': len(pose_session_states),
         'supported_exercises': list(EXERCISE_THRESHOLDS.keys())
     }
 
 
+# ==================== ENDPOINTS BINÁRIOS ====================
+
+RAW_CONTENT_TYPES = ('application/octet-stream', 'image/')
+
+
+async def read_raw_body(request: Request) -> bytearray:
+    """
+    Lê o corpo binário da imagem em streaming, com limite de FETCH_MAX_BYTES.
+    Aceita application/octet-stream ou image/* (sem base64 nem multipart).
+    """
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    if content_type and not content_type.startswith(RAW_CONTENT_TYPES):
+        raise HTTPException(
+            status_code=415,
+            detail="Envie a imagem como application/octet-stream ou image/*"
+        )
+    
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > FETCH_MAX_BYTES:
+            raise ImageTooLargeError(f"Imagem excede o limite de {FETCH_MAX_BYTES} bytes")
+    
+    if not body:
+        raise HTTPException(status_code=400, detail="Corpo da requisição vazio")
+    return body
+
+
+def field_container(annotation) -> Optional[type]:
+    """list ou dict se o campo é uma coleção (atravessa Optional/Union e Annotated); None para escalares"""
+    origin = get_origin(annotation)
+    if origin is Annotated:
+        return field_container(get_args(annotation)[0])
+    if origin in (Union, types.UnionType):
+        members = {field_container(arg) for arg in get_args(annotation) if arg is not type(None)}
+        return members.pop() if len(members) == 1 else None
+    container = origin or annotation
+    if container in (list, set, tuple, frozenset):
+        return list
+    return dict if container is dict else None
+
+
+def raw_request_params(request: Request, model_cls) -> BaseModel:
+    """
+    Monta o modelo de parâmetros a partir da query string ou de cabeçalhos
+    X-<Campo> (ex.: ?confidence=0.4 ou X-Confidence: 0.4). Listas aceitam
+    valores repetidos ou separados por vírgula; dicts aceitam JSON. Campos
+    com alias são lidos (e validados) pelo alias.
+    """
+    fields = {}
+    for name, field in model_cls.model_fields.items():
+        if name in ('image_url', 'image_base64'):
+            continue
+        
+        key = field.alias or name
+        values = request.query_params.getlist(key)
+        header = 'x-' + key.replace('_', '-')
+        if not values and header in request.headers:
+            values = [request.headers[header]]
+        if not values:
+            continue
+        
+        container = field_container(field.annotation)
+        if container is list:
+            fields[key] = [v.strip() for item in values for v in item.split(',') if v.strip()]
+        elif container is dict:
+            try:
+                fields[key] = json.loads(values[0])
+            except ValueError:
+                raise HTTPException(status_code=422, detail=f"Parâmetro {key} deve ser JSON")
+        else:
+            fields[key] = values[0]
+    
+    try:
+        return model_cls.model_validate(fields)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json(include_url=False)))
+
+
+@app.post("/detect/raw", response_model=DetectionResponse, dependencies=[Depends(inference_admission)])
+async def detect_raw(request: Request):
+    """
+    Detecção com a imagem no corpo binário (application/octet-stream ou image/jpeg).
+    
+    Parâmetros na query string ou em cabeçalhos X-*: confidence, task,
+    max_detections, bypass_cache.
+    """
+    params = raw_request_params(request, DetectionRequest)
+    image_bytes = await read_raw_body(request)
+    timing = {}
+    return metrics_response(
+        await detect_image_bytes(params, image_bytes, timing), "/detect/raw", detection_model_name(params.task), timing
+    )
+
+
+@app.post("/detect/prompt/raw", response_model=PromptDetectionResponse, dependencies=[Depends(inference_admission)])
+async def detect_with_prompt_raw(request: Request):
+    """
+    Detecção YOLOE com a imagem no corpo binário.
+    
+    Parâmetros na query string ou em cabeçalhos X-*: prompts (repetido ou
+    separado por vírgula), confidence, max_detections, bypass_cache.
+    """
+    if not models.available('yoloe'):
+        raise HTTPException(
+            status_code=503,
+            detail="YOLOE não está disponível. Use /detect para detecção padrão."
+        )
+    
+    params = raw_request_params(request, PromptDetectionRequest)
+    image_bytes = await read_raw_body(request)
+    timing = {}
+    return metrics_response(
+        await detect_prompt_image_bytes(params, image_bytes, timing), "/detect/prompt/raw", models.weights_of('yoloe'), timing
+    )
+
+
+@app.post("/pose/analyze/raw", response_model=PoseAnalyzeResponse, dependencies=[Depends(realtime_admission)])
+async def analyze_pose_raw(request: Request):
+    """
+    Análise de pose com o frame no corpo binário (ideal para 10-15 fps).
+    
+    Parâmetros na query string ou em cabeçalhos X-*: session_id (obrigatório),
+    exercise, calibration (JSON).
+    """
+    if not models.available('pose'):
+        raise HTTPException(
+            status_code=503,
+            detail="YOLO-Pose não está disponível. Verifique se o modelo foi carregado."
+        )
+    
+    params = raw_request_params(request, PoseAnalyzeRequest)
+    image_bytes = await read_raw_body(request)
+    timing = {}
+    return metrics_response(
+        await analyze_pose_image_bytes(params, image_bytes, timing), "/pose/analyze/raw", models.weights_of('pose'), timing
+    )
+
+
+# ==================== DETECÇÃO EM LOTE (NDJSON) ====================
+
+class BatchImageItem(BaseModel):
+    """Imagem de um lote (URL ou base64)"""
+    id: Optional[str] = None
+    image_url: Optional[str] = None
+    image_base64: Optional[str] = None
+
+
+class BatchDetectionRequest(TilingParams, ResponseFormatParams):
+    """Request para detecção em lote"""
+    images: List[BatchImageItem]
+    confidence: float = 0.35
+    task: DetectionTask = "detect"
+    max_detections: int = Field(100, ge=1, le=300)
+    imgsz: ImgszParam = None
+    bypass_cache: bool = False
+
+
+async def detect_batch_item(index: int, item_id: Optional[str], params: DetectionRequest,
+                            load_bytes, slots: asyncio.Semaphore) -> dict:
+    """
+    Processa uma imagem do lote; erros viram uma linha de erro, sem derrubar
+    o lote. Cada imagem passa pela admissão do pool como uma requisição: com
+    o pool cheio a linha sai com 503 e retry_after.
+    """
+    timing = {}
+    try:
+        async with slots:
+            image_bytes = await load_bytes(timing)
+            if image_bytes is None:
+                raise HTTPException(status_code=400, detail="Não foi possível obter a imagem.")
+            with inference_pool.admit():
+                payload = await detect_image_bytes(params, image_bytes, timing)
+        stage_metrics.observe_timing("/detect/batch", detection_model_name(params.task), timing)
+        return {'index': index, 'id': item_id, **payload}
+    except HTTPException as e:
+        return {'index': index, 'id': item_id, 'success': False, 'status_code': e.status_code, 'error': e.detail}
+    except QueueFullError as e:
+        return {
+            'index': index, 'id': item_id, 'success': False, 'status_code': 503, 'error': str(e),
+            'retry_after': OVERLOAD_RETRY_AFTER_S
+        }
+    # Mesmos status dos handlers de /detect
+    except ImageTooLargeError as e:
+        return {'index': index, 'id': item_id, 'success': False, 'status_code': 413, 'error': str(e)}
+    except DroppedRequestError as e:
+        stage_metrics.count_dropped("/detect/batch", e.reason)
+        status_code, content = dropped_request_status(e)
+        return {
+            'index': index, 'id': item_id, 'success': False, 'status_code': status_code,
+            'error': content.pop('detail'), **content
+        }
+    except ModelUnavailableError as e:
+        return {'index': index, 'id': item_id, 'success': False, 'status_code': 503, 'error': str(e)}
+    except Exception as e:
+        logger.error(f"❌ Erro no item {index} do lote: {e}")
+        return {'index': index, 'id': item_id, 'success': False, 'status_code': 500, 'error': str(e)}
+
+
+@app.post("/detect/batch")
+async def detect_batch(request: Request):
+    """
+    Detecção em lote com resultados em streaming (NDJSON).
+    
+    Aceita JSON ({"images": [{"id", "image_url" | "image_base64"}], ...}) ou
+    multipart/form-data com uma parte binária por imagem (parâmetros na query
+    string ou em cabeçalhos X-*). As imagens são baixadas em paralelo, a
+    inferência é agrupada pelo micro-batching e cada resultado é enviado
+    assim que fica pronto. A última linha traz o resumo do lote.
+    
+    Cada imagem ocupa uma vaga do pool de inferência enquanto roda (a
+    admissão é por imagem, não por lote); um lote mantém no máximo
+    BATCH_MAX_SIZE imagens em andamento para não rejeitar a si mesmo.
+    """
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    loaders = []  # (id, função assíncrona que retorna os bytes)
+    
+    if content_type == 'multipart/form-data':
+        params = raw_request_params(request, DetectionRequest)
+        form = await request.form()
+        for key, part in form.multi_items():
+            if isinstance(part, str):
+                continue
+            data = await part.read()
+            loaders.append((part.filename or key, functools.partial(_uploaded_bytes, data)))
+    else:
+        try:
+            body = BatchDetectionRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=json.loads(e.json(include_url=False)))
+        params = DetectionRequest(
+            confidence=body.confidence,
+            task=body.task,
+            max_detections=body.max_detections,
+            imgsz=body.imgsz,
+            tiling=body.tiling,
+            tile_size=body.tile_size,
+            tile_overlap=body.tile_overlap,
+            max_tiles=body.max_tiles,
+            format=body.format,
+            fields=body.fields,
+            bypass_cache=body.bypass_cache
+        )
+        for item in body.images:
+            loaders.append((item.id, functools.partial(read_request_image, item.image_url, item.image_base64)))
+    
+    if not loaders:
+        raise HTTPException(status_code=400, detail="Nenhuma imagem enviada no lote.")
+    if len(loaders) > BATCH_MAX_IMAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Lote com {len(loaders)} imagens excede o limite de {BATCH_MAX_IMAGES}"
+        )
+    
+    async def stream():
+        start = time.perf_counter()
+        slots = asyncio.Semaphore(max(1, min(BATCH_MAX_SIZE, inference_pool.max_workers + inference_pool.max_queue)))
+        tasks = [
+            asyncio.create_task(detect_batch_item(index, item_id, params, load_bytes, slots))
+            for index, (item_id, load_bytes) in enumerate(loaders)
+        ]
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                if not line.get('success'):
+                    failed += 1
+                yield orjson.dumps(line, option=orjson.OPT_NON_STR_KEYS) + b'\n'
+            
+            yield orjson.dumps({
+                'done': True,
+                'total': len(tasks),
+                'succeeded': len(tasks) - failed,
+                'failed': failed,
+                'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+            }) + b'\n'
+        finally:
+            # Cliente desconectou: cancela o que ainda não terminou
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type='application/x-ndjson')
+
+
+async def _uploaded_bytes(data: bytes, timing: dict) -> bytes:
+    """Loader de parte binária já recebida (mesma assinatura de read_request_image)"""
+    return data
+
+
 # ==================== MAIN ====================
 
 if __name__ == "__main__":
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+🧮 Quantização INT8 + Guard de Precisão para o Serviço YOLO
+Gera grafos INT8 (ONNX Runtime / OpenVINO) do detector de alimentos e do
+modelo de pose a partir de uma pasta local de calibração, e compara o
+resultado quantizado com o FP32 num corpus fixo (IoU de caixas,
+concordância de classes e erro de keypoints).
+
+O relatório do guard fica ao lado do artefato (<artefato>.guard.json) e é
+conferido pelo main.py antes de ativar um modelo INT8 (INT8_MODELS).
+
+Uso:
+    python quantization.py quantize --weights yolo26s.pt --calib-dir ./calib --corpus ./corpus --backend onnx
+    python quantization.py guard --weights yolo26s.pt --corpus ./corpus --backend onnx
+"""
+
+import os
+import sys
+import ast
+import glob
+import json
+import time
+import shutil
+import logging
+import tempfile
+from typing import Optional, List, Dict
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+# Limites de desvio INT8 vs FP32 (mesmas variáveis usadas pelo serviço)
+DEFAULT_THRESHOLDS = {
+    'min_box_recall': float(os.getenv('INT8_MIN_BOX_RECALL', '0.90')),
+    'min_mean_iou': float(os.getenv('INT8_MIN_MEAN_IOU', '0.85')),
+    'min_class_agreement': float(os.getenv('INT8_MIN_CLASS_AGREEMENT', '0.95')),
+    'max_keypoint_error': float(os.getenv('INT8_MAX_KEYPOINT_ERROR', '0.05')),
+}
+
+
+# ==================== ARTEFATOS ====================
+
+def int8_artifact(weights: str, backend: str) -> str:
+    """Caminho do artefato INT8 (yolo26s.pt → yolo26s_int8.onnx / yolo26s_int8_openvino_model)"""
+    stem, _ = os.path.splitext(weights)
+    if backend == 'onnx':
+        return f"{stem}_int8.onnx"
+    if backend == 'openvino':
+        return f"{stem}_int8_openvino_model"
+    raise ValueError(f"Backend sem suporte a INT8: {backend}")
+
+
+def guard_report_path(artifact: str) -> str:
+    return f"{artifact.rstrip(os.sep)}.guard.json"
+
+
+def artifact_fingerprint(path: str) -> dict:
+    """Tamanho + mtime dos arquivos do artefato (detecta relatório desatualizado)"""
+    files = [path] if os.path.isfile(path) else sorted(
+        os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+    )
+    return {
+        'size': sum(os.path.getsize(f) for f in files),
+        'mtime': max((int(os.path.getmtime(f)) for f in files), default=0)
+    }
+
+
+def list_images(folder: str, limit: Optional[int] = None) -> List[str]:
+    """Imagens da pasta em ordem estável (corpus fixo)"""
+    paths = sorted(
+        p for p in glob.glob(os.path.join(folder, '**', '*'), recursive=True)
+        if p.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+
+# ==================== QUANTIZAÇÃO ====================
+
+def letterbox(image: np.ndarray, size: int) -> np.ndarray:
+    """Redimensiona mantendo proporção e preenche com 114 (mesmo pré-processamento do ultralytics)"""
+    h, w = image.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+
+class ImageFolderCalibrationReader:
+    """Leitor de calibração do ONNX Runtime a partir de uma pasta de imagens"""
+    def __init__(self, paths: List[str], input_name: str, imgsz: int):
+        self.paths = paths
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._index = 0
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        while self._index < len(self.paths):
+            path = self.paths[self._index]
+            self._index += 1
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                logger.warning(f"⚠️ Imagem ignorada na calibração: {path}")
+                continue
+            rgb = cv2.cvtColor(letterbox(image, self.imgsz), cv2.COLOR_BGR2RGB)
+            tensor = rgb.transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+            return {self.input_name: np.ascontiguousarray(tensor)}
+        return None
+
+    def rewind(self):
+        self._index = 0
+
+
+def onnx_source_mismatch(path: str, imgsz: int) -> Optional[str]:
+    """
+    Motivo pelo qual um .onnx existente não serve de fonte FP32 para calibrar
+    em imgsz (None se serve): entrada dinâmica, outro tamanho estático ou
+    metadado imgsz do ultralytics diferente.
+    """
+    import onnx
+
+    model = onnx.load(path, load_external_data=False)
+    dims = model.graph.input[0].type.tensor_type.shape.dim
+    shape = [dim.dim_value if dim.HasField('dim_value') else (dim.dim_param or '?') for dim in dims]
+    if any(not isinstance(value, int) for value in shape):
+        return f"entrada dinâmica {shape}"
+    if len(shape) != 4 or shape[0] != 1 or shape[2:] != [imgsz, imgsz]:
+        return f"entrada {shape} (calibração em [1, 3, {imgsz}, {imgsz}])"
+    metadata = {prop.key: prop.value for prop in model.metadata_props}
+    if 'imgsz' in metadata:
+        try:
+            exported_imgsz = list(ast.literal_eval(metadata['imgsz']))
+        except (ValueError, SyntaxError, TypeError):
+            exported_imgsz = None
+        if exported_imgsz != [imgsz, imgsz]:
+            return f"metadado imgsz={metadata['imgsz']}"
+    return None
+
+
+def export_onnx_fp32(weights: str, imgsz: int, directory: str) -> str:
+    """Exporta o FP32 estático em imgsz dentro de `directory` (sem tocar no .onnx ao lado dos pesos)"""
+    from ultralytics import YOLO
+
+    source = YOLO(weights).ckpt_path or weights
+    copy = os.path.join(directory, os.path.basename(source))
+    shutil.copy(source, copy)
+    return YOLO(copy).export(format='onnx', imgsz=imgsz)
+
+
+def quantize_onnx(weights: str, calib_images: List[str], imgsz: int = 640) -> str:
+    """
+    Exporta FP32 para ONNX (se preciso) e quantiza estaticamente para INT8
+    (QDQ). Um <pesos>.onnx existente (ex.: exportado para o backend com outro
+    imgsz ou entrada dinâmica) só é reaproveitado se a entrada for
+    [1, 3, imgsz, imgsz]; senão o FP32 é reexportado numa pasta temporária.
+    """
+    from ultralytics import YOLO
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32_path = f"{os.path.splitext(weights)[0]}.onnx"
+        if not os.path.exists(fp32_path):
+            logger.info(f"🔄 Exportando FP32 para ONNX: {weights}")
+            fp32_path = YOLO(weights).export(format='onnx', imgsz=imgsz)
+        else:
+            mismatch = onnx_source_mismatch(fp32_path, imgsz)
+            if mismatch:
+                logger.info(f"🔄 {fp32_path} não serve para imgsz {imgsz} ({mismatch}): reexportando FP32 à parte")
+                fp32_path = export_onnx_fp32(weights, imgsz, tmp)
+        return quantize_onnx_graph(weights, fp32_path, calib_images, imgsz)
+
+
+def quantize_onnx_graph(weights: str, fp32_path: str, calib_images: List[str], imgsz: int) -> str:
+    """Quantização estática do grafo FP32 (entrada [1, 3, imgsz, imgsz]) com metadados preservados"""
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+
+    output = int8_artifact(weights, 'onnx')
+    input_name = onnxruntime.InferenceSession(
+        fp32_path, providers=['CPUExecutionProvider']
+    ).get_inputs()[0].name
+
+    logger.info(f"🧮 Calibrando INT8 com {len(calib_images)} imagens...")
+    quantize_static(
+        fp32_path,
+        output,
+        ImageFolderCalibrationReader(calib_images, input_name, imgsz),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8
+    )
+
+    # Preservar metadados do ultralytics (nomes das classes, stride, imgsz, task)
+    fp32_model = onnx.load(fp32_path, load_external_data=False)
+    int8_model = onnx.load(output)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, output)
+    return output
+
+
+def quantize_openvino(weights: str, calib_dir: str, imgsz: int = 640) -> str:
+    """Exporta para OpenVINO INT8 (NNCF) usando a pasta de calibração como dataset"""
+    from ultralytics import YOLO
+
+    yolo = YOLO(weights)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_yaml = os.path.join(tmp, 'calibration.yaml')
+        with open(data_yaml, 'w') as f:
+            json.dump({  # JSON é YAML válido
+                'path': os.path.abspath(calib_dir),
+                'train': '.',
+                'val': '.',
+                'names': {int(k): v for k, v in yolo.names.items()}
+            }, f)
+        exported = yolo.export(format='openvino', int8=True, data=data_yaml, imgsz=imgsz)
+
+    output = int8_artifact(weights, 'openvino')
+    if os.path.abspath(exported) != os.path.abspath(output):
+        shutil.rmtree(output, ignore_errors=True)
+        shutil.move(exported, output)
+    return output
+
+
+# ==================== GUARD DE PRECISÃO ====================
+
+def box_iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU entre dois conjuntos de caixas xyxy: (N, 4) x (M, 4) → (N, M)"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def match_boxes(ref: np.ndarray, cand: np.ndarray, iou_threshold: float = 0.5) -> List[tuple]:
+    """Pareamento guloso por IoU (independente de classe): [(i_ref, j_cand, iou)]"""
+    iou = box_iou_matrix(ref, cand)
+    pairs = []
+    while iou.size and iou.max() >= iou_threshold:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        pairs.append((int(i), int(j), float(iou[i, j])))
+        iou[i, :] = -1
+        iou[:, j] = -1
+    return pairs
+
+
+def result_arrays(result) -> dict:
+    """Extrai caixas, classes e keypoints de um Results do ultralytics"""
+    boxes = result.boxes.data.cpu().numpy() if result.boxes is not None else np.zeros((0, 6))
+    keypoints = None
+    if getattr(result, 'keypoints', None) is not None and len(result.keypoints):
+        keypoints = result.keypoints.data.cpu().numpy()
+    return {'xyxy': boxes[:, :4], 'cls': boxes[:, 5].astype(int), 'keypoints': keypoints}
+
+
+def compare_results(ref: dict, cand: dict, stats: dict):
+    """Acumula métricas de desvio de uma imagem em `stats`"""
+    pairs = match_boxes(ref['xyxy'], cand['xyxy'])
+    stats['ref_boxes'] += len(ref['xyxy'])
+    stats['cand_boxes'] += len(cand['xyxy'])
+    stats['matched'] += len(pairs)
+    stats['iou_sum'] += sum(iou for _, _, iou in pairs)
+    stats['class_agree'] += sum(1 for i, j, _ in pairs if ref['cls'][i] == cand['cls'][j])
+
+    if ref['keypoints'] is None or cand['keypoints'] is None:
+        return
+    for i, j, _ in pairs:
+        ref_kps, cand_kps = ref['keypoints'][i], cand['keypoints'][j]
+        visible = ref_kps[:, 2] > 0.5 if ref_kps.shape[1] > 2 else np.ones(len(ref_kps), dtype=bool)
+        if not visible.any():
+            continue
+        # Erro normalizado pela diagonal da caixa da pessoa
+        x1, y1, x2, y2 = ref['xyxy'][i]
+        diagonal = max(float(np.hypot(x2 - x1, y2 - y1)), 1e-6)
+        errors = np.linalg.norm(ref_kps[visible, :2] - cand_kps[visible, :2], axis=1) / diagonal
+        stats['kp_error_sum'] += float(errors.sum())
+        stats['kp_count'] += int(visible.sum())
+
+
+def empty_drift_stats() -> dict:
+    return {
+        'ref_boxes': 0, 'cand_boxes': 0, 'matched': 0, 'iou_sum': 0.0,
+        'class_agree': 0, 'kp_error_sum': 0.0, 'kp_count': 0
+    }
+
+
+def evaluate_drift(reference_model, candidate_model, images: List[str], conf: float = 0.25) -> dict:
+    """Roda FP32 e INT8 no corpus e retorna as métricas agregadas de desvio"""
+    stats = empty_drift_stats()
+    evaluated = 0
+    for path in images:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        ref = result_arrays(reference_model(image, conf=conf, verbose=False)[0])
+        cand = result_arrays(candidate_model(image, conf=conf, verbose=False)[0])
+        compare_results(ref, cand, stats)
+        evaluated += 1
+    return summarize_drift(stats, evaluated)
+
+
+def summarize_drift(stats: dict, evaluated: int) -> dict:
+    """Métricas agregadas a partir dos contadores de compare_results"""
+    matched = stats['matched']
+    return {
+        'images': evaluated,
+        'ref_boxes': stats['ref_boxes'],
+        'cand_boxes': stats['cand_boxes'],
+        'box_recall': round(matched / stats['ref_boxes'], 4) if stats['ref_boxes'] else 1.0,
+        'box_precision': round(matched / stats['cand_boxes'], 4) if stats['cand_boxes'] else 1.0,
+        'mean_iou': round(stats['iou_sum'] / matched, 4) if matched else (1.0 if not stats['ref_boxes'] else 0.0),
+        'class_agreement': round(stats['class_agree'] / matched, 4) if matched else (1.0 if not stats['ref_boxes'] else 0.0),
+        'keypoint_error': round(stats['kp_error_sum'] / stats['kp_count'], 4) if stats['kp_count'] else None
+    }
+
+
+def check_thresholds(metrics: dict, thresholds: dict) -> List[str]:
+    """Lista de violações dos limites de desvio (vazia = aprovado)"""
+    violations = []
+    if metrics['box_recall'] < thresholds['min_box_recall']:
+        violations.append(f"box_recall {metrics['box_recall']} < {thresholds['min_box_recall']}")
+    if metrics['mean_iou'] < thresholds['min_mean_iou']:
+        violations.append(f"mean_iou {metrics['mean_iou']} < {thresholds['min_mean_iou']}")
+    if metrics['class_agreement'] < thresholds['min_class_agreement']:
+        violations.append(f"class_agreement {metrics['class_agreement']} < {thresholds['min_class_agreement']}")
+    if metrics.get('keypoint_error') is not None and metrics['keypoint_error'] > thresholds['max_keypoint_error']:
+        violations.append(f"keypoint_error {metrics['keypoint_error']} > {thresholds['max_keypoint_error']}")
+    return violations
+
+
+def run_accuracy_guard(weights: str, artifact: str, corpus_dir: str, task: Optional[str] = None,
+                       thresholds: Optional[dict] = None, max_images: Optional[int] = None) -> dict:
+    """Compara o artefato INT8 com os pesos FP32 no corpus e grava <artefato>.guard.json"""
+    from ultralytics import YOLO
+
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    images = list_images(corpus_dir, max_images)
+    if not images:
+        raise ValueError(f"Corpus vazio: {corpus_dir}")
+
+    logger.info(f"🔍 Guard INT8: {artifact} vs {weights} em {len(images)} imagens")
+    start = time.time()
+    metrics = evaluate_drift(YOLO(weights), YOLO(artifact, task=task), images)
+    violations = check_thresholds(metrics, thresholds)
+
+    report = {
+        'artifact': artifact,
+        'reference': weights,
+        'fingerprint': artifact_fingerprint(artifact),
+        'corpus': os.path.abspath(corpus_dir),
+        'metrics': metrics,
+        'thresholds': thresholds,
+        'violations': violations,
+        'passed': not violations,
+        'elapsed_s': round(time.time() - start, 1),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    with open(guard_report_path(artifact), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    logger.info(f"{'✅' if report['passed'] else '⛔'} Guard INT8 {artifact}: {metrics} {violations or ''}")
+    return report
+
+
+def load_guard_report(artifact: str) -> Optional[dict]:
+    try:
+        with open(guard_report_path(artifact)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def guard_verdict(report: Optional[dict], artifact: str, thresholds: Optional[dict] = None) -> tuple:
+    """
+    Decide se o artefato INT8 pode ser ativado: exige relatório do guard para
+    esta versão do artefato e métricas dentro dos limites configurados agora.
+    Retorna (aprovado, motivo).
+    """
+    if report is None:
+        return False, 'sem relatório do guard de precisão'
+    if report.get('fingerprint') != artifact_fingerprint(artifact):
+        return False, 'relatório do guard desatualizado para este artefato'
+    violations = check_thresholds(report['metrics'], {**DEFAULT_THRESHOLDS, **(thresholds or {})})
+    if violations:
+        return False, '; '.join(violations)
+    return True, 'ok'
+
+
+# ==================== CLI ====================
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Quantização INT8 e guard de precisão dos modelos YOLO')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    quantize = sub.add_parser('quantize', help='Gerar artefato INT8 calibrado e rodar o guard')
+    quantize.add_argument('--weights', default=os.getenv('YOLO_MODEL', 'yolo26s.pt'), help='Pesos FP32 (.pt)')
+    quantize.add_argument('--calib-dir', required=True, help='Pasta com imagens de calibração')
+    quantize.add_argument('--backend', choices=['onnx', 'openvino'], default='openvino')
+    quantize.add_argument('--imgsz', type=int, default=640)
+    quantize.add_argument('--max-images', type=int, default=300, help='Máximo de imagens de calibração')
+    quantize.add_argument('--corpus', required=True,
+                          help='Corpus fixo do guard, separado da calibração (avaliar nas imagens calibradas superestima a precisão)')
+    quantize.add_argument('--guard-max-images', type=int, default=None, help='Máximo de imagens do corpus do guard')
+
+    guard = sub.add_parser('guard', help='Comparar um artefato INT8 existente com o FP32')
+    guard.add_argument('--weights', default=os.getenv('YOLO_MODEL', 'yolo26s.pt'), help='Pesos FP32 (.pt)')
+    guard.add_argument('--backend', choices=['onnx', 'openvino'], default='openvino')
+    guard.add_argument('--corpus', required=True, help='Pasta com o corpus fixo de imagens')
+    guard.add_argument('--max-images', type=int, default=None)
+
+    for command in (quantize, guard):
+        command.add_argument('--task', choices=['detect', 'pose'], default=None)
+        command.add_argument('--min-box-recall', type=float, default=DEFAULT_THRESHOLDS['min_box_recall'])
+        command.add_argument('--min-mean-iou', type=float, default=DEFAULT_THRESHOLDS['min_mean_iou'])
+        command.add_argument('--min-class-agreement', type=float, default=DEFAULT_THRESHOLDS['min_class_agreement'])
+        command.add_argument('--max-keypoint-error', type=float, default=DEFAULT_THRESHOLDS['max_keypoint_error'])
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    thresholds = {
+        'min_box_recall': args.min_box_recall,
+        'min_mean_iou': args.min_mean_iou,
+        'min_class_agreement': args.min_class_agreement,
+        'max_keypoint_error': args.max_keypoint_error,
+    }
+
+    if args.command == 'quantize':
+        if os.path.realpath(args.corpus) == os.path.realpath(args.calib_dir):
+            logger.warning("⚠️ Corpus do guard igual à pasta de calibração: o guard tende a aprovar o INT8")
+        calib_images = list_images(args.calib_dir, args.max_images)
+        if not calib_images:
+            print(f"❌ Nenhuma imagem em {args.calib_dir}")
+            return 1
+        if args.backend == 'onnx':
+            artifact = quantize_onnx(args.weights, calib_images, args.imgsz)
+        else:
+            artifact = quantize_openvino(args.weights, args.calib_dir, args.imgsz)
+        print(f"✅ Artefato INT8: {artifact}")
+        guard_max_images = args.guard_max_images
+    else:
+        artifact = int8_artifact(args.weights, args.backend)
+        if not os.path.exists(artifact):
+            print(f"❌ Artefato INT8 não encontrado: {artifact}")
+            return 1
+        guard_max_images = args.max_images
+
+    report = run_accuracy_guard(args.weights, artifact, args.corpus, args.task, thresholds, guard_max_images)
+    print(json.dumps(report['metrics'], indent=2))
+    if report['passed']:
+        print(f"✅ Aprovado - ative com INT8_MODELS (relatório: {guard_report_path(artifact)})")
+        return 0
+    print(f"⛔ Reprovado: {'; '.join(report['violations'])}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+"""
+Testes do serviço YOLO (pytest, a partir de yolo-service-v2/)
+Importam main.py sem carregar modelos: o carregamento só acontece no lifespan.
+"""
+
+import os
+import sys
+
+os.environ.setdefault('INFERENCE_BACKEND', 'pytorch')
+os.environ.setdefault('MODELS_RESIDENT', '')
+os.environ.setdefault('MODEL_SWAP_FILE', '')
+os.environ.setdefault('RESULT_CACHE_DIR', '')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,108 @@
+"""Backfill: falha de inferência interrompe sem gravar o lote nem avançar o checkpoint"""
+
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+import backfill
+import main
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    folder = tmp_path / 'images' / 'food-analysis'
+    folder.mkdir(parents=True)
+    for i in range(4):
+        image = np.full((64, 64, 3), i * 40, np.uint8)
+        (folder / f"{i:03d}.jpg").write_bytes(cv2.imencode('.jpg', image)[1].tobytes())
+    monkeypatch.setattr(main.models, 'require', lambda kind: object())
+    return tmp_path
+
+
+def run(corpus, batch_size=2):
+    output = corpus / 'out.jsonl'
+    checkpoint = backfill.Checkpoint(str(corpus / 'out.checkpoint.json'), {})
+    stats = backfill.run_backfill(
+        backfill.DirectorySource(str(corpus / 'images')), ['food-analysis'], backfill.JsonlWriter(str(output)),
+        checkpoint, batch_size=batch_size, prefetch=2, decode_workers=1
+    )
+    return stats, output, checkpoint
+
+
+def test_inference_failure_stops_without_advancing_checkpoint(corpus, monkeypatch):
+    calls = []
+    
+    def flaky_batch(images, confidences, max_detections, task, imgsz, raise_errors=False):
+        calls.append(len(images))
+        assert raise_errors
+        if len(calls) > 1:
+            raise RuntimeError('CUDA error')
+        return [([{'class_id': 0}], 5.0, {}) for _ in images]
+    
+    monkeypatch.setattr(main, 'detect_objects_batch', flaky_batch)
+    with pytest.raises(backfill.BackfillError, match='CUDA error'):
+        run(corpus)
+    
+    rows = [json.loads(line) for line in (corpus / 'out.jsonl').read_text().splitlines()]
+    assert [row['key'] for row in rows] == ['food-analysis/000.jpg', 'food-analysis/001.jpg']
+    assert all(row['error'] is None and row['total_objects'] == 1 for row in rows)
+    saved = json.loads((corpus / 'out.checkpoint.json').read_text())
+    assert saved['last_keys'] == {'food-analysis': 'food-analysis/001.jpg'}
+    assert saved['processed'] == 2
+    
+    # A retomada reprocessa o lote que falhou
+    monkeypatch.setattr(main, 'detect_objects_batch', lambda images, *args, **kwargs: [([], 5.0, {}) for _ in images])
+    stats, _, checkpoint = run(corpus)
+    assert stats['processed'] == 2
+    assert checkpoint.last_keys == {'food-analysis': 'food-analysis/003.jpg'}
+
+
+def test_detect_objects_batch_raises_when_requested(monkeypatch):
+    monkeypatch.setattr(main.models, 'get', lambda kind: None)
+    assert main.detect_objects_batch([object()], [0.5], [10]) == [([], 0, {})]
+    with pytest.raises(main.ModelUnavailableError):
+        main.detect_objects_batch([object()], [0.5], [10], raise_errors=True)
+
+
+def test_checkpoint_from_other_params_is_refused(tmp_path):
+    path = str(tmp_path / 'out.checkpoint.json')
+    checkpoint = backfill.Checkpoint(path, {'model': 'food.pt@aaa', 'imgsz': 640})
+    checkpoint.last_keys = {'food-analysis': 'food-analysis/001.jpg'}
+    checkpoint.save()
+    assert backfill.Checkpoint(path, {'model': 'food.pt@aaa', 'imgsz': 640}).last_keys
+    with pytest.raises(backfill.BackfillError, match='--restart'):
+        backfill.Checkpoint(path, {'model': 'food.pt@bbb', 'imgsz': 640})
+
+
+def run_cli(corpus, monkeypatch, version, *extra):
+    monkeypatch.setattr(main, 'weights_version', lambda path: version)
+    monkeypatch.setattr(main, 'detect_objects_batch', lambda images, *args, **kwargs: [([], 5.0, {}) for _ in images])
+    monkeypatch.setattr('sys.argv', [
+        'backfill.py', '--source', str(corpus / 'images'), '--prefixes', 'food-analysis',
+        '--output', str(corpus / 'out.jsonl'), '--prefetch', '2', '--decode-workers', '1', *extra
+    ])
+    return backfill.main()
+
+
+def output_rows(corpus):
+    return [json.loads(line) for line in (corpus / 'out.jsonl').read_text().splitlines()]
+
+
+def test_model_upgrade_requires_restart_and_restart_truncates(corpus, monkeypatch):
+    assert run_cli(corpus, monkeypatch, 'food.pt@aaa') == 0
+    assert len(output_rows(corpus)) == 4
+    
+    # Pesos novos: retomar pularia tudo e manteria só linhas do modelo antigo
+    assert run_cli(corpus, monkeypatch, 'food.pt@bbb') == 1
+    assert {row['model'] for row in output_rows(corpus)} == {main.detection_model_name('detect')}
+    
+    assert run_cli(corpus, monkeypatch, 'food.pt@bbb', '--restart') == 0
+    assert sorted(row['key'] for row in output_rows(corpus)) == [f"food-analysis/{i:03d}.jpg" for i in range(4)]
+
+
+def test_existing_output_without_checkpoint_is_refused(corpus, monkeypatch):
+    (corpus / 'out.jsonl').write_text('{"key": "old"}\n')
+    assert run_cli(corpus, monkeypatch, 'food.pt@aaa') == 1
+    assert output_rows(corpus) == [{'key': 'old'}]
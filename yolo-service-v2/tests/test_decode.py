@@ -0,0 +1,45 @@
+"""decode_image_bytes: decode reduzido e limite de pixels (inclusive no fallback via PIL)"""
+
+import io
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+import main
+from main import ImageTooLargeError, decode_image_bytes
+
+
+def gif(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, format='GIF')
+    return buffer.getvalue()
+
+
+def test_jpeg_is_decoded_reduced_within_budget(monkeypatch):
+    data = cv2.imencode('.jpg', np.zeros((1600, 2400, 3), np.uint8))[1].tobytes()
+    # 3,84 MP na resolução cheia, 240 mil pixels a 1/4: cabe no limite
+    monkeypatch.setattr(main, 'MAX_IMAGE_PIXELS', 300_000)
+    image = decode_image_bytes(data, target_size=600)
+    assert (image.width, image.height) == (600, 400)
+    assert (image.orig_width, image.orig_height) == (2400, 1600)
+
+
+@pytest.fixture
+def opencv_without_gif(monkeypatch):
+    # OpenCV recente já decodifica GIF; simula um build sem suporte para forçar o fallback
+    monkeypatch.setattr(main.cv2, 'imdecode', lambda buffer, flags: None)
+
+
+def test_pil_fallback_decodes_small_gif(opencv_without_gif):
+    image = decode_image_bytes(gif(64, 48), target_size=16)
+    assert (image.width, image.height) == (64, 48)
+    assert image.array[0, 0].tolist() == [30, 30, 200]  # BGR
+
+
+def test_pil_fallback_checks_full_resolution(monkeypatch, opencv_without_gif):
+    # Reduzido a 1/8 caberia (250x250), mas o PIL decodifica 2000x2000
+    monkeypatch.setattr(main, 'MAX_IMAGE_PIXELS', 100_000)
+    with pytest.raises(ImageTooLargeError, match='2000x2000'):
+        decode_image_bytes(gif(2000, 2000), target_size=200)
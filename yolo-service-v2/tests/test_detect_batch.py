@@ -0,0 +1,107 @@
+"""/detect/batch: admissão no pool por imagem, com 503 por linha quando o pool está cheio"""
+
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+
+import main
+
+
+@pytest.fixture
+def small_pool(monkeypatch):
+    pool = main.BoundedExecutor(max_workers=1, max_queue=1)
+    monkeypatch.setattr(main, 'inference_pool', pool)
+    return pool
+
+
+def post_batch(client, count):
+    images = [{'id': str(i), 'image_base64': base64.b64encode(b'img').decode()} for i in range(count)]
+    return client.post('/detect/batch', json={'images': images})
+
+
+def lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_items_are_admitted_per_image(small_pool, monkeypatch):
+    peak = []
+    
+    async def fake_detect(params, image_bytes, timing):
+        peak.append(small_pool.in_flight)
+        await asyncio.sleep(0.01)
+        return {'success': True, 'objects': []}
+    
+    monkeypatch.setattr(main, 'detect_image_bytes', fake_detect)
+    
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://t') as client:
+            return await post_batch(client, 6)
+    
+    response = asyncio.run(run())
+    assert response.status_code == 200
+    summary = lines(response)[-1]
+    # O lote limita as próprias imagens em andamento à capacidade do pool: não rejeita a si mesmo
+    assert summary['succeeded'] == 6
+    assert max(peak) <= small_pool.max_workers + small_pool.max_queue
+    assert small_pool.in_flight == 0
+
+
+def test_concurrent_batches_get_per_item_503(small_pool, monkeypatch):
+    release = asyncio.Event()
+    
+    async def fake_detect(params, image_bytes, timing):
+        await release.wait()
+        return {'success': True, 'objects': []}
+    
+    monkeypatch.setattr(main, 'detect_image_bytes', fake_detect)
+    
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://t') as client:
+            first = asyncio.create_task(post_batch(client, 2))
+            while small_pool.in_flight < 2:
+                await asyncio.sleep(0.01)
+            second = await post_batch(client, 2)
+            release.set()
+            return await first, second
+    
+    first, second = asyncio.run(run())
+    assert lines(first)[-1]['succeeded'] == 2
+    rejected = [line for line in lines(second) if 'index' in line]
+    assert {line['status_code'] for line in rejected} == {503}
+    assert all(line['retry_after'] == main.OVERLOAD_RETRY_AFTER_S for line in rejected)
+    assert small_pool.rejected == 2
+
+
+def test_item_errors_use_the_single_image_status_codes(small_pool, monkeypatch):
+    """Imagem grande demais = 413 e descartada por prazo = 504, como em /detect"""
+    import cv2
+    import numpy as np
+    
+    monkeypatch.setattr(main, 'MAX_IMAGE_PIXELS', 1000)
+    monkeypatch.setattr(main, 'result_cache', main.ResultCache(max_bytes=1 << 20, ttl_s=60))
+    png = cv2.imencode('.png', np.zeros((200, 200, 3), np.uint8))[1].tobytes()
+    real_detect = main.detect_image_bytes
+    
+    async def detect(params, image_bytes, timing):
+        if image_bytes == b'late':
+            raise main.DroppedRequestError('deadline')
+        return await real_detect(params, image_bytes, timing)
+    
+    monkeypatch.setattr(main, 'detect_image_bytes', detect)
+    images = [
+        {'id': 'big', 'image_base64': base64.b64encode(png).decode()},
+        {'id': 'late', 'image_base64': base64.b64encode(b'late').decode()},
+    ]
+    
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://t') as client:
+            return await client.post('/detect/batch', json={'images': images})
+    
+    rows = {line['id']: line for line in lines(asyncio.run(run())) if 'index' in line}
+    assert rows['big']['status_code'] == 413
+    assert '200x200' in rows['big']['error']
+    assert rows['late']['status_code'] == 504
+    assert rows['late']['reason'] == 'deadline' and rows['late']['dropped'] is True
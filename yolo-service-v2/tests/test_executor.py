@@ -0,0 +1,155 @@
+"""BoundedExecutor: admissão limitada, prioridade realtime × bulk e resize (inclusive nos lotes do MicroBatcher)"""
+
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import main
+from main import BoundedExecutor, QueueFullError
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condição não atingida"
+        time.sleep(0.005)
+
+
+def blocked_pool(**kwargs):
+    """Pool com a única thread presa num trabalho bulk até gate.set()"""
+    pool = BoundedExecutor(max_workers=1, max_queue=8, **kwargs)
+    gate = threading.Event()
+    pool.submit('bulk', gate.wait)
+    wait_until(lambda: pool._running['bulk'] == 1)
+    return pool, gate
+
+
+def test_admit_rejects_above_workers_plus_queue():
+    pool = BoundedExecutor(max_workers=2, max_queue=1)
+    with pool.admit(), pool.admit(), pool.admit():
+        assert pool.in_flight == 3
+        with pytest.raises(QueueFullError):
+            with pool.admit():
+                pass
+        assert pool.rejected == 1 and pool.rejected_by_class['bulk'] == 1
+    assert pool.in_flight == 0
+    with pool.admit():
+        assert pool.admitted == 4
+
+
+def test_realtime_admission_counts_only_realtime():
+    pool = BoundedExecutor(max_workers=1, max_queue=0)
+    with pool.admit('bulk'):
+        # Bulk cheia não bloqueia um frame de pose
+        with pool.admit('realtime'):
+            assert pool.in_flight == 2
+            # ...mas a bulk conta as realtime em andamento
+            with pytest.raises(QueueFullError):
+                with pool.admit('bulk'):
+                    pass
+            with pytest.raises(QueueFullError):
+                with pool.admit('realtime'):
+                    pass
+
+
+def test_strict_realtime_jumps_ahead_of_bulk():
+    pool, gate = blocked_pool(policy='strict')
+    order = []
+    jobs = [
+        pool.submit('bulk', lambda: order.append('bulk-1')),
+        pool.submit('bulk', lambda: order.append('bulk-2')),
+        pool.submit('realtime', lambda: order.append('realtime')),
+    ]
+    gate.set()
+    for job in jobs:
+        job.future.result(timeout=5)
+    assert order == ['realtime', 'bulk-1', 'bulk-2']
+    assert pool.jumped_bulk == 1
+
+
+def test_weighted_policy_does_not_starve_bulk():
+    pool, gate = blocked_pool(policy='weighted', weights={'realtime': 2, 'bulk': 1})
+    order = []
+    jobs = [pool.submit('realtime', lambda i=i: order.append('r')) for i in range(4)]
+    jobs += [pool.submit('bulk', lambda i=i: order.append('b')) for i in range(2)]
+    gate.set()
+    for job in jobs:
+        job.future.result(timeout=5)
+    assert order[:3].count('b') == 1
+    assert order.count('b') == 2
+
+
+def test_dropped_job_fails_with_reason():
+    pool, gate = blocked_pool()
+    job = pool.submit('bulk', lambda: 'never', guard=lambda: 'deadline')
+    gate.set()
+    with pytest.raises(main.DroppedRequestError):
+        job.future.result(timeout=5)
+    assert pool.dropped == {'deadline': 1}
+
+
+def test_resize_shrinks_and_grows_pool():
+    pool = BoundedExecutor(max_workers=3, max_queue=4)
+    pool.submit('bulk', lambda: None).future.result(timeout=5)
+    assert pool._threads == 3
+    
+    pool.resize(1)
+    wait_until(lambda: pool._threads == 1)
+    assert pool.submit('bulk', lambda: 42).future.result(timeout=5) == 42
+    
+    pool.resize(2)
+    assert pool._threads == 2
+    results = [pool.submit('bulk', lambda i=i: i) for i in range(4)]
+    assert [job.future.result(timeout=5) for job in results] == [0, 1, 2, 3]
+
+
+def test_micro_batcher_follows_pool_resize():
+    pool = BoundedExecutor(max_workers=1, max_queue=8)
+    gate = threading.Event()
+    running, peak = [0], [0]
+    lock = threading.Lock()
+    
+    def run_batch(payloads):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        gate.wait()
+        with lock:
+            running[0] -= 1
+        return payloads
+    
+    batcher = main.MicroBatcher('test', run_batch, window_ms=0, max_batch=1, executor=pool)
+    
+    async def scenario():
+        gate.set()
+        await batcher.submit('warmup')  # worker criado com o pool de 1 thread
+        gate.clear()
+        pool.resize(3)  # como o autotune_threads depois do startup
+        calls = asyncio.gather(*(batcher.submit(i) for i in range(3)))
+        for _ in range(500):
+            if peak[0] == 3:
+                break
+            await asyncio.sleep(0.01)
+        gate.set()
+        return await calls
+    
+    results = asyncio.run(scenario())
+    assert [result for result, _ in results] == [0, 1, 2]
+    assert peak[0] == 3
+
+
+def test_queue_full_maps_to_503_with_retry_after(monkeypatch):
+    pool = BoundedExecutor(max_workers=1, max_queue=0)
+    monkeypatch.setattr(main, 'inference_pool', pool)
+    
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url='http://t') as client:
+            with pool.admit():
+                return await client.post('/detect/raw', content=b'img', headers={'content-type': 'image/jpeg'})
+    
+    response = asyncio.run(run())
+    assert response.status_code == 503
+    assert response.headers['retry-after'] == str(main.OVERLOAD_RETRY_AFTER_S)
@@ -0,0 +1,103 @@
+"""Troca a quente: só trocas concluídas são publicadas em MODEL_SWAP_FILE"""
+
+import json
+
+import pytest
+
+import main
+
+
+class FakeModel:
+    names = {0: 'food'}
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """Registro novo com MODEL_SWAP_FILE temporário e carga de pesos simulada (missing.pt falha)"""
+    weights_dir = tmp_path / 'weights'
+    weights_dir.mkdir()
+    loads = []
+    
+    def fake_load(kind, warmup=True, on_warmup=None, weights=None):
+        loads.append((kind, weights))
+        if weights == 'missing.pt':
+            raise FileNotFoundError(weights)
+        path = weights_dir / weights.replace('/', '_')
+        path.write_bytes(weights.encode())
+        return FakeModel(), {'backend': 'pytorch', 'path': str(path)}
+    
+    monkeypatch.setattr(main, 'load_model_kind', fake_load)
+    monkeypatch.setattr(main, 'model_backends', {})
+    monkeypatch.setattr(main, 'MODEL_SWAP_FILE', str(tmp_path / 'model_versions.json'))
+    
+    def new_registry():
+        registry = main.ModelRegistry(main.MODEL_SPECS, resident=[])
+        monkeypatch.setattr(main, 'models', registry)
+        return registry
+    
+    registry = new_registry()
+    registry.loads_log = loads
+    registry.restart = new_registry
+    return registry
+
+
+def published(kind='detect'):
+    with open(main.MODEL_SWAP_FILE) as f:
+        return json.load(f)[kind]
+
+
+def test_successful_swap_is_published(registry):
+    registry.get('detect')
+    job = main.swap_and_publish('detect', 'swap', 'v2.pt', 'v2')
+    assert job['state'] == 'done'
+    assert published()['weights'] == 'v2.pt'
+    assert published()['revision'] == job['revision'] == registry.active['detect']['revision'] == 1
+    # O próprio worker não reaplica a troca que publicou
+    assert registry.apply_published(main.read_swap_state()) == []
+
+
+def test_failed_swap_keeps_published_state_and_restart_on_old_weights(registry):
+    registry.get('detect')
+    main.swap_and_publish('detect', 'swap', 'v2.pt', 'v2')
+    before = published()
+    
+    job = main.swap_and_publish('detect', 'swap', 'missing.pt')
+    assert job['state'] == 'failed'
+    assert published() == before
+    assert registry.weights_of('detect') == 'v2.pt'
+    
+    restarted = registry.restart()
+    restarted.apply_published(main.read_swap_state())
+    assert restarted.get('detect') is not None
+    assert restarted.weights_of('detect') == 'v2.pt'
+    assert restarted.states['detect'] == 'ready'
+
+
+def test_failed_swap_without_published_state_writes_nothing(registry):
+    registry.get('detect')
+    assert main.swap_and_publish('detect', 'swap', 'missing.pt')['state'] == 'failed'
+    assert main.read_swap_state() == {}
+    
+    restarted = registry.restart()
+    restarted.apply_published(main.read_swap_state())
+    assert restarted.weights_of('detect') == main.MODEL_SPECS['detect'][0]
+
+
+def test_rollback_is_published(registry):
+    registry.get('detect')
+    main.swap_and_publish('detect', 'swap', 'v2.pt', 'v2')
+    job = main.swap_and_publish('detect', 'rollback')
+    assert job['state'] == 'done'
+    assert published()['action'] == 'rollback'
+    assert published()['weights'] == main.MODEL_SPECS['detect'][0]
+    assert published()['revision'] == 2
+
+
+def test_adopted_weights_keep_previous_for_rollback(registry):
+    registry.get('detect')
+    main.swap_and_publish('detect', 'swap', 'v2.pt', 'v2')
+    
+    # Outro worker que ainda não carregou o modelo só adota os pesos publicados
+    other = registry.restart()
+    other.apply_published(main.read_swap_state())
+    assert other.previous['detect']['weights'] == main.MODEL_SPECS['detect'][0]
@@ -0,0 +1,94 @@
+"""Cache perceptual (dHash): quase duplicatas acertam com caixas reescaladas; imagens diferentes erram"""
+
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+import main
+from main import PerceptualCache, perceptual_hash, rescale_cached_items
+
+
+def scene(seed: int, width: int = 1200, height: int = 900) -> np.ndarray:
+    """Imagem suave (ruído de baixa resolução ampliado): dHash estável sob recompressão"""
+    rng = np.random.default_rng(seed)
+    return cv2.resize(rng.integers(0, 255, (6, 8, 3), dtype=np.uint8), (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+def jpeg(image: np.ndarray, quality: int = 95) -> bytes:
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+CACHED = [{'class_id': 1, 'bbox': [100.0, 50.0, 200.0, 100.0], 'area': 20000.0,
+           'mask': [[100.0, 50.0], [300.0, 150.0]]}]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = PerceptualCache(max_entries=100, max_distance=4, ttl_s=60)
+    monkeypatch.setattr(main, 'perceptual_cache', cache)
+    original = scene(1)
+    cache.put('ns', perceptual_hash(jpeg(original)), 1200, 900, CACHED)
+    return cache
+
+
+def lookup(data: bytes, width: int, height: int, namespace: str = 'ns'):
+    timing = {}
+    value, factors, _ = asyncio.run(main.lookup_near_duplicate(data, namespace, width, height, timing))
+    return value, factors, timing
+
+
+def test_recompressed_copy_hits(cache):
+    value, factors, timing = lookup(jpeg(scene(1), quality=40), 1200, 900)
+    assert value == CACHED
+    assert factors == (1.0, 1.0)
+    assert timing['phash_distance'] <= cache.max_distance
+
+
+def test_resized_copy_hits_with_rescaled_boxes(cache):
+    value, factors, _ = lookup(jpeg(cv2.resize(scene(1), (600, 450), interpolation=cv2.INTER_AREA), 70), 600, 450)
+    assert value == CACHED
+    assert factors == (0.5, 0.5)
+    rescaled = rescale_cached_items(value, *factors)
+    assert rescaled[0]['bbox'] == [50.0, 25.0, 100.0, 50.0]
+    assert rescaled[0]['area'] == 5000.0
+    assert rescaled[0]['mask'] == [[50.0, 25.0], [150.0, 75.0]]
+    assert CACHED[0]['bbox'] == [100.0, 50.0, 200.0, 100.0]  # O valor em cache não é alterado
+
+
+def test_different_image_misses(cache):
+    assert lookup(jpeg(scene(2)), 1200, 900)[0] is None
+
+
+def test_different_namespace_misses(cache):
+    assert lookup(jpeg(scene(1)), 1200, 900, namespace='other')[0] is None
+
+
+def test_different_aspect_ratio_misses(cache):
+    # Recorte (mesmo conteúdo, outra proporção) não reaproveita caixas
+    assert lookup(jpeg(scene(1)), 1200, 600)[0] is None
+
+
+def test_hamming_buckets_find_every_distance_up_to_max():
+    cache = PerceptualCache(max_entries=100, max_distance=4, ttl_s=60)
+    base = 0x0123456789ABCDEF
+    cache.put('ns', base, 100, 100, 'hit')
+    # Bits trocados espalhados por todos os blocos (inclusive nas fronteiras)
+    for bits in ([0], [63], [12, 13], [0, 20, 40, 63], [5, 17, 29, 41]):
+        flipped = base
+        for bit in bits:
+            flipped ^= 1 << bit
+        assert cache.get('ns', flipped, 100, 100)[0] == 'hit', bits
+    assert cache.get('ns', base ^ 0b11111, 100, 100) is None  # distância 5 > 4
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = PerceptualCache(max_entries=100, max_distance=4, ttl_s=10)
+    now = 1000.0
+    monkeypatch.setattr(main.time, 'time', lambda: now)
+    cache.put('ns', 42, 100, 100, 'value')
+    assert cache.get('ns', 42, 100, 100) is not None
+    now += 11
+    assert cache.get('ns', 42, 100, 100) is None
+    assert cache.stats()['entries'] == 0
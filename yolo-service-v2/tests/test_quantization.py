@@ -0,0 +1,63 @@
+"""quantization.py: fonte FP32 do ONNX compatível com o imgsz da calibração e guard num corpus próprio"""
+
+import pytest
+
+onnx = pytest.importorskip('onnx')
+from onnx import TensorProto, helper
+
+from quantization import onnx_source_mismatch
+
+
+def save_graph(path, shape, imgsz_metadata=None):
+    graph = helper.make_graph(
+        [helper.make_node('Identity', ['images'], ['output0'])], 'g',
+        [helper.make_tensor_value_info('images', TensorProto.FLOAT, shape)],
+        [helper.make_tensor_value_info('output0', TensorProto.FLOAT, shape)]
+    )
+    model = helper.make_model(graph)
+    if imgsz_metadata is not None:
+        helper.set_model_props(model, {'imgsz': imgsz_metadata})
+    onnx.save(model, str(path))
+    return str(path)
+
+
+def test_matching_static_export_is_reused(tmp_path):
+    assert onnx_source_mismatch(save_graph(tmp_path / 'm.onnx', [1, 3, 640, 640], '[640, 640]'), 640) is None
+
+
+def test_other_static_size_is_rejected(tmp_path):
+    assert 'entrada' in onnx_source_mismatch(save_graph(tmp_path / 'm.onnx', [1, 3, 320, 320], '[320, 320]'), 640)
+
+
+def test_dynamic_export_is_rejected(tmp_path):
+    path = save_graph(tmp_path / 'm.onnx', ['batch', 3, 'height', 'width'])
+    assert 'dinâmica' in onnx_source_mismatch(path, 640)
+
+
+def test_metadata_imgsz_mismatch_is_rejected(tmp_path):
+    path = save_graph(tmp_path / 'm.onnx', [1, 3, 640, 640], '[320, 320]')
+    assert 'metadado' in onnx_source_mismatch(path, 640)
+
+
+def test_quantize_guards_on_its_own_corpus_and_limit(tmp_path, monkeypatch):
+    import quantization
+    
+    calib, corpus = tmp_path / 'calib', tmp_path / 'corpus'
+    calib.mkdir()
+    corpus.mkdir()
+    for i in range(3):
+        (calib / f'{i}.jpg').write_bytes(b'')
+    guarded = {}
+    monkeypatch.setattr(quantization, 'quantize_onnx', lambda weights, images, imgsz: str(tmp_path / 'm.int8.onnx'))
+    monkeypatch.setattr(quantization, 'run_accuracy_guard', lambda weights, artifact, folder, task, thresholds, limit: (
+        guarded.update(folder=folder, limit=limit) or {'metrics': {}, 'passed': True, 'violations': []}
+    ))
+    argv = ['quantization.py', 'quantize', '--calib-dir', str(calib), '--backend', 'onnx', '--max-images', '2']
+    
+    monkeypatch.setattr('sys.argv', argv)
+    with pytest.raises(SystemExit):  # --corpus é obrigatório
+        quantization.main()
+    
+    monkeypatch.setattr('sys.argv', argv + ['--corpus', str(corpus), '--guard-max-images', '50'])
+    assert quantization.main() == 0
+    assert guarded == {'folder': str(corpus), 'limit': 50}
@@ -0,0 +1,81 @@
+"""Parâmetros dos endpoints /raw: query string e cabeçalhos X-* → modelo pydantic"""
+
+from typing import Annotated, List, Literal, Optional
+from urllib.parse import quote
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+from starlette.requests import Request
+
+import main
+from main import raw_request_params
+
+
+def make_request(query: str = '', headers: Optional[dict] = None) -> Request:
+    return Request({
+        'type': 'http', 'method': 'POST', 'path': '/', 'query_string': quote(query, safe='=&,').encode(),
+        'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    })
+
+
+def test_list_field_accepts_repeated_and_comma_separated_values():
+    params = raw_request_params(make_request('prompts=arroz,feijão&prompts=salada&confidence=0.4'),
+                                main.PromptDetectionRequest)
+    assert params.prompts == ['arroz', 'feijão', 'salada']
+    assert params.confidence == 0.4
+
+
+def test_optional_list_and_scalar_fields_from_headers():
+    params = raw_request_params(make_request(headers={'X-Fields': 'food_objects, total_food', 'X-Max-Detections': '7'}),
+                                main.DetectionRequest)
+    assert params.fields == ['food_objects', 'total_food']
+    assert params.max_detections == 7
+
+
+def test_dict_field_is_parsed_as_json():
+    params = raw_request_params(make_request('session_id=s1&calibration={"height_cm": 170}'), main.PoseAnalyzeRequest)
+    assert params.calibration == {'height_cm': 170}
+    with pytest.raises(HTTPException) as error:
+        raw_request_params(make_request('session_id=s1&calibration=nope'), main.PoseAnalyzeRequest)
+    assert error.value.status_code == 422
+
+
+class Params(BaseModel):
+    layout: Literal['List', 'grid'] = 'grid'
+    tags: Annotated[Optional[list[str]], Field(max_length=5)] = None
+    ids: Optional[List[int]] | None = None
+    mode: str = Field('fast', alias='processing-mode')
+
+
+def test_annotation_spelling_does_not_matter():
+    params = raw_request_params(make_request('layout=List&tags=a,b&ids=1&ids=2'), Params)
+    # Literal com "List" no texto continua escalar
+    assert params.layout == 'List'
+    assert params.tags == ['a', 'b']
+    assert params.ids == [1, 2]
+
+
+def test_alias_is_used_for_lookup():
+    assert raw_request_params(make_request('processing-mode=slow'), Params).mode == 'slow'
+    assert raw_request_params(make_request(headers={'X-Processing-Mode': 'slow'}), Params).mode == 'slow'
+
+
+def test_invalid_scalar_is_422():
+    with pytest.raises(HTTPException) as error:
+        raw_request_params(make_request('confidence=alta'), main.DetectionRequest)
+    assert error.value.status_code == 422
+
+
+@pytest.mark.parametrize('annotation, expected', [
+    (str, None),
+    (Optional[int], None),
+    (List[str], list),
+    (Optional[List[str]], list),
+    (list[str] | None, list),
+    (Optional[dict], dict),
+    (Literal['List'], None),
+    (main.ImgszParam, None),
+])
+def test_field_container(annotation, expected):
+    assert main.field_container(annotation) is expected
@@ -0,0 +1,118 @@
+"""Cache de resultados: LRU por bytes, TTL, nível em disco e composição da chave em run_detection"""
+
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+import main
+from main import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Relógio controlado para o TTL"""
+    now = [1000.0]
+    monkeypatch.setattr(main.time, 'time', lambda: now[0])
+    return now
+
+
+def test_lru_evicts_least_recent_by_bytes():
+    cache = ResultCache(max_bytes=60, ttl_s=60)
+    asyncio.run(cache.put('a', 'x' * 20))
+    asyncio.run(cache.put('b', 'y' * 20))
+    assert asyncio.run(cache.get('a')) is not None  # 'a' passa a ser a mais recente
+    asyncio.run(cache.put('c', 'z' * 20))
+    assert asyncio.run(cache.get('b')) is None
+    assert asyncio.run(cache.get('a')) is not None
+    assert asyncio.run(cache.get('c')) is not None
+    assert cache.evictions == 1
+
+
+def test_expired_entries_are_not_served(clock):
+    cache = ResultCache(max_bytes=1 << 20, ttl_s=10)
+    asyncio.run(cache.put('k', {'objects': []}))
+    clock[0] += 9
+    assert asyncio.run(cache.get('k')) == {'objects': []}
+    clock[0] += 2
+    assert asyncio.run(cache.get('k')) is None
+    assert cache.stats()['entries'] == 0 and cache.stats()['bytes'] == 0
+
+
+def test_disk_tier_is_shared_and_expires(tmp_path, clock):
+    writer = ResultCache(max_bytes=1 << 20, ttl_s=10, disk_dir=str(tmp_path))
+    asyncio.run(writer.put('k', {'objects': [1]}))
+    
+    # Outro worker (memória vazia) lê do disco
+    reader = ResultCache(max_bytes=1 << 20, ttl_s=10, disk_dir=str(tmp_path))
+    assert asyncio.run(reader.get('k')) == {'objects': [1]}
+    assert reader.hits_disk == 1
+    
+    clock[0] += 11
+    late = ResultCache(max_bytes=1 << 20, ttl_s=10, disk_dir=str(tmp_path))
+    assert asyncio.run(late.get('k')) is None
+    assert not list(tmp_path.rglob('*.json'))
+
+
+class FakeBatcher:
+    def __init__(self):
+        self.calls = []
+    
+    async def submit(self, item):
+        image, confidence, max_detections, imgsz = item
+        self.calls.append((confidence, max_detections, imgsz))
+        return ([{'bbox': [0, 0, 1, 1]}], 5.0, {}), {'queue_wait_ms': 0.0}
+
+
+@pytest.fixture
+def detection(monkeypatch):
+    """run_detection com inferência simulada; conta as execuções (cache miss)"""
+    batcher = FakeBatcher()
+    tiled = []
+    monkeypatch.setattr(main, 'detect_batchers', {task: batcher for task in ('detect', 'food_only', 'segment')})
+    monkeypatch.setattr(main, 'detect_objects_tiled', lambda *args: (tiled.append(args) or [], 5.0, 4))
+    monkeypatch.setattr(main, 'result_cache', ResultCache(max_bytes=1 << 20, ttl_s=60))
+    monkeypatch.setattr(main, 'perceptual_cache', main.PerceptualCache(max_entries=0, max_distance=4, ttl_s=60))
+    image = cv2.imencode('.jpg', np.full((480, 640, 3), 128, np.uint8))[1].tobytes()
+    
+    def run(**kwargs):
+        params = {'confidence': 0.35, 'imgsz': 640, **kwargs}
+        return asyncio.run(main.run_detection(image, timing={}, **params))[2]
+    
+    run.inferences = lambda: len(batcher.calls) + len(tiled)
+    return run
+
+
+def test_same_request_hits_exact_cache(detection):
+    assert detection() is None
+    assert detection() == 'exact'
+    assert detection.inferences() == 1
+
+
+@pytest.mark.parametrize('change', [
+    {'confidence': 0.5},
+    {'imgsz': 320},
+    {'max_detections': 10},
+    {'task': 'food_only'},
+    {'tiles': (640, 0.2, 4)},
+])
+def test_different_parameters_miss(detection, change):
+    assert detection() is None
+    assert detection(**change) is None
+    assert detection.inferences() == 2
+    assert detection(**change) == 'exact'
+
+
+def test_model_version_changes_key(detection, monkeypatch):
+    assert detection() is None
+    # Troca a quente: a versão ativa entra na chave
+    monkeypatch.setitem(main.models.active['detect'], 'label', 'food-v2')
+    assert detection() is None
+    assert detection.inferences() == 2
+
+
+def test_bypass_cache_always_runs(detection):
+    detection()
+    assert detection(bypass_cache=True) is None
+    assert detection.inferences() == 2
@@ -0,0 +1,80 @@
+"""Inferência em tiles: janelas e supressão entre tiles"""
+
+import numpy as np
+
+from main import DecodedImage, image_tile_windows, merge_tile_boxes, tile_windows
+
+
+def boxes(*rows):
+    """(x1, y1, x2, y2, confiança, classe)"""
+    return np.array(rows, dtype=np.float64)
+
+
+def covered(windows, width, height):
+    mask = np.zeros((height, width), dtype=bool)
+    for x0, y0, x1, y1 in windows:
+        mask[y0:y1, x0:x1] = True
+    return mask.all()
+
+
+def test_duplicates_in_overlap_strip_collapse():
+    # Mesmo objeto visto por dois tiles vizinhos, levemente deslocado
+    data = boxes((500, 100, 700, 300, 0.9, 3), (505, 102, 702, 298, 0.8, 3))
+    merged = merge_tile_boxes(data)
+    assert len(merged) == 1
+    assert merged[0, 4] == 0.9
+
+
+def test_fragment_cut_at_tile_border_is_dropped():
+    # Pedaço cortado na borda: IoU baixo com a caixa inteira, mas contido nela
+    data = boxes((400, 100, 800, 400, 0.9, 3), (600, 110, 640, 390, 0.6, 3))
+    assert len(merge_tile_boxes(data, ios_threshold=1.01)) == 2  # Só o IoU não suprime
+    merged = merge_tile_boxes(data)
+    assert merged.tolist() == [[400, 100, 800, 400, 0.9, 3]]
+
+
+def test_different_classes_are_kept():
+    data = boxes((500, 100, 700, 300, 0.9, 3), (505, 102, 702, 298, 0.8, 7))
+    assert len(merge_tile_boxes(data)) == 2
+
+
+def test_separate_objects_are_kept():
+    data = boxes((0, 0, 100, 100, 0.9, 3), (150, 0, 250, 100, 0.8, 3), (0, 150, 100, 250, 0.7, 3))
+    assert len(merge_tile_boxes(data)) == 3
+
+
+def test_merge_orders_by_confidence():
+    data = boxes((0, 0, 100, 100, 0.5, 1), (200, 0, 300, 100, 0.9, 1))
+    assert merge_tile_boxes(data)[:, 4].tolist() == [0.9, 0.5]
+
+
+def test_windows_overlap_and_cover_image():
+    windows = tile_windows(1500, 1000, 640, 0.2, 16)
+    assert covered(windows, 1500, 1000)
+    xs = sorted({x0 for x0, _, _, _ in windows})
+    assert xs[1] < 640  # Faixa de sobreposição entre vizinhos
+    # Última coluna/linha presa à borda, sem sair da imagem
+    assert max(x1 for _, _, x1, _ in windows) == 1500
+    assert max(y1 for _, _, _, y1 in windows) == 1000
+    assert all(x1 - x0 == 640 and y1 - y0 == 640 for x0, y0, x1, y1 in windows)
+
+
+def test_windows_grow_to_respect_max_tiles():
+    windows = tile_windows(4000, 3000, 640, 0.2, 4)
+    assert len(windows) <= 4
+    assert covered(windows, 4000, 3000)
+
+
+def test_small_image_is_single_window():
+    assert tile_windows(500, 400, 640, 0.2, 16) == [(0, 0, 500, 400)]
+
+
+def test_image_windows_add_full_image_pass_within_cap():
+    image = DecodedImage(np.zeros((1000, 1500, 3), np.uint8), 3000, 2000)
+    windows = image_tile_windows(image, 640, 0.2, 6)
+    assert len(windows) <= 6
+    assert windows[-1] == (0, 0, 1500, 1000)
+    assert covered(windows[:-1], 1500, 1000)
+    
+    small = DecodedImage(np.zeros((400, 500, 3), np.uint8), 500, 400)
+    assert image_tile_windows(small, 640, 0.2, 6) == [(0, 0, 500, 400)]
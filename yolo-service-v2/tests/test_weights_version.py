@@ -0,0 +1,47 @@
+"""weights_version: SHA-256 calculado uma vez por (caminho, tamanho, mtime)"""
+
+import hashlib
+import os
+
+import main
+from main import weights_version
+
+
+def test_digest_is_cached_until_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / 'food.pt'
+    path.write_bytes(b'v1' * 1000)
+    reads = []
+    real_sha256 = hashlib.sha256
+    monkeypatch.setattr(main.hashlib, 'sha256', lambda *args: reads.append(1) or real_sha256(*args))
+    
+    first = weights_version(str(path))
+    assert first == f"food.pt@{real_sha256(b'v1' * 1000).hexdigest()[:12]}"
+    assert weights_version(str(path)) == first
+    assert len(reads) == 1
+    
+    # Pesos sobrescritos no mesmo caminho: novo fingerprint, novo hash
+    path.write_bytes(b'v2' * 1001)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+    assert weights_version(str(path)) != first
+    assert len(reads) == 2
+
+
+def test_directories_and_hub_names(tmp_path):
+    exported = tmp_path / 'food_openvino_model'
+    exported.mkdir()
+    assert weights_version(str(exported)) == f"food_openvino_model@{int(os.path.getmtime(exported))}"
+    assert weights_version(str(tmp_path / 'yolo26s.pt')) == 'yolo26s.pt'
+
+
+def test_registry_version_is_content_hashed_before_load(tmp_path):
+    path = tmp_path / 'food.pt'
+    path.write_bytes(b'v1' * 1000)
+    registry = main.ModelRegistry({'food': (str(path), None)}, resident=[])
+    assert not registry.loaded('food')
+    before = registry.version_of('food')
+    assert before == weights_version(str(path)) and '@' in before
+    
+    # Pesos novos no mesmo caminho (ex.: restart com o cache em disco): outra chave
+    path.write_bytes(b'v2' * 1001)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+    assert registry.version_of('food') != before